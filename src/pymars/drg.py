@@ -1,14 +1,20 @@
 """Module containing Directed Relation Graph (DRG) reduction method."""
 
 import logging
-import os
+from heapq import heappush, heappop
 import networkx
 import numpy as np
-import cantera as ct
+import scipy.sparse
+from scipy.sparse import csgraph
 
 from . import soln2yaml
-from .sampling import sample, sample_metrics, calculate_error
-from .reduce_model import trim, ReducedModel
+from .sampling import sample, evaluate_error
+from .reduce_model import ReducedModel, ModelSpec
+from .reduce_model import threshold_breakpoints, bisect_threshold, get_rates_of_progress
+from .reduce_model import SPARSE_MIN_SPECIES, get_participation_matrices
+from .reduce_model import STATE_TOLERANCE
+from .reduce_model import scale_rows, remove_diagonal, deduplicate_states
+from .simulation import load_solution, copy_solution
 
 
 def create_drg_matrix(state, solution):
@@ -28,7 +34,48 @@ def create_drg_matrix(state, solution):
 
     """
     temp, pressure, mass_fractions = state
-    solution.TPY = temp, pressure, mass_fractions
+    return next(
+        create_drg_matrices(np.hstack(([temp, pressure], mass_fractions)), solution)
+    )
+
+
+def create_drg_matrices(sampled_data, solution, chunk_size=None, sparse=False):
+    """Creates DRG adjacency matrices for many states, evaluated in chunks
+
+    All states of a chunk are handled together, and only one chunk of matrices
+    is held in memory at a time. With ``sparse``, the matrices are built one
+    state at a time as sparse matrices, so that memory and work scale with the
+    number of nonzero coefficients rather than the square of the number of
+    species.
+
+    Parameters
+    ----------
+    sampled_data : numpy.ndarray
+        Sampled thermochemical states; each row holds temperature, pressure, and
+        species mass fractions
+    solution : cantera.Solution
+        Cantera object of the solution being analyzed
+    chunk_size : int, optional
+        Number of states evaluated together; by default, chosen to bound memory
+    sparse : bool, optional
+        If ``True``, produce ``scipy.sparse.csr_array`` matrices
+
+    Yields
+    ------
+    adjacency_matrix : numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrix based on calculated direct interaction coefficients,
+        for each state in turn
+
+    """
+    if sparse:
+        net_stoich, participation = get_participation_matrices(solution)
+        participation = participation.T.tocsr()
+        for rates in get_rates_of_progress(sampled_data, solution, chunk_size):
+            for state_rates in rates:
+                base_rates = abs(net_stoich @ scipy.sparse.diags_array(state_rates))
+                numerator = base_rates @ participation
+                yield remove_diagonal(scale_rows(numerator, base_rates.sum(axis=1)))
+        return
 
     net_stoich = solution.product_stoich_coeffs - solution.reactant_stoich_coeffs
     flags = np.where(
@@ -36,38 +83,28 @@ def create_drg_matrix(state, solution):
             (solution.product_stoich_coeffs != 0)
             | (solution.reactant_stoich_coeffs != 0)
         ),
-        1,
-        0,
+        1.0,
+        0.0,
     )
+    diagonal = np.arange(solution.n_species)
 
-    # only consider contributions from reactions with nonzero net rates of progress
-    valid_reactions = np.where(solution.net_rates_of_progress != 0)[0]
-    if valid_reactions.size:
-        base_rates = np.abs(
-            net_stoich[:, valid_reactions]
-            * solution.net_rates_of_progress[valid_reactions]
-        )
-        denominator = np.sum(base_rates, axis=1)[:, np.newaxis]
+    for rates in get_rates_of_progress(sampled_data, solution, chunk_size):
+        # reactions with zero net rates of progress contribute nothing
+        base_rates = np.abs(net_stoich * rates[:, np.newaxis, :])
+        denominator = np.sum(base_rates, axis=2)[:, :, np.newaxis]
 
-        numerator = np.zeros((solution.n_species, solution.n_species))
-        for sp_b in range(solution.n_species):
-            numerator[:, sp_b] += np.sum(
-                base_rates[:, np.where(flags[sp_b, valid_reactions])[0]], axis=1
-            )
-        # numerator = np.einsum('ij,kj->ik', base_rates, flags)
+        # numerator[A, B] sums the rates over reactions involving species B
+        numerator = base_rates @ flags.T
 
         # May get divide by zero if an inert species is present, and denominator
         # entry is zero.
         with np.errstate(divide="ignore", invalid="ignore"):
-            adjacency_matrix = np.where(denominator != 0, numerator / denominator, 0)
+            adjacency_matrices = np.where(denominator != 0, numerator / denominator, 0)
 
-    else:
-        adjacency_matrix = np.zeros((solution.n_species, solution.n_species))
-
-    # set diagonals to zero, to avoid self-directing graph edges
-    np.fill_diagonal(adjacency_matrix, 0.0)
+        # set diagonals to zero, to avoid self-directing graph edges
+        adjacency_matrices[:, diagonal, diagonal] = 0.0
 
-    return adjacency_matrix
+        yield from adjacency_matrices
 
 
 def graph_search(graph, target_species):
@@ -94,12 +131,40 @@ def graph_search(graph, target_species):
     return reached_species
 
 
+def reachable_species(adjacency, target_indices):
+    """Find the species reachable from the targets, by breadth-first search
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse.csr_array
+        Adjacency matrix of the graph, with edges from rows to columns
+    target_indices : list of int
+        Indices of the target species to search from
+
+    Returns
+    -------
+    reached : numpy.ndarray
+        Boolean mask of the species reached, including the targets
+
+    """
+    reached = np.zeros(adjacency.shape[0], dtype=bool)
+    for target in target_indices:
+        # anything reachable from a reached target has already been found
+        if not reached[target]:
+            reached[
+                csgraph.breadth_first_order(
+                    adjacency, target, directed=True, return_predecessors=False
+                )
+            ] = True
+    return reached
+
+
 def trim_drg(matrix, species_names, species_targets, threshold):
     """
 
     Parameters
     ----------
-    matrix : np.ndarray
+    matrix : numpy.ndarray or scipy.sparse.csr_array
         Adjacency matrix representing graph
     species_names : list of str
         List of all species names
@@ -114,20 +179,136 @@ def trim_drg(matrix, species_names, species_targets, threshold):
         Names of species reached in graph search
 
     """
-    name_mapping = {i: sp for i, sp in enumerate(species_names)}
-    graph = networkx.DiGraph(np.where(matrix >= threshold, matrix, 0.0))
-    networkx.relabel_nodes(graph, name_mapping, copy=False)
-    species_reached = graph_search(graph, species_targets)
+    if scipy.sparse.issparse(matrix):
+        adjacency = scipy.sparse.csr_array(matrix)
+        adjacency.data = adjacency.data >= threshold
+        adjacency.eliminate_zeros()
+    else:
+        adjacency = scipy.sparse.csr_array((matrix >= threshold) & (matrix != 0))
+
+    reached = reachable_species(
+        adjacency, [species_names.index(sp) for sp in species_targets]
+    )
+    return [sp for sp, is_reached in zip(species_names, reached) if is_reached]
+
+
+def best_path_search(matrix, target_indices, extend, start):
+    """Dijkstra-like search for the best path value to each species from the targets.
 
-    return species_reached
+    The value of a path follows from the value of the path to its last species
+    extended by the weight of the final edge, and extending a path must never
+    increase its value. The best (largest) value to every species is then found
+    by finishing species in order of decreasing value.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrix representing graph, with edges from rows to columns
+    target_indices : list of int
+        Indices of the target species to search from
+    extend : numpy.ufunc
+        Function of a path value and an edge weight giving the extended path
+        value, e.g. ``numpy.minimum`` or ``numpy.multiply``
+    start : float
+        Value of the (empty) path at the targets
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Best path value from any target to each species; zero for species not
+        reachable at all
+
+    """
+    values = np.zeros(matrix.shape[0])
+    values[target_indices] = start
+    finished = np.zeros(matrix.shape[0], dtype=bool)
+
+    if scipy.sparse.issparse(matrix):
+        # only visit the stored edges, keeping the species to finish in a heap
+        matrix = scipy.sparse.csr_array(matrix)
+        queue = [(-start, idx) for idx in set(target_indices)]
+        while queue:
+            value, node = heappop(queue)
+            if finished[node]:
+                continue
+            finished[node] = True
+
+            begin, end = matrix.indptr[node], matrix.indptr[node + 1]
+            neighbors = matrix.indices[begin:end]
+            candidates = extend(-value, matrix.data[begin:end])
+            improved = candidates > values[neighbors]
+            values[neighbors[improved]] = candidates[improved]
+            for neighbor, candidate in zip(neighbors[improved], candidates[improved]):
+                heappush(queue, (-candidate, neighbor))
+
+        return values
+
+    for _ in range(matrix.shape[0]):
+        node = np.argmax(np.where(finished, -1.0, values))
+        if finished[node] or values[node] <= 0.0:
+            break
+        finished[node] = True
+        np.maximum(values, extend(values[node], matrix[node]), out=values)
+
+    return values
+
+
+def graph_search_widest(matrix, target_indices):
+    """Find the widest (maximum bottleneck) path to each species from the targets.
+
+    The width of a path is its smallest edge weight, so a species is reachable
+    from the targets in the graph trimmed at some threshold exactly when the
+    width of its widest path is at least that threshold.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrix representing graph, with edges from rows to columns
+    target_indices : list of int
+        Indices of the target species to search from
+
+    Returns
+    -------
+    widths : numpy.ndarray
+        Width of the widest path from any target to each species; infinite for
+        the targets and zero for species not reachable at all
+
+    """
+    return best_path_search(matrix, target_indices, np.minimum, np.inf)
+
+
+def get_critical_thresholds(species_names, target_species, matrices):
+    """Calculate the largest threshold at which each species is retained.
+
+    Parameters
+    ----------
+    species_names : list of str
+        Species names
+    target_species : list of str
+        List of target species
+    matrices : iterable of numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrices for the sampled states, e.g. a list or a generator
+
+    Returns
+    -------
+    critical_thresholds : dict
+        Maximum over all sampled states of the widest path width to each species;
+        a species is retained for any threshold up to and including this value
+
+    """
+    target_indices = [species_names.index(sp) for sp in target_species]
+    widths = np.zeros(len(species_names))
+    for matrix in matrices:
+        np.maximum(widths, graph_search_widest(matrix, target_indices), out=widths)
+
+    return dict(zip(species_names, widths.tolist()))
 
 
 def reduce_drg(
     model_file,
-    species_targets,
     species_safe,
     threshold,
-    matrices,
+    critical_thresholds,
     ignition_conditions,
     sampled_metrics,
     psr_conditions=[],
@@ -138,21 +319,23 @@ def reduce_drg(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
+    cache=None,
+    error_limit=None,
 ):
-    """Given a threshold and DRG matrix, reduce the model and determine the error.
+    """Given a threshold and DRG critical thresholds, reduce the model and determine the error.
 
     Parameters
     ----------
     model_file : str
         Filename for model being reduced
-    species_targets : list of str
-        List of target species names
     species_safe : list of str
         List of species to always be retained
     threshold : float
         DRG threshold for trimming graph
-    matrices : list of numpy.ndarray
-        List of DRG adjacency matrices determined from thermochemical state data
+    critical_thresholds : dict
+        Dictionary with species and the largest threshold at which each is
+        retained, from :func:`get_critical_thresholds`.
     ignition_conditions : list of InputIgnition
         List of autoignition initial conditions.
     sampled_metrics: numpy.ndarray
@@ -173,6 +356,16 @@ def reduce_drg(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
+    error_limit : float, optional
+        Maximum allowable error level for reduced model. If given, the
+        simulations stop as soon as one case exceeds it, and the error reported
+        for such a model is the largest over the cases run.
 
     Returns
     -------
@@ -180,59 +373,51 @@ def reduce_drg(
         Return reduced model and associated metadata
 
     """
-    solution = ct.Solution(model_file, phase_name)
-
-    species_retained = []
-    for matrix in matrices:
-        species_retained += trim_drg(
-            matrix, solution.species_names, species_targets, threshold
-        )
-
-    # want to ensure retained species are the set of those reachable for each state
-    species_retained = list(set(species_retained))
-
-    if previous_model and len(species_retained) == previous_model.model.n_species:
-        return previous_model
-
+    solution = load_solution(model_file, phase_name)
     species_removed = [
         sp
         for sp in solution.species_names
-        if sp not in (species_retained + species_safe)
+        if critical_thresholds[sp] < threshold and sp not in species_safe
     ]
 
-    # Cut the exclusion list from the model.
-    reduced_model = trim(
-        model_file, species_removed, f"reduced_{model_file}", phase_name=phase_name
-    )
-    reduced_model_filename = soln2yaml.write(
-        reduced_model, f"reduced_{reduced_model.n_species}.yaml", path=path
-    )
+    if (
+        previous_model
+        and len(species_removed) == solution.n_species - previous_model.model.n_species
+    ):
+        return previous_model
+
+    # Cut the exclusion list from the model. The candidate is handed to the
+    # simulations as the list of species cut, and built from that in memory, so
+    # no model file is written until the reduction has finished.
+    model_spec = ModelSpec(model_file, tuple(species_removed))
+    reduced_model = load_solution(model_spec, phase_name)
 
-    reduced_model_metrics = sample_metrics(
-        reduced_model_filename,
+    error = evaluate_error(
+        model_spec,
+        sampled_metrics,
         ignition_conditions,
         psr_conditions=psr_conditions,
         flame_conditions=flame_conditions,
         min_flame_speed=min_flame_speed,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
         path=path,
+        cache=cache,
+        error_limit=error_limit,
     )
-    error = calculate_error(sampled_metrics, reduced_model_metrics)
 
     # If desired, now identify limbo species for future sensitivity analysis
     limbo_species = []
     if threshold_upper:
-        species_retained = []
-        for matrix in matrices:
-            species_retained += trim_drg(
-                matrix, solution.species_names, species_targets, threshold_upper
-            )
-        limbo_species = list(set(species_retained))
+        limbo_species = [
+            sp
+            for sp in solution.species_names
+            if critical_thresholds[sp] >= threshold_upper
+        ]
 
     return ReducedModel(
         model=reduced_model,
-        filename=reduced_model_filename,
         error=error,
         limbo_species=limbo_species,
     )
@@ -251,6 +436,10 @@ def run_drg(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
+    cache=None,
+    threshold_search="linear",
+    state_tolerance=STATE_TOLERANCE,
 ):
     """Main function for running DRG reduction.
 
@@ -281,6 +470,20 @@ def run_drg(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
+    threshold_search : {'linear', 'bisect'}, optional
+        How to search for the threshold: ``linear`` increases it in fixed steps,
+        while ``bisect`` bisects over the thresholds at which the set of
+        retained species changes.
+    state_tolerance : float, optional
+        Largest difference in log temperature, pressure, and mass fraction
+        between sampled states merged before building the interaction matrices;
+        see :func:`pymars.reduce_model.deduplicate_states`.
 
     Returns
     -------
@@ -288,7 +491,7 @@ def run_drg(
         Return reduced model and associated metadata
 
     """
-    solution = ct.Solution(model_file, phase_name)
+    solution = load_solution(model_file, phase_name)
 
     assert species_targets, "Need to specify at least one target species."
 
@@ -303,96 +506,146 @@ def run_drg(
         min_flame_speed=min_flame_speed,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
         path=path,
     )
 
-    matrices = []
-    for state in sampled_data:
-        matrices.append(create_drg_matrix((state[0], state[1], state[2:]), solution))
+    # Find the largest threshold at which each species is still reached from the
+    # targets, in any sampled state; this answers the graph search for every
+    # threshold value at once. The matrices are built a chunk of states at a
+    # time, and never all held in memory, for one state of each group of
+    # nearly identical sampled states.
+    critical_thresholds = get_critical_thresholds(
+        solution.species_names,
+        species_targets,
+        create_drg_matrices(
+            deduplicate_states(sampled_data, state_tolerance).data,
+            solution,
+            sparse=solution.n_species >= SPARSE_MIN_SPECIES,
+        ),
+    )
 
     # begin reduction iterations
     logging.info("Beginning DRG reduction loop")
     logging.info(45 * "-")
     logging.info("Threshold | Number of species | Max error (%)")
 
-    # start with detailed (starting) model
-    previous_model = ReducedModel(model=solution, filename=model_file, error=0.0)
-
-    first = True
-    error_current = 0.0
-    threshold = 0.01
-    threshold_increment = 0.01
-    while error_current <= error_limit:
-        reduced_model = reduce_drg(
-            model_file,
-            species_targets,
-            species_safe,
-            threshold,
-            matrices,
-            ignition_conditions,
-            sampled_metrics,
-            psr_conditions=psr_conditions,
-            flame_conditions=flame_conditions,
-            min_flame_speed=min_flame_speed,
-            phase_name=phase_name,
-            previous_model=previous_model,
-            threshold_upper=threshold_upper,
-            num_threads=num_threads,
-            path=path,
+    if threshold_search == "bisect":
+        # The retained species only change at the critical thresholds, so
+        # bisect over those rather than evaluating a reduced model at every
+        # fixed step.
+        breakpoints = threshold_breakpoints(critical_thresholds, species_safe)
+        threshold, reduced_model = bisect_threshold(
+            breakpoints,
+            lambda threshold: reduce_drg(
+                model_file,
+                species_safe,
+                threshold,
+                critical_thresholds,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                threshold_upper=threshold_upper,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            ),
+            error_limit,
+            ReducedModel(model=solution, filename=model_file, error=0.0),
         )
-        error_current = reduced_model.error
-        num_species = reduced_model.model.n_species
-
-        # reduce threshold if past error limit on first iteration
-        if first and error_current > error_limit:
-            error_current = 0.0
-            threshold /= 10
-            threshold_increment /= 10
-            if threshold <= 1e-5:
-                raise SystemExit(
-                    "Threshold value dropped below 1e-5 without producing viable reduced model"
-                )
-            logging.info("Threshold value too high, reducing by factor of 10")
-            continue
-
-        logging.info(f"{threshold:^9.2e} | {num_species:^17} | {error_current:^.2f}")
+    else:
+        # start with detailed (starting) model
+        previous_model = ReducedModel(model=solution, filename=model_file, error=0.0)
+
+        first = True
+        error_current = 0.0
+        threshold = 0.01
+        threshold_increment = 0.01
+        while error_current <= error_limit:
+            reduced_model = reduce_drg(
+                model_file,
+                species_safe,
+                threshold,
+                critical_thresholds,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                previous_model=previous_model,
+                threshold_upper=threshold_upper,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            )
+            error_current = reduced_model.error
+            num_species = reduced_model.model.n_species
+
+            # reduce threshold if past error limit on first iteration
+            if first and error_current > error_limit:
+                error_current = 0.0
+                threshold /= 10
+                threshold_increment /= 10
+                if threshold <= 1e-5:
+                    raise SystemExit(
+                        "Threshold value dropped below 1e-5 without producing viable reduced model"
+                    )
+                logging.info("Threshold value too high, reducing by factor of 10")
+                continue
+
+            logging.info(
+                f"{threshold:^9.2e} | {num_species:^17} | {error_current:^.2f}"
+            )
 
-        threshold += threshold_increment
-        first = False
+            threshold += threshold_increment
+            first = False
 
-        # cleanup files
-        if previous_model.model.n_species != reduced_model.model.n_species:
-            os.remove(reduced_model.filename)
+            previous_model = ReducedModel(
+                model=reduced_model.model,
+                filename=reduced_model.filename,
+                error=reduced_model.error,
+                limbo_species=reduced_model.limbo_species,
+            )
 
-        previous_model = ReducedModel(
-            model=reduced_model.model,
-            filename=reduced_model.filename,
-            error=reduced_model.error,
-            limbo_species=reduced_model.limbo_species,
-        )
+        if error_current > error_limit:
+            threshold -= 2 * threshold_increment
+            reduced_model = reduce_drg(
+                model_file,
+                species_safe,
+                threshold,
+                critical_thresholds,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                threshold_upper=threshold_upper,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            )
 
-    if error_current > error_limit:
-        threshold -= 2 * threshold_increment
-        reduced_model = reduce_drg(
-            model_file,
-            species_targets,
-            species_safe,
-            threshold,
-            matrices,
-            ignition_conditions,
-            sampled_metrics,
-            psr_conditions=psr_conditions,
-            flame_conditions=flame_conditions,
-            min_flame_speed=min_flame_speed,
-            phase_name=phase_name,
-            threshold_upper=threshold_upper,
-            num_threads=num_threads,
+    # Write the final model; candidate models are never written to disk. The
+    # model handed back is a copy, not the object shared through the model cache.
+    reduced_model = reduced_model._replace(
+        model=copy_solution(reduced_model.model),
+        filename=soln2yaml.write(
+            reduced_model.model,
+            f"reduced_{reduced_model.model.n_species}.yaml",
             path=path,
-        )
-    else:
-        soln2yaml.write(
-            reduced_model, f"reduced_{reduced_model.model.n_species}.yaml", path=path
-        )
+        ),
+    )
 
     logging.info(45 * "-")
     logging.info("DRG reduction complete.")
@@ -1,17 +1,21 @@
 """Module containing Directed Relation Graph with Error Propagation (DRGEP) reduction method."""
 
-import os
 import logging
 from heapq import heappush, heappop
 from itertools import count
 
 import numpy as np
-import networkx
-import cantera as ct
+import scipy.sparse
 
 from . import soln2yaml
-from .sampling import sample, sample_metrics, calculate_error
-from .reduce_model import trim, ReducedModel
+from .sampling import sample, evaluate_error
+from .reduce_model import ReducedModel, ModelSpec
+from .reduce_model import threshold_breakpoints, bisect_threshold, get_rates_of_progress
+from .reduce_model import SPARSE_MIN_SPECIES, get_participation_matrices
+from .reduce_model import STATE_TOLERANCE
+from .reduce_model import scale_rows, remove_diagonal, deduplicate_states
+from .simulation import load_solution, copy_solution
+from .drg import best_path_search
 
 
 def mod_dijkstra(
@@ -175,7 +179,52 @@ def create_drgep_matrix(state, solution):
 
     """
     temp, pressure, mass_fractions = state
-    solution.TPY = temp, pressure, mass_fractions
+    return next(
+        create_drgep_matrices(np.hstack(([temp, pressure], mass_fractions)), solution)
+    )
+
+
+def create_drgep_matrices(sampled_data, solution, chunk_size=None, sparse=False):
+    """Creates DRGEP graph adjacency matrices for many states, evaluated in chunks
+
+    All states of a chunk are handled together, and only one chunk of matrices
+    is held in memory at a time. With ``sparse``, the matrices are built one
+    state at a time as sparse matrices, so that memory and work scale with the
+    number of nonzero coefficients rather than the square of the number of
+    species.
+
+    Parameters
+    ----------
+    sampled_data : numpy.ndarray
+        Sampled thermochemical states; each row holds temperature, pressure, and
+        species mass fractions
+    solution : cantera.Solution
+        Cantera object of the solution being analyzed
+    chunk_size : int, optional
+        Number of states evaluated together; by default, chosen to bound memory
+    sparse : bool, optional
+        If ``True``, produce ``scipy.sparse.csr_array`` matrices
+
+    Yields
+    ------
+    adjacency_matrix : numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrix based on calculated direct interaction coefficients,
+        for each state in turn
+
+    """
+    if sparse:
+        net_stoich, participation = get_participation_matrices(solution)
+        participation = participation.T.tocsr()
+        for rates in get_rates_of_progress(sampled_data, solution, chunk_size):
+            for state_rates in rates:
+                base_rates = net_stoich @ scipy.sparse.diags_array(state_rates)
+                denominator = np.maximum(
+                    base_rates.maximum(0.0).sum(axis=1),
+                    (-base_rates).maximum(0.0).sum(axis=1),
+                )
+                numerator = abs(base_rates @ participation)
+                yield remove_diagonal(scale_rows(numerator, denominator))
+        return
 
     net_stoich = solution.product_stoich_coeffs - solution.reactant_stoich_coeffs
     flags = np.where(
@@ -183,41 +232,31 @@ def create_drgep_matrix(state, solution):
             (solution.product_stoich_coeffs != 0)
             | (solution.reactant_stoich_coeffs != 0)
         ),
-        1,
-        0,
+        1.0,
+        0.0,
     )
+    diagonal = np.arange(solution.n_species)
 
-    # only consider contributions from reactions with nonzero net rates of progress
-    valid_reactions = np.where(solution.net_rates_of_progress != 0)[0]
-    if valid_reactions.size:
-        base_rates = (
-            net_stoich[:, valid_reactions]
-            * solution.net_rates_of_progress[valid_reactions]
-        )
+    for rates in get_rates_of_progress(sampled_data, solution, chunk_size):
+        # reactions with zero net rates of progress contribute nothing
+        base_rates = net_stoich * rates[:, np.newaxis, :]
 
-        denominator_dest = np.sum(np.maximum(0.0, -base_rates), axis=1)
-        denominator_prod = np.sum(np.maximum(0.0, base_rates), axis=1)
-        denominator = np.maximum(denominator_prod, denominator_dest)[:, np.newaxis]
+        denominator_dest = np.sum(np.maximum(0.0, -base_rates), axis=2)
+        denominator_prod = np.sum(np.maximum(0.0, base_rates), axis=2)
+        denominator = np.maximum(denominator_prod, denominator_dest)[:, :, np.newaxis]
 
-        numerator = np.zeros((solution.n_species, solution.n_species))
-        for sp_b in range(solution.n_species):
-            numerator[:, sp_b] += np.sum(
-                base_rates[:, np.where(flags[sp_b, valid_reactions])[0]], axis=1
-            )
-        numerator = np.abs(numerator)
+        # numerator[A, B] sums the rates over reactions involving species B
+        numerator = np.abs(base_rates @ flags.T)
 
         # May get divide by zero if an inert species is present, and denominator
         # entry is zero.
         with np.errstate(divide="ignore", invalid="ignore"):
-            adjacency_matrix = np.where(denominator != 0, numerator / denominator, 0)
-
-    else:
-        adjacency_matrix = np.zeros((solution.n_species, solution.n_species))
+            adjacency_matrices = np.where(denominator != 0, numerator / denominator, 0)
 
-    # set diagonals to zero, to avoid self-directing graph edges
-    np.fill_diagonal(adjacency_matrix, 0.0)
+        # set diagonals to zero, to avoid self-directing graph edges
+        adjacency_matrices[:, diagonal, diagonal] = 0.0
 
-    return adjacency_matrix
+        yield from adjacency_matrices
 
 
 def graph_search_drgep(graph, target_species):
@@ -250,6 +289,30 @@ def graph_search_drgep(graph, target_species):
     return overall_coefficients
 
 
+def graph_search_max_product(matrix, target_indices):
+    """Find the greatest path products to all species from any of the targets.
+
+    Equivalent to :func:`graph_search_drgep` for all targets at once, but
+    searching the adjacency matrix directly by species index.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrix representing graph, with edges from rows to columns and
+        all weights <= 1
+    target_indices : list of int
+        Indices of the target species to search from
+
+    Returns
+    -------
+    coefficients : numpy.ndarray
+        Overall interaction coefficients; maximum over all paths from all targets
+        to each species, with 1.0 for the targets
+
+    """
+    return best_path_search(matrix, target_indices, np.multiply, 1.0)
+
+
 def get_importance_coeffs(species_names, target_species, matrices):
     """Calculate importance coefficients for all species
 
@@ -259,8 +322,8 @@ def get_importance_coeffs(species_names, target_species, matrices):
         Species names
     target_species : list of str
         List of target species
-    matrices : list of numpy.ndarray
-        List of adjacency matrices
+    matrices : iterable of numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrices for the sampled states, e.g. a list or a generator
 
     Returns
     -------
@@ -268,19 +331,17 @@ def get_importance_coeffs(species_names, target_species, matrices):
         Maximum coefficients over all sampled states
 
     """
-    importance_coefficients = {sp: 0.0 for sp in species_names}
-    name_mapping = {i: sp for i, sp in enumerate(species_names)}
+    # search by integer index, only mapping to species names at the end
+    target_indices = [species_names.index(sp) for sp in target_species]
+    importance_coefficients = np.zeros(len(species_names))
     for matrix in matrices:
-        graph = networkx.DiGraph(matrix)
-        networkx.relabel_nodes(graph, name_mapping, copy=False)
-        coefficients = graph_search_drgep(graph, target_species)
-
-        importance_coefficients = {
-            sp: max(coefficients.get(sp, 0.0), importance_coefficients[sp])
-            for sp in importance_coefficients
-        }
+        np.maximum(
+            importance_coefficients,
+            graph_search_max_product(matrix, target_indices),
+            out=importance_coefficients,
+        )
 
-    return importance_coefficients
+    return dict(zip(species_names, importance_coefficients.tolist()))
 
 
 def reduce_drgep(
@@ -297,6 +358,9 @@ def reduce_drgep(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
+    cache=None,
+    error_limit=None,
 ):
     """Given a threshold and DRGEP coefficients, reduce the model and determine the error.
 
@@ -327,6 +391,16 @@ def reduce_drgep(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
+    error_limit : float, optional
+        Maximum allowable error level for reduced model. If given, the
+        simulations stop as soon as one case exceeds it, and the error reported
+        for such a model is the largest over the cases run.
 
     Returns
     -------
@@ -334,7 +408,7 @@ def reduce_drgep(
         Return reduced model and associated metadata
 
     """
-    solution = ct.Solution(model_file, phase_name)
+    solution = load_solution(model_file, phase_name)
     species_removed = [
         sp
         for sp in solution.species_names
@@ -347,29 +421,28 @@ def reduce_drgep(
     ):
         return previous_model
 
-    # Cut the exclusion list from the model.
-    reduced_model = trim(
-        model_file, species_removed, f"reduced_{model_file}", phase_name=phase_name
-    )
-    reduced_model_filename = soln2yaml.write(
-        reduced_model, f"reduced_{reduced_model.n_species}.yaml", path=path
-    )
+    # Cut the exclusion list from the model. The candidate is handed to the
+    # simulations as the list of species cut, and built from that in memory, so
+    # no model file is written until the reduction has finished.
+    model_spec = ModelSpec(model_file, tuple(species_removed))
+    reduced_model = load_solution(model_spec, phase_name)
 
-    reduced_model_metrics = sample_metrics(
-        reduced_model_filename,
+    error = evaluate_error(
+        model_spec,
+        sampled_metrics,
         ignition_conditions,
         psr_conditions=psr_conditions,
         flame_conditions=flame_conditions,
         min_flame_speed=min_flame_speed,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
         path=path,
+        cache=cache,
+        error_limit=error_limit,
     )
-    error = calculate_error(sampled_metrics, reduced_model_metrics)
 
-    return ReducedModel(
-        model=reduced_model, filename=reduced_model_filename, error=error
-    )
+    return ReducedModel(model=reduced_model, error=error)
 
 
 def run_drgep(
@@ -385,6 +458,10 @@ def run_drgep(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
+    cache=None,
+    threshold_search="linear",
+    state_tolerance=STATE_TOLERANCE,
 ):
     """Main function for running DRGEP reduction.
 
@@ -415,6 +492,20 @@ def run_drgep(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
+    threshold_search : {'linear', 'bisect'}, optional
+        How to search for the threshold: ``linear`` increases it in fixed steps,
+        while ``bisect`` bisects over the thresholds at which the set of
+        retained species changes.
+    state_tolerance : float, optional
+        Largest difference in log temperature, pressure, and mass fraction
+        between sampled states merged before building the interaction matrices;
+        see :func:`pymars.reduce_model.deduplicate_states`.
 
     Returns
     -------
@@ -422,7 +513,7 @@ def run_drgep(
         Return reduced model and associated metadata
 
     """
-    solution = ct.Solution(model_file, phase_name)
+    solution = load_solution(model_file, phase_name)
     assert species_targets, "Need to specify at least one target species."
 
     # first, sample thermochemical data and generate metrics for measuring error
@@ -436,17 +527,22 @@ def run_drgep(
         min_flame_speed=min_flame_speed,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
         path=path,
     )
 
-    matrices = []
-    for state in sampled_data:
-        matrices.append(create_drgep_matrix((state[0], state[1], state[2:]), solution))
-
     # For DRGEP, find the overall interaction coefficients for all species
-    # using the maximum over all the sampled states
+    # using the maximum over all the sampled states. The matrices are built a
+    # chunk of states at a time, and never all held in memory, for one state of
+    # each group of nearly identical sampled states.
     importance_coeffs = get_importance_coeffs(
-        solution.species_names, species_targets, matrices
+        solution.species_names,
+        species_targets,
+        create_drgep_matrices(
+            deduplicate_states(sampled_data, state_tolerance).data,
+            solution,
+            sparse=solution.n_species >= SPARSE_MIN_SPECIES,
+        ),
     )
 
     # begin reduction iterations
@@ -454,86 +550,125 @@ def run_drgep(
     logging.info(45 * "-")
     logging.info("Threshold | Number of species | Max error (%)")
 
-    # start with detailed (starting) model
-    previous_model = ReducedModel(model=solution, filename=model_file, error=0.0)
-
-    first = True
-    error_current = 0.0
-    threshold = 0.01
-    threshold_increment = 0.01
-    while error_current <= error_limit:
-        reduced_model = reduce_drgep(
-            model_file,
-            species_safe,
-            threshold,
-            importance_coeffs,
-            ignition_conditions,
-            sampled_metrics,
-            psr_conditions=psr_conditions,
-            flame_conditions=flame_conditions,
-            min_flame_speed=min_flame_speed,
-            phase_name=phase_name,
-            previous_model=previous_model,
-            num_threads=num_threads,
-            path=path,
+    if threshold_search == "bisect":
+        # The retained species only change at the importance coefficients, so
+        # bisect over those thresholds rather than evaluating a reduced model at
+        # every fixed step.
+        breakpoints = threshold_breakpoints(importance_coeffs, species_safe)
+        threshold, reduced_model = bisect_threshold(
+            breakpoints,
+            lambda threshold: reduce_drgep(
+                model_file,
+                species_safe,
+                threshold,
+                importance_coeffs,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            ),
+            error_limit,
+            ReducedModel(model=solution, filename=model_file, error=0.0),
         )
-        error_current = reduced_model.error
-        num_species = reduced_model.model.n_species
-
-        # reduce threshold if past error limit on first iteration
-        if first and error_current > error_limit:
-            error_current = 0.0
-            threshold /= 10
-            threshold_increment /= 10
-            if threshold <= 1e-6:
-                raise SystemExit(
-                    "Threshold value dropped below 1e-6 without producing viable reduced model"
-                )
-            logging.info("Threshold value too high, reducing by factor of 10")
-            continue
-
-        logging.info(f"{threshold:^9.2e} | {num_species:^17} | {error_current:^.2f}")
+    else:
+        # start with detailed (starting) model
+        previous_model = ReducedModel(model=solution, filename=model_file, error=0.0)
+
+        first = True
+        error_current = 0.0
+        threshold = 0.01
+        threshold_increment = 0.01
+        while error_current <= error_limit:
+            reduced_model = reduce_drgep(
+                model_file,
+                species_safe,
+                threshold,
+                importance_coeffs,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                previous_model=previous_model,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            )
+            error_current = reduced_model.error
+            num_species = reduced_model.model.n_species
+
+            # reduce threshold if past error limit on first iteration
+            if first and error_current > error_limit:
+                error_current = 0.0
+                threshold /= 10
+                threshold_increment /= 10
+                if threshold <= 1e-6:
+                    raise SystemExit(
+                        "Threshold value dropped below 1e-6 without producing viable reduced model"
+                    )
+                logging.info("Threshold value too high, reducing by factor of 10")
+                continue
 
-        threshold += threshold_increment
-        first = False
+            logging.info(
+                f"{threshold:^9.2e} | {num_species:^17} | {error_current:^.2f}"
+            )
 
-        # cleanup files
-        if previous_model.model.n_species != reduced_model.model.n_species:
-            os.remove(reduced_model.filename)
+            threshold += threshold_increment
+            first = False
 
-        previous_model = ReducedModel(
-            model=reduced_model.model,
-            filename=reduced_model.filename,
-            error=reduced_model.error,
-            limbo_species=reduced_model.limbo_species,
-        )
+            previous_model = ReducedModel(
+                model=reduced_model.model,
+                filename=reduced_model.filename,
+                error=reduced_model.error,
+                limbo_species=reduced_model.limbo_species,
+            )
 
-    if reduced_model.error > error_limit:
-        threshold -= 2 * threshold_increment
-        reduced_model = reduce_drgep(
-            model_file,
-            species_safe,
-            threshold,
-            importance_coeffs,
-            ignition_conditions,
-            sampled_metrics,
-            psr_conditions=psr_conditions,
-            flame_conditions=flame_conditions,
-            min_flame_speed=min_flame_speed,
-            phase_name=phase_name,
-            num_threads=num_threads,
-            path=path,
-        )
-    else:
-        soln2yaml.write(
-            reduced_model, f"reduced_{reduced_model.model.n_species}.yaml", path=path
-        )
+        if reduced_model.error > error_limit:
+            threshold -= 2 * threshold_increment
+            reduced_model = reduce_drgep(
+                model_file,
+                species_safe,
+                threshold,
+                importance_coeffs,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            )
 
     if threshold_upper:
         for sp in reduced_model.model.species_names:
             if importance_coeffs[sp] < threshold_upper and (sp not in species_safe):
                 reduced_model.limbo_species.append(sp)
 
+    # Write the final model; candidate models are never written to disk. The
+    # model handed back is a copy, not the object shared through the model cache.
+    reduced_model = reduced_model._replace(
+        model=copy_solution(reduced_model.model),
+        filename=soln2yaml.write(
+            reduced_model.model,
+            f"reduced_{reduced_model.model.n_species}.yaml",
+            path=path,
+        ),
+    )
+
     logging.info(45 * "-")
     logging.info("DRGEP reduction complete.")
     logging.info(
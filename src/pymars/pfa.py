@@ -1,14 +1,19 @@
 """Module containing Path Flux Analysis (PFA) reduction method."""
 
 import logging
-import os
 import networkx
 import numpy as np
-import cantera as ct
+import scipy.sparse
 
 from . import soln2yaml
-from .sampling import sample, sample_metrics, calculate_error
-from .reduce_model import trim, ReducedModel
+from .sampling import sample, evaluate_error
+from .reduce_model import ReducedModel, ModelSpec
+from .reduce_model import threshold_breakpoints, bisect_threshold, get_rates_of_progress
+from .reduce_model import SPARSE_MIN_SPECIES, get_participation_matrices
+from .reduce_model import STATE_TOLERANCE
+from .reduce_model import scale_rows, remove_diagonal, deduplicate_states
+from .simulation import load_solution, copy_solution
+from .drg import get_critical_thresholds, trim_drg
 
 
 def create_pfa_matrix(state, solution):
@@ -28,7 +33,67 @@ def create_pfa_matrix(state, solution):
 
     """
     temp, pressure, mass_fractions = state
-    solution.TPY = temp, pressure, mass_fractions
+    return next(
+        create_pfa_matrices(np.hstack(([temp, pressure], mass_fractions)), solution)
+    )
+
+
+def create_pfa_matrices(sampled_data, solution, chunk_size=None, sparse=False):
+    """Creates PFA adjacency matrices for many states, evaluated in chunks
+
+    All states of a chunk are handled together, and only one chunk of matrices
+    is held in memory at a time. With ``sparse``, the matrices are instead built
+    one state at a time as sparse matrices, so that memory and work scale with
+    the number of nonzero coefficients rather than the square of the number of
+    species.
+
+    Parameters
+    ----------
+    sampled_data : numpy.ndarray
+        Sampled thermochemical states; each row holds temperature, pressure, and
+        species mass fractions
+    solution : cantera.Solution
+        Cantera object of the solution being analyzed
+    chunk_size : int, optional
+        Number of states evaluated together; by default, chosen to bound memory
+    sparse : bool, optional
+        If ``True``, produce ``scipy.sparse.csr_array`` matrices
+
+    Yields
+    ------
+    adjacency_matrix : numpy.ndarray or scipy.sparse.csr_array
+        Adjacency matrix based on calculated direct interaction coefficients,
+        for each state in turn
+
+    """
+    if sparse:
+        net_stoich, participation = get_participation_matrices(solution)
+        participation = participation.T.tocsr()
+        for rates in get_rates_of_progress(sampled_data, solution, chunk_size):
+            for state_rates in rates:
+                base_rates = net_stoich @ scipy.sparse.diags_array(state_rates)
+                production = base_rates.maximum(0.0)
+                consumption = (-base_rates).maximum(0.0)
+                denominator = np.maximum(
+                    production.sum(axis=1), consumption.sum(axis=1)
+                )
+
+                # first-generation coefficients, without self-directing entries
+                r_pro_AB1 = remove_diagonal(
+                    scale_rows(production @ participation, denominator)
+                )
+                r_con_AB1 = remove_diagonal(
+                    scale_rows(consumption @ participation, denominator)
+                )
+
+                # second-generation coefficients, through one intermediate species
+                yield remove_diagonal(
+                    r_pro_AB1
+                    + r_con_AB1
+                    + r_pro_AB1 @ r_pro_AB1
+                    + r_con_AB1 @ r_con_AB1
+                )
+        return
 
     net_stoich = solution.product_stoich_coeffs - solution.reactant_stoich_coeffs
     flags = np.where(
@@ -36,62 +101,44 @@ def create_pfa_matrix(state, solution):
             (solution.product_stoich_coeffs != 0)
             | (solution.reactant_stoich_coeffs != 0)
         ),
-        1,
-        0,
+        1.0,
+        0.0,
     )
+    diagonal = np.arange(solution.n_species)
+
+    for rates in get_rates_of_progress(sampled_data, solution, chunk_size):
+        # reactions with zero net rates of progress contribute nothing
+        base_rates = net_stoich * rates[:, np.newaxis, :]
+        production = np.maximum(base_rates, 0.0)
+        consumption = np.maximum(-base_rates, 0.0)
 
-    # only consider contributions from reactions with nonzero net rates of progress
-    valid_reactions = np.where(solution.net_rates_of_progress != 0)[0]
-    if valid_reactions.size:
-        base_rates = np.array(
-            net_stoich[:, valid_reactions]
-            * solution.net_rates_of_progress[valid_reactions]
-        )
-        production_A = np.sum(np.maximum(base_rates, 0), axis=1)
-        consumption_A = np.sum(np.maximum(-base_rates, 0), axis=1)
-        production_AB = np.zeros((solution.n_species, solution.n_species))
-        consumption_AB = np.zeros((solution.n_species, solution.n_species))
-        for sp_b in range(solution.n_species):
-            production_AB[:, sp_b] += np.sum(
-                np.maximum(base_rates[:, np.where(flags[sp_b, valid_reactions])[0]], 0),
-                axis=1,
-            )
-            consumption_AB[:, sp_b] += np.sum(
-                np.maximum(
-                    -base_rates[:, np.where(flags[sp_b, valid_reactions])[0]], 0
-                ),
-                axis=1,
-            )
         # May get divide by zero if an inert species is present, and denominator
         # entry is zero.
-        denominator = np.maximum(production_A, consumption_A)[:, np.newaxis]
+        denominator = np.maximum(
+            np.sum(production, axis=2), np.sum(consumption, axis=2)
+        )[:, :, np.newaxis]
         with np.errstate(divide="ignore", invalid="ignore"):
-            r_pro_AB1 = np.where(denominator != 0, production_AB / denominator, 0)
-        with np.errstate(divide="ignore", invalid="ignore"):
-            r_con_AB1 = np.where(denominator != 0, consumption_AB / denominator, 0)
-        # TODO: might be possible to replace this with an np.einsum() operation.
-        r_pro_AB2 = np.zeros((solution.n_species, solution.n_species))
-        r_con_AB2 = np.zeros((solution.n_species, solution.n_species))
-        for sp_m in range(solution.n_species):
-            pro1 = r_pro_AB1[:, sp_m]
-            pro2 = r_pro_AB1[sp_m, :]
-            con1 = r_con_AB1[:, sp_m]
-            con2 = r_con_AB1[sp_m, :]
-            pro1[sp_m] = 0
-            pro2[sp_m] = 0
-            con1[sp_m] = 0
-            con2[sp_m] = 0
-            r_pro_AB2 += np.outer(pro1, pro2)
-            r_con_AB2 += np.outer(con1, con2)
-
-        adjacency_matrix = r_pro_AB1 + r_con_AB1 + r_pro_AB2 + r_con_AB2
-    else:
-        adjacency_matrix = np.zeros((solution.n_species, solution.n_species))
+            r_pro_AB1 = np.where(
+                denominator != 0, production @ flags.T / denominator, 0
+            )
+            r_con_AB1 = np.where(
+                denominator != 0, consumption @ flags.T / denominator, 0
+            )
 
-    # set diagonals to zero, to avoid self-directing graph edges
-    np.fill_diagonal(adjacency_matrix, 0.0)
+        # The second-generation coefficients sum over the intermediate species M
+        # (distinct from A and B) of r_AM * r_MB; with the self-directing entries
+        # removed, that is the matrix product of the first-generation matrices.
+        r_pro_AB1[:, diagonal, diagonal] = 0.0
+        r_con_AB1[:, diagonal, diagonal] = 0.0
+        r_pro_AB2 = r_pro_AB1 @ r_pro_AB1
+        r_con_AB2 = r_con_AB1 @ r_con_AB1
 
-    return adjacency_matrix
+        adjacency_matrices = r_pro_AB1 + r_con_AB1 + r_pro_AB2 + r_con_AB2
+
+        # set diagonals to zero, to avoid self-directing graph edges
+        adjacency_matrices[:, diagonal, diagonal] = 0.0
+
+        yield from adjacency_matrices
 
 
 def graph_search(graph, target_species):
@@ -123,7 +170,7 @@ def trim_pfa(matrix, species_names, species_targets, threshold):
 
     Parameters
     ----------
-    matrix : np.ndarray
+    matrix : numpy.ndarray or scipy.sparse.csr_array
         Adjacency matrix representing graph
     species_names : list of str
         List of all species names
@@ -138,20 +185,15 @@ def trim_pfa(matrix, species_names, species_targets, threshold):
         Names of species reached in graph search
 
     """
-    name_mapping = {i: sp for i, sp in enumerate(species_names)}
-    graph = networkx.DiGraph(np.where(matrix >= threshold, matrix, 0.0))
-    networkx.relabel_nodes(graph, name_mapping, copy=False)
-    species_reached = graph_search(graph, species_targets)
-
-    return species_reached
+    # same search as DRG, on integer-indexed arrays
+    return trim_drg(matrix, species_names, species_targets, threshold)
 
 
 def reduce_pfa(
     model_file,
-    species_targets,
     species_safe,
     threshold,
-    matrices,
+    critical_thresholds,
     ignition_conditions,
     sampled_metrics,
     psr_conditions=[],
@@ -162,21 +204,23 @@ def reduce_pfa(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
+    cache=None,
+    error_limit=None,
 ):
-    """Given a threshold and PFA matrix, reduce the model and determine the error.
+    """Given a threshold and PFA critical thresholds, reduce the model and determine the error.
 
     Parameters
     ----------
     model_file : str
         Filename for model being reduced
-    species_targets : list of str
-        List of target species names
     species_safe : list of str
         List of species to always be retained
     threshold : float
         PFA threshold for trimming graph
-    matrices : list of numpy.ndarray
-        List of PFA adjacency matrices determined from thermochemical state data
+    critical_thresholds : dict
+        Dictionary with species and the largest threshold at which each is
+        retained, from :func:`~pymars.drg.get_critical_thresholds`.
     ignition_conditions : list of InputIgnition
         List of autoignition initial conditions.
     sampled_metrics: numpy.ndarray
@@ -197,6 +241,16 @@ def reduce_pfa(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
+    error_limit : float, optional
+        Maximum allowable error level for reduced model. If given, the
+        simulations stop as soon as one case exceeds it, and the error reported
+        for such a model is the largest over the cases run.
 
     Returns
     -------
@@ -204,61 +258,51 @@ def reduce_pfa(
         Return reduced model and associated metadata
 
     """
-    solution = ct.Solution(model_file, phase_name)
-
-    species_retained = []
-    for matrix in matrices:
-        species_retained += trim_pfa(
-            matrix, solution.species_names, species_targets, threshold
-        )
-
-    # want to ensure retained species are the set of those reachable for each state
-    species_retained = list(set(species_retained))
-
-    if previous_model and len(species_retained) == previous_model.model.n_species:
-        return previous_model
-
+    solution = load_solution(model_file, phase_name)
     species_removed = [
         sp
         for sp in solution.species_names
-        if sp not in (species_retained + species_safe)
+        if critical_thresholds[sp] < threshold and sp not in species_safe
     ]
 
-    # Cut the exclusion list from the model.
-    reduced_model = trim(
-        model_file, species_removed, f"reduced_{model_file}", phase_name=phase_name
-    )
-    reduced_model_filename = soln2yaml.write(
-        reduced_model, f"reduced_{reduced_model.n_species}.yaml", path=path
-    )
+    if (
+        previous_model
+        and len(species_removed) == solution.n_species - previous_model.model.n_species
+    ):
+        return previous_model
 
-    reduced_model_metrics = sample_metrics(
-        reduced_model_filename,
+    # Cut the exclusion list from the model. The candidate is handed to the
+    # simulations as the list of species cut, and built from that in memory, so
+    # no model file is written until the reduction has finished.
+    model_spec = ModelSpec(model_file, tuple(species_removed))
+    reduced_model = load_solution(model_spec, phase_name)
+
+    error = evaluate_error(
+        model_spec,
+        sampled_metrics,
         ignition_conditions,
         psr_conditions=psr_conditions,
         flame_conditions=flame_conditions,
         min_flame_speed=min_flame_speed,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
         path=path,
+        cache=cache,
+        error_limit=error_limit,
     )
-    error = calculate_error(sampled_metrics, reduced_model_metrics)
 
     # If desired, now identify limbo species for future sensitivity analysis
     limbo_species = []
     if threshold_upper:
-        species_retained += trim_pfa(
-            matrix, solution.species_names, species_targets, threshold_upper
-        )
         limbo_species = [
             sp
             for sp in solution.species_names
-            if sp not in (species_retained + species_safe + species_removed)
+            if critical_thresholds[sp] >= threshold_upper
         ]
 
     return ReducedModel(
         model=reduced_model,
-        filename=reduced_model_filename,
         error=error,
         limbo_species=limbo_species,
     )
@@ -277,6 +321,10 @@ def run_pfa(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
+    cache=None,
+    threshold_search="linear",
+    state_tolerance=STATE_TOLERANCE,
 ):
     """Main function for running PFA reduction.
 
@@ -307,6 +355,20 @@ def run_pfa(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
+    threshold_search : {'linear', 'bisect'}, optional
+        How to search for the threshold: ``linear`` increases it in fixed steps,
+        while ``bisect`` bisects over the thresholds at which the set of
+        retained species changes.
+    state_tolerance : float, optional
+        Largest difference in log temperature, pressure, and mass fraction
+        between sampled states merged before building the interaction matrices;
+        see :func:`pymars.reduce_model.deduplicate_states`.
 
     Returns
     -------
@@ -314,7 +376,7 @@ def run_pfa(
         Return reduced model and associated metadata
 
     """
-    solution = ct.Solution(model_file, phase_name)
+    solution = load_solution(model_file, phase_name)
 
     assert species_targets, "Need to specify at least one target species."
 
@@ -329,96 +391,146 @@ def run_pfa(
         min_flame_speed=min_flame_speed,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
         path=path,
     )
 
-    matrices = []
-    for state in sampled_data:
-        matrices.append(create_pfa_matrix((state[0], state[1], state[2:]), solution))
+    # Find the largest threshold at which each species is still reached from the
+    # targets, in any sampled state; this answers the graph search for every
+    # threshold value at once. The matrices are built a chunk of states at a
+    # time, and never all held in memory, for one state of each group of
+    # nearly identical sampled states.
+    critical_thresholds = get_critical_thresholds(
+        solution.species_names,
+        species_targets,
+        create_pfa_matrices(
+            deduplicate_states(sampled_data, state_tolerance).data,
+            solution,
+            sparse=solution.n_species >= SPARSE_MIN_SPECIES,
+        ),
+    )
 
     # begin reduction iterations
     logging.info("Beginning PFA reduction loop")
     logging.info(45 * "-")
     logging.info("Threshold | Number of species | Max error (%)")
 
-    # start with detailed (starting) model
-    previous_model = ReducedModel(model=solution, filename=model_file, error=0.0)
-
-    first = True
-    error_current = 0.0
-    threshold = 0.01
-    threshold_increment = 0.01
-    while error_current <= error_limit:
-        reduced_model = reduce_pfa(
-            model_file,
-            species_targets,
-            species_safe,
-            threshold,
-            matrices,
-            ignition_conditions,
-            sampled_metrics,
-            psr_conditions=psr_conditions,
-            flame_conditions=flame_conditions,
-            min_flame_speed=min_flame_speed,
-            phase_name=phase_name,
-            previous_model=previous_model,
-            threshold_upper=threshold_upper,
-            num_threads=num_threads,
-            path=path,
+    if threshold_search == "bisect":
+        # The retained species only change at the critical thresholds, so
+        # bisect over those rather than evaluating a reduced model at every
+        # fixed step.
+        breakpoints = threshold_breakpoints(critical_thresholds, species_safe)
+        threshold, reduced_model = bisect_threshold(
+            breakpoints,
+            lambda threshold: reduce_pfa(
+                model_file,
+                species_safe,
+                threshold,
+                critical_thresholds,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                threshold_upper=threshold_upper,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            ),
+            error_limit,
+            ReducedModel(model=solution, filename=model_file, error=0.0),
         )
-        error_current = reduced_model.error
-        num_species = reduced_model.model.n_species
-
-        # reduce threshold if past error limit on first iteration
-        if first and error_current > error_limit:
-            error_current = 0.0
-            threshold /= 10
-            threshold_increment /= 10
-            if threshold <= 1e-5:
-                raise SystemExit(
-                    "Threshold value dropped below 1e-5 without producing viable reduced model"
-                )
-            logging.info("Threshold value too high, reducing by factor of 10")
-            continue
-
-        logging.info(f"{threshold:^9.2e} | {num_species:^17} | {error_current:^.2f}")
+    else:
+        # start with detailed (starting) model
+        previous_model = ReducedModel(model=solution, filename=model_file, error=0.0)
+
+        first = True
+        error_current = 0.0
+        threshold = 0.01
+        threshold_increment = 0.01
+        while error_current <= error_limit:
+            reduced_model = reduce_pfa(
+                model_file,
+                species_safe,
+                threshold,
+                critical_thresholds,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                previous_model=previous_model,
+                threshold_upper=threshold_upper,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            )
+            error_current = reduced_model.error
+            num_species = reduced_model.model.n_species
+
+            # reduce threshold if past error limit on first iteration
+            if first and error_current > error_limit:
+                error_current = 0.0
+                threshold /= 10
+                threshold_increment /= 10
+                if threshold <= 1e-5:
+                    raise SystemExit(
+                        "Threshold value dropped below 1e-5 without producing viable reduced model"
+                    )
+                logging.info("Threshold value too high, reducing by factor of 10")
+                continue
+
+            logging.info(
+                f"{threshold:^9.2e} | {num_species:^17} | {error_current:^.2f}"
+            )
 
-        threshold += threshold_increment
-        first = False
+            threshold += threshold_increment
+            first = False
 
-        # cleanup files
-        if previous_model.model.n_species != reduced_model.model.n_species:
-            os.remove(reduced_model.filename)
+            previous_model = ReducedModel(
+                model=reduced_model.model,
+                filename=reduced_model.filename,
+                error=reduced_model.error,
+                limbo_species=reduced_model.limbo_species,
+            )
 
-        previous_model = ReducedModel(
-            model=reduced_model.model,
-            filename=reduced_model.filename,
-            error=reduced_model.error,
-            limbo_species=reduced_model.limbo_species,
-        )
+        if reduced_model.error > error_limit:
+            threshold -= 2 * threshold_increment
+            reduced_model = reduce_pfa(
+                model_file,
+                species_safe,
+                threshold,
+                critical_thresholds,
+                ignition_conditions,
+                sampled_metrics,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                threshold_upper=threshold_upper,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                error_limit=error_limit,
+                path=path,
+            )
 
-    if reduced_model.error > error_limit:
-        threshold -= 2 * threshold_increment
-        reduced_model = reduce_pfa(
-            model_file,
-            species_targets,
-            species_safe,
-            threshold,
-            matrices,
-            ignition_conditions,
-            sampled_metrics,
-            psr_conditions=psr_conditions,
-            flame_conditions=flame_conditions,
-            min_flame_speed=min_flame_speed,
-            phase_name=phase_name,
-            threshold_upper=threshold_upper,
-            num_threads=num_threads,
+    # Write the final model; candidate models are never written to disk. The
+    # model handed back is a copy, not the object shared through the model cache.
+    reduced_model = reduced_model._replace(
+        model=copy_solution(reduced_model.model),
+        filename=soln2yaml.write(
+            reduced_model.model,
+            f"reduced_{reduced_model.model.n_species}.yaml",
             path=path,
-        )
-    else:
-        soln2yaml.write(
-            reduced_model, f"reduced_{reduced_model.model.n_species}.yaml", path=path
-        )
+        ),
+    )
 
     logging.info(45 * "-")
     logging.info("PFA reduction complete.")
@@ -15,11 +15,14 @@ from .sampling import (
     parse_psr_inputs,
     parse_flame_inputs,
 )
-from .sampling import InputIgnition, InputPSR, InputLaminarFlame
+from .sampling import InputIgnition, InputPSR, InputLaminarFlame, WorkerPool
+from .sampling import EvaluationCache, data_files
 from .drgep import run_drgep
 from .drg import run_drg
 from .pfa import run_pfa
-from .sensitivity_analysis import run_sa
+from .sensitivity_analysis import run_sa, SENSITIVITY_TYPES
+from .reduce_model import THRESHOLD_SEARCHES, STATE_TOLERANCE, ModelSpec
+from .simulation import load_solution
 from .tools import convert
 
 #: Supported reduction methods
@@ -44,6 +47,10 @@ class ReductionInputs(NamedTuple):
     #: Minimum laminar flame speed (m/s) treated as a real flame; ``None`` uses
     #: the FlameSimulation default. See ``laminar-flame-conditions`` docs.
     min_flame_speed: float = None
+    #: Strategy for searching the threshold of graph-based methods
+    threshold_search: str = "linear"
+    #: Largest difference between sampled states merged by graph-based methods
+    state_tolerance: float = STATE_TOLERANCE
 
 
 def parse_inputs(input_dict):
@@ -88,6 +95,19 @@ def parse_inputs(input_dict):
         logging.info("Warning: using default upper threshold value (0.1)")
         upper_threshold = 0.1
     sensitivity_type = input_dict.get("sensitivity-type", "initial")
+    assert (
+        sensitivity_type in SENSITIVITY_TYPES
+    ), "Sensitivity type must be one of " + ", ".join(SENSITIVITY_TYPES)
+
+    threshold_search = input_dict.get("threshold-search", "linear")
+    assert (
+        threshold_search in THRESHOLD_SEARCHES
+    ), "Threshold search must be one of " + ", ".join(THRESHOLD_SEARCHES)
+
+    state_tolerance = input_dict.get("state-tolerance", STATE_TOLERANCE)
+    assert (
+        isinstance(state_tolerance, (int, float)) and state_tolerance >= 0
+    ), "State tolerance must be a nonnegative number"
 
     safe_species = input_dict.get("retained-species", [])
 
@@ -146,6 +166,8 @@ def parse_inputs(input_dict):
         sensitivity_type=sensitivity_type,
         phase_name=phase_name,
         min_flame_speed=min_flame_speed,
+        threshold_search=threshold_search,
+        state_tolerance=state_tolerance,
     )
 
 
@@ -165,6 +187,8 @@ def main(
     path="",
     num_threads=1,
     min_flame_speed=None,
+    threshold_search="linear",
+    state_tolerance=STATE_TOLERANCE,
 ):
     """Driver function for reducing a chemical kinetic model.
 
@@ -193,7 +217,7 @@ def main(
     upper_threshold : float, optional
         Upper threshold (epsilon^*) used to determine species for sensitivity analysis
         in combination with DRG or DRGEP method
-    sensitivity_type : {'initial', 'greedy'}, optional
+    sensitivity_type : {'initial', 'greedy', 'lazy-greedy', 'batch'}, optional
         Type of sensitivity analysis
     path : str
         Path to directory for writing files
@@ -201,7 +225,15 @@ def main(
         Number of CPU threads to use for performing simulations in parallel.
         Optional; default = 1, in which the multiprocessing module is not used.
         If 0, then use the available number of cores minus one. Otherwise,
-        use the specified number of threads.
+        use the specified number of threads. The worker processes are started
+        once and shared by all stages of the reduction.
+    min_flame_speed : float, optional
+        Minimum laminar flame speed (m/s) treated as a real flame.
+    threshold_search : {'linear', 'bisect'}, optional
+        Strategy for searching the threshold of the graph-based method.
+    state_tolerance : float, optional
+        Largest difference in log temperature, pressure, and mass fraction
+        between sampled states merged by the graph-based method.
 
     """
 
@@ -215,77 +247,108 @@ def main(
             "Either a graph-based method or sensitivity analysis (or both) must be specified."
         )
 
-    if method == "DRG":
-        reduced_model = run_drg(
-            model_file,
-            ignition_conditions,
-            psr_conditions,
-            flame_conditions,
-            error_limit,
-            target_species,
-            safe_species,
-            phase_name=phase_name,
-            threshold_upper=upper_threshold,
-            num_threads=num_threads,
-            path=path,
-            min_flame_speed=min_flame_speed,
-        )
-    elif method == "DRGEP":
-        reduced_model = run_drgep(
-            model_file,
-            ignition_conditions,
-            psr_conditions,
-            flame_conditions,
-            error_limit,
-            target_species,
-            safe_species,
-            phase_name=phase_name,
-            threshold_upper=upper_threshold,
-            num_threads=num_threads,
-            path=path,
-            min_flame_speed=min_flame_speed,
-        )
-    elif method == "PFA":
-        reduced_model = run_pfa(
-            model_file,
-            ignition_conditions,
-            psr_conditions,
-            flame_conditions,
-            error_limit,
-            target_species,
-            safe_species,
-            phase_name=phase_name,
-            num_threads=num_threads,
-            path=path,
-            min_flame_speed=min_flame_speed,
-        )
+    # Every reduced model evaluated is recorded, alongside the sampled data, so
+    # that no reduced model is simulated twice, in this run or a resumed one.
+    cache = EvaluationCache(data_files["evaluations"])
+
+    # A single worker pool serves every stage of the reduction, so the worker
+    # processes are started once rather than for every set of simulations.
+    with WorkerPool(num_threads) as pool:
+        if method == "DRG":
+            reduced_model = run_drg(
+                model_file,
+                ignition_conditions,
+                psr_conditions,
+                flame_conditions,
+                error_limit,
+                target_species,
+                safe_species,
+                phase_name=phase_name,
+                threshold_upper=upper_threshold,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                path=path,
+                min_flame_speed=min_flame_speed,
+                threshold_search=threshold_search,
+                state_tolerance=state_tolerance,
+            )
+        elif method == "DRGEP":
+            reduced_model = run_drgep(
+                model_file,
+                ignition_conditions,
+                psr_conditions,
+                flame_conditions,
+                error_limit,
+                target_species,
+                safe_species,
+                phase_name=phase_name,
+                threshold_upper=upper_threshold,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                path=path,
+                min_flame_speed=min_flame_speed,
+                threshold_search=threshold_search,
+                state_tolerance=state_tolerance,
+            )
+        elif method == "PFA":
+            reduced_model = run_pfa(
+                model_file,
+                ignition_conditions,
+                psr_conditions,
+                flame_conditions,
+                error_limit,
+                target_species,
+                safe_species,
+                phase_name=phase_name,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                path=path,
+                min_flame_speed=min_flame_speed,
+                threshold_search=threshold_search,
+                state_tolerance=state_tolerance,
+            )
 
-    error = 0.0
-    limbo_species = []
-    if method in ["DRG", "DRGEP", "PFA"]:
-        model_file = reduced_model.filename
-        error = reduced_model.error
-        limbo_species = reduced_model.limbo_species
-
-    if run_sensitivity_analysis:
-        if not sensitivity_type:
-            sensitivity_type = "greedy"
-
-        reduced_model = run_sa(
-            model_file,
-            error,
-            ignition_conditions,
-            psr_conditions,
-            flame_conditions,
-            error_limit,
-            target_species + safe_species,
-            phase_name=phase_name,
-            algorithm_type=sensitivity_type,
-            species_limbo=limbo_species,
-            num_threads=num_threads,
-            path=path,
-            min_flame_speed=min_flame_speed,
-        )
+        error = 0.0
+        limbo_species = []
+        if method in ["DRG", "DRGEP", "PFA"]:
+            # described by the species removed from the original model, so that
+            # sensitivity analysis shares evaluations with the graph-based stage
+            retained = set(reduced_model.model.species_names)
+            model_file = ModelSpec(
+                model_file,
+                tuple(
+                    sp
+                    for sp in load_solution(model_file, phase_name).species_names
+                    if sp not in retained
+                ),
+            )
+            error = reduced_model.error
+            limbo_species = reduced_model.limbo_species
+
+        if run_sensitivity_analysis:
+            if not sensitivity_type:
+                sensitivity_type = "greedy"
+
+            reduced_model = run_sa(
+                model_file,
+                error,
+                ignition_conditions,
+                psr_conditions,
+                flame_conditions,
+                error_limit,
+                target_species + safe_species,
+                phase_name=phase_name,
+                algorithm_type=sensitivity_type,
+                species_limbo=limbo_species,
+                num_threads=num_threads,
+                pool=pool,
+                cache=cache,
+                path=path,
+                min_flame_speed=min_flame_speed,
+            )
 
     return reduced_model
 
@@ -402,6 +465,8 @@ def pymars(argv):
             path=args.path,
             num_threads=args.num_threads,
             min_flame_speed=inputs.min_flame_speed,
+            threshold_search=inputs.threshold_search,
+            state_tolerance=inputs.state_tolerance,
         )
 
     logging.shutdown()
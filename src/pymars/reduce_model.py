@@ -1,10 +1,32 @@
 """Module for general model reduction class and function."""
 
 import os
+import logging
 from typing import NamedTuple
 
+import numpy as np
+import scipy.sparse
+import scipy.spatial
 import cantera as ct
 
+#: Supported strategies for searching the reduction threshold
+THRESHOLD_SEARCHES = ["linear", "bisect"]
+
+#: Approximate memory (bytes) of the per-state arrays held for a chunk of
+#: sampled states when building interaction matrices
+MATRIX_CHUNK_BYTES = 2**27
+
+#: Number of species from which the graph-based methods use sparse matrices
+SPARSE_MIN_SPECIES = 500
+
+#: Default largest difference in log temperature, pressure, and mass fraction
+#: between sampled states merged before building the interaction matrices
+STATE_TOLERANCE = 0.1
+
+#: Floor applied to sampled temperatures, pressures, and mass fractions before
+#: comparing their logarithms, below which differences in a value are ignored
+MASS_FRACTION_FLOOR = 1e-9
+
 
 class ReducedModel(NamedTuple):
     """Represents reduced model and associated metadata"""
@@ -15,19 +37,183 @@ class ReducedModel(NamedTuple):
     limbo_species: list = []
 
 
-def trim(initial_model_file, exclusion_list, new_model_file, phase_name=""):
+class ModelSpec(NamedTuple):
+    """Compact, picklable description of a model: a model file less some species.
+
+    Candidate reduced models are handed to the simulations in this form rather
+    than written to and re-read from a file. Wherever the model is needed, it is
+    built by trimming the (cached) source model; see
+    :func:`pymars.simulation.load_solution`. Only final models are written to disk.
+    """
+
+    source: str
+    exclusion_list: tuple = ()
+
+    def remove(self, species):
+        """Return the description of this model with ``species`` also removed.
+
+        Parameters
+        ----------
+        species : list of str
+            Names of the additional species to remove
+
+        Returns
+        -------
+        ModelSpec
+            Description of the further reduced model
+
+        """
+        return self._replace(exclusion_list=self.exclusion_list + tuple(species))
+
+
+class DeduplicatedStates(NamedTuple):
+    """Representative sampled states, and how far the others are from them"""
+
+    data: np.ndarray
+    representatives: np.ndarray
+    max_distance: float = 0.0
+
+
+class Trimmer:
+    """Removes species and their reactions from a model.
+
+    The species and reaction objects of the model, and which species take part
+    in each reaction (as reactant, product, explicit third body, or with a
+    third-body efficiency), are found once, so that trimming the model for any
+    exclusion list takes a few sparse matrix-vector products over the whole
+    mechanism rather than searches of species lists for every reaction.
+
+    Parameters
+    ----------
+    solution : cantera.Solution
+        Model to be reduced; it is left unchanged.
+
+    """
+
+    def __init__(self, solution):
+        self.solution = solution
+        self.species = solution.species()
+        self.reactions = solution.reactions()
+        self._species_index = {
+            name: idx for idx, name in enumerate(solution.species_names)
+        }
+
+        _, participation = get_participation_matrices(solution)
+        self._participation = participation.T.tocsr()
+
+        # the species a reaction has third-body efficiencies for, and the
+        # explicit third body (e.g. ``(+AR)``) of a reaction, if any
+        efficiency_rows = []
+        efficiency_cols = []
+        self._explicit_third_body = np.full(solution.n_reactions, -1)
+        for idx, reaction in enumerate(self.reactions):
+            tb = reaction.third_body
+            if tb is None:
+                continue
+            efficiency_species = [
+                self._species_index[sp]
+                for sp in tb.efficiencies
+                if sp in self._species_index
+            ]
+            efficiency_rows += [idx] * len(efficiency_species)
+            efficiency_cols += efficiency_species
+            if (
+                not tb.default_efficiency
+                and len(tb.efficiencies) == 1
+                and efficiency_species
+            ):
+                self._explicit_third_body[idx] = efficiency_species[0]
+        self._efficiencies = scipy.sparse.csr_array(
+            (np.ones(len(efficiency_rows)), (efficiency_rows, efficiency_cols)),
+            shape=(solution.n_reactions, solution.n_species),
+        )
+
+    def trim(self, exclusion_list, name=""):
+        """Build the model without the given species and their reactions.
+
+        Parameters
+        ----------
+        exclusion_list : list of str
+            List of species names that will be removed
+        name : str, optional
+            Name of the new model
+
+        Returns
+        -------
+        cantera.Solution
+            Model with species and associated reactions eliminated
+
+        """
+        removed = np.zeros(self.solution.n_species)
+        removed[
+            [
+                self._species_index[sp]
+                for sp in exclusion_list
+                if sp in self._species_index
+            ]
+        ] = 1.0
+
+        # Remove reactions that use eliminated species, and those with an
+        # explicit third body that has been removed
+        keep_reactions = self._participation @ removed == 0
+        explicit = self._explicit_third_body >= 0
+        explicit[explicit] = removed[self._explicit_third_body[explicit]] > 0
+        keep_reactions &= ~explicit
+
+        # remove any eliminated species from third-body efficiencies. The
+        # reaction objects are shared with the initial model, so modify a copy
+        # rather than the initial model's own reaction.
+        prune = keep_reactions & (self._efficiencies @ removed > 0)
+        final_reactions = []
+        for idx in np.flatnonzero(keep_reactions):
+            reaction = self.reactions[idx]
+            if prune[idx]:
+                efficiencies = reaction.third_body.efficiencies
+                reaction = ct.Reaction.from_dict(reaction.input_data, self.solution)
+                reaction.third_body.efficiencies = {
+                    sp: val
+                    for sp, val in efficiencies.items()
+                    if sp in self._species_index
+                    and not removed[self._species_index[sp]]
+                }
+            final_reactions.append(reaction)
+
+        final_species = [sp for sp, cut in zip(self.species, removed) if not cut]
+
+        # Create new solution based on remaining species and reactions. Preserve the
+        # original transport model so reduced models remain usable for transport-based
+        # simulations such as laminar flames.
+        new_solution = ct.Solution(
+            species=final_species,
+            reactions=final_reactions,
+            thermo="ideal-gas",
+            kinetics="bulk",
+            transport_model=self.solution.transport_model,
+        )
+        new_solution.TP = self.solution.TP
+        new_solution.name = name
+        return new_solution
+
+
+def trim(
+    initial_model_file, exclusion_list, new_model_file, phase_name="", trimmer=None
+):
     """Function to eliminate species and corresponding reactions from model
 
     Parameters
     ----------
-    initial_model_file : str
-        Filename for initial model to be reduced
+    initial_model_file : str or cantera.Solution
+        Filename for initial model to be reduced, or the already-loaded model.
+        A loaded model is left unchanged.
     exclusion_list : list of str
         List of species names that will be removed
     new_model_file : str
         Name of new reduced model file
     phase_name : str, optional
         Optional name for phase to load from CTI file (e.g., 'gas').
+    trimmer : Trimmer, optional
+        Trimmer already built for the initial model, used in place of
+        ``initial_model_file``
 
     Returns
     -------
@@ -35,51 +221,282 @@ def trim(initial_model_file, exclusion_list, new_model_file, phase_name=""):
         Model with species and associated reactions eliminated
 
     """
-    solution = ct.Solution(initial_model_file, phase_name)
-
-    # Remove species if in list to be removed
-    final_species = [sp for sp in solution.species() if sp.name not in exclusion_list]
-    final_species_names = [sp.name for sp in final_species]
-
-    # Remove reactions that use eliminated species
-    final_reactions = []
-    for reaction in solution.reactions():
-        tb = reaction.third_body
-        # remove reactions with an explicit third body that has been removed
-        if tb is not None and not tb.default_efficiency:
-            if (
-                len(tb.efficiencies) == 1
-                and list(tb.efficiencies.keys())[0] in exclusion_list
-            ):
-                continue
+    if trimmer is None:
+        if isinstance(initial_model_file, ct.Solution):
+            solution = initial_model_file
+        else:
+            solution = ct.Solution(initial_model_file, phase_name)
+        trimmer = Trimmer(solution)
+
+    if phase_name:
+        name = phase_name
+    else:
+        name = os.path.splitext(new_model_file)[0]
+    return trimmer.trim(exclusion_list, name)
+
+
+def get_participation_matrices(solution):
+    """Build sparse matrices of the species participating in each reaction.
+
+    Parameters
+    ----------
+    solution : cantera.Solution
+        Cantera object of the solution being analyzed
+
+    Returns
+    -------
+    net_stoich : scipy.sparse.csr_array
+        Net stoichiometric coefficients, with shape (species, reactions)
+    participation : scipy.sparse.csr_array
+        One where a species is a reactant or product of a reaction, with shape
+        (species, reactions)
+
+    """
+    products = scipy.sparse.csr_array(solution.product_stoich_coeffs)
+    reactants = scipy.sparse.csr_array(solution.reactant_stoich_coeffs)
+
+    net_stoich = products - reactants
+    participation = (products + reactants).sign()
+    return net_stoich, participation
+
+
+def scale_rows(matrix, denominator):
+    """Divide the rows of a sparse matrix, leaving rows with a zero divisor empty.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.csr_array
+        Matrix to scale
+    denominator : numpy.ndarray
+        Divisor for each row
+
+    Returns
+    -------
+    scipy.sparse.csr_array
+        Scaled matrix, without explicitly stored zeros
 
-        reaction_species = list(reaction.products.keys()) + list(
-            reaction.reactants.keys()
+    """
+    with np.errstate(divide="ignore"):
+        factors = np.where(denominator != 0, 1.0 / denominator, 0.0)
+    scaled = scipy.sparse.csr_array(scipy.sparse.diags_array(factors) @ matrix)
+    scaled.eliminate_zeros()
+    return scaled
+
+
+def remove_diagonal(matrix):
+    """Remove the diagonal entries (self-directing graph edges) of a sparse matrix.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.csr_array
+        Square sparse matrix
+
+    Returns
+    -------
+    scipy.sparse.csr_array
+        Matrix without diagonal entries or explicitly stored zeros
+
+    """
+    matrix = scipy.sparse.csr_array(
+        matrix - scipy.sparse.diags_array(matrix.diagonal())
+    )
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def get_rates_of_progress(sampled_data, solution, chunk_size=None):
+    """Evaluate the net rates of progress of sampled states, a chunk at a time.
+
+    Parameters
+    ----------
+    sampled_data : numpy.ndarray
+        Sampled thermochemical states; each row holds temperature, pressure, and
+        species mass fractions
+    solution : cantera.Solution
+        Cantera object of the solution being analyzed
+    chunk_size : int, optional
+        Number of states per chunk; by default, chosen so that arrays of
+        (species x max(species, reactions)) values for the chunk take about
+        ``MATRIX_CHUNK_BYTES``
+
+    Yields
+    ------
+    net_rates_of_progress : numpy.ndarray
+        Net rates of progress of the chunk of states, with shape
+        (states, reactions)
+
+    """
+    sampled_data = np.atleast_2d(sampled_data)
+    if chunk_size is None:
+        state_bytes = (
+            8 * solution.n_species * max(solution.n_species, solution.n_reactions)
         )
-        if all([sp in final_species_names for sp in reaction_species]):
-            # remove any eliminated species from third-body efficiencies
-            if tb is not None:
-                tb.efficiencies = {
-                    sp: val
-                    for sp, val in tb.efficiencies.items()
-                    if sp in final_species_names
-                }
-            final_reactions.append(reaction)
+        chunk_size = max(1, MATRIX_CHUNK_BYTES // state_bytes)
+
+    for start in range(0, sampled_data.shape[0], chunk_size):
+        chunk = sampled_data[start : start + chunk_size]
+        states = ct.SolutionArray(solution, shape=chunk.shape[0])
+        states.TPY = chunk[:, 0], chunk[:, 1], chunk[:, 2:]
+        yield states.net_rates_of_progress
+
+
+def deduplicate_states(sampled_data, tolerance=STATE_TOLERANCE, floor=None):
+    """Keep one representative of each group of nearly identical sampled states.
+
+    States are compared by the logarithms of their temperature, pressure, and
+    mass fractions, floored at ``floor``, so the tolerance is roughly the
+    largest relative change of any of them. The pairs of states within the
+    tolerance are found with a k-d tree; then each state, in order, is
+    represented by the nearest kept state within the tolerance, or is kept
+    itself if there is none.
+
+    The interaction coefficients of the graph-based methods are maxima over the
+    sampled states, so merging states can only lower them, and so only remove
+    species. The default tolerance merges states within about 10% of each other,
+    such as the points of one trajectory sampled by several cases or sample
+    placements. Near equilibrium, though, the coefficients can change much more
+    than the state, and the distance logged here bounds the change of the merged
+    states only, not of the coefficients or the retained species; reducing with
+    a tolerance of zero shows the effect on a given model.
+
+    Parameters
+    ----------
+    sampled_data : numpy.ndarray
+        Sampled thermochemical states; each row holds temperature, pressure, and
+        species mass fractions
+    tolerance : float, optional
+        Largest difference in log units between a state and its representative;
+        zero keeps every state
+    floor : float, optional
+        Floor for the values compared; by default ``MASS_FRACTION_FLOOR``
+
+    Returns
+    -------
+    DeduplicatedStates
+        Representative states in their original order, the index in those of
+        the representative of each state, and the largest difference in log
+        units between a state and its representative
 
-    # Create new solution based on remaining species and reactions. Preserve the
-    # original transport model so reduced models remain usable for transport-based
-    # simulations such as laminar flames.
-    new_solution = ct.Solution(
-        species=final_species,
-        reactions=final_reactions,
-        thermo="ideal-gas",
-        kinetics="bulk",
-        transport_model=solution.transport_model,
+    """
+    if floor is None:
+        floor = MASS_FRACTION_FLOOR
+
+    sampled_data = np.atleast_2d(sampled_data)
+    n_states = sampled_data.shape[0]
+    if tolerance <= 0 or n_states < 2:
+        return DeduplicatedStates(sampled_data, np.arange(n_states))
+
+    normalized = np.log(np.maximum(sampled_data, floor))
+    pairs = scipy.spatial.KDTree(normalized).query_pairs(
+        tolerance, p=np.inf, output_type="ndarray"
     )
-    new_solution.TP = solution.TP
-    if phase_name:
-        new_solution.name = phase_name
-    else:
-        new_solution.name = os.path.splitext(new_model_file)[0]
+    # neighbours of each state that come before it
+    earlier = scipy.sparse.csr_array(
+        (np.ones(len(pairs)), (pairs.max(axis=1), pairs.min(axis=1))),
+        shape=(n_states, n_states),
+    )
+
+    # states with no earlier neighbour are all kept; the others, in order, are
+    # kept only if none of their earlier neighbours is
+    followers = np.unique(pairs.max(axis=1))
+    kept = np.ones(n_states, dtype=bool)
+    kept[followers] = False
+    nearest = np.arange(n_states)
+    for idx in followers:
+        neighbours = earlier.indices[earlier.indptr[idx] : earlier.indptr[idx + 1]]
+        neighbours = neighbours[kept[neighbours]]
+        if neighbours.size:
+            distances = np.abs(normalized[neighbours] - normalized[idx]).max(axis=1)
+            nearest[idx] = neighbours[np.argmin(distances)]
+        else:
+            kept[idx] = True
+
+    representatives = np.cumsum(kept)[nearest] - 1
+    max_distance = float(np.abs(normalized - normalized[nearest]).max())
+    logging.info(
+        f"Analyzing {kept.sum()} of {n_states} sampled states; merged states differ "
+        f"by at most {max_distance:.2e} in log temperature, pressure, or mass fraction"
+    )
+    return DeduplicatedStates(sampled_data[kept], representatives, max_distance)
+
+
+def threshold_breakpoints(critical_values, species_safe=[]):
+    """Find the thresholds at which the set of retained species changes.
+
+    A species is retained up to and including its critical value (critical
+    threshold or importance coefficient), so the retained set changes exactly
+    at the distinct critical values of the species not always retained.
+
+    Parameters
+    ----------
+    critical_values : dict
+        Critical value of each species
+    species_safe : list of str, optional
+        Species always retained, whatever their critical values
+
+    Returns
+    -------
+    list of float
+        Sorted thresholds at which a species is removed, excluding those that
+        remove only unreachable (zero) or never removable (infinite) species
+
+    """
+    return sorted(
+        {
+            float(value)
+            for sp, value in critical_values.items()
+            if sp not in species_safe and 0.0 < value < np.inf
+        }
+    )
+
+
+def bisect_threshold(breakpoints, reduce, error_limit, starting_model):
+    """Bisect over threshold breakpoints for the most reduced acceptable model.
+
+    Assuming the error grows with the threshold, this finds the largest
+    breakpoint whose reduced model meets the error limit using O(log n)
+    model evaluations. If none does, the starting model is returned.
+
+    Parameters
+    ----------
+    breakpoints : list of float
+        Sorted thresholds at which the set of retained species changes
+    reduce : callable
+        Function returning the :class:`ReducedModel` for a given threshold
+    error_limit : float
+        Maximum allowable error level for reduced model
+    starting_model : ReducedModel
+        Unreduced model, returned (with a threshold of zero) if no breakpoint
+        gives an acceptable reduced model
+
+    Returns
+    -------
+    threshold : float
+        Largest threshold giving an acceptable reduced model
+    ReducedModel
+        Reduced model for that threshold
+
+    """
+    # The (unevaluated) lower end is the model retaining every species with a
+    # nonzero coefficient; the upper end is past the largest breakpoint.
+    low = -1
+    high = len(breakpoints)
+    best_model = None
+    while high - low > 1:
+        middle = (low + high) // 2
+        reduced_model = reduce(breakpoints[middle])
+        logging.info(
+            f"{breakpoints[middle]:^9.2e} | {reduced_model.model.n_species:^17} | "
+            f"{reduced_model.error:^.2f}"
+        )
+        if reduced_model.error <= error_limit:
+            low = middle
+            best_model = reduced_model
+        else:
+            high = middle
+
+    if best_model is None:
+        logging.info("No threshold value produced a viable reduced model")
+        return 0.0, starting_model
 
-    return new_solution
+    return breakpoints[low], best_model
@@ -1,14 +1,26 @@
 """Module for sampling thermochemical data and global metrics"""
 
 import os
+import json
+import time
+import queue
+import hashlib
+import itertools
 import multiprocessing
 import logging
 from typing import NamedTuple, Dict
 
 import numpy as np
-import cantera as ct
 
-from .simulation import IgnitionSimulation, PSRSimulation, FlameSimulation
+from .simulation import (
+    IgnitionSimulation,
+    PSRSimulation,
+    FlameSimulation,
+    load_solution,
+    SAMPLE_PLACEMENTS,
+    _model_digest,
+)
+from .reduce_model import ModelSpec
 
 data_files = {
     "data_ignition": "ignition_data.dat",
@@ -17,6 +29,7 @@ data_files = {
     "output_psr": "psr_output.txt",
     "data_flame": "laminarflame_data.dat",
     "output_flame": "laminarflame_output.txt",
+    "evaluations": "evaluations.jsonl",
 }
 
 
@@ -36,6 +49,9 @@ class InputIgnition(NamedTuple):
     reactants: Dict = {}
     composition_type: str = "mole"
 
+    sample_points: int = 20
+    sample_placement: str = "temperature"
+
 
 class InputPSR(NamedTuple):
     """Holds input parameters for a single perfectly stirred reactor (PSR) case.
@@ -71,15 +87,19 @@ class InputLaminarFlame(NamedTuple):
     reactants: Dict = {}
     composition_type: str = "mole"
 
+    sample_points: int = 20
+    sample_placement: str = "temperature"
+
 
 def ignition_sample_worker(sim_tuple):
     """Worker for multiprocessing of autoignition cases with data sampling.
 
     Runs, processes, and cleans up the case entirely within the worker, returning
     only the (picklable) metric and sampled data -- mirroring
-    ``flame_sample_worker``. The intermediate HDF5 file written by ``run_case`` is
-    read by ``process_results`` and removed by ``clean`` here, so the live
-    (unpicklable) reactor never needs to cross the process boundary.
+    ``flame_sample_worker``. The time history recorded by ``run_case`` is sampled
+    from memory by ``process_results``, and any archived HDF5 file is removed by
+    ``clean`` here, so the live (unpicklable) reactor never needs to cross the
+    process boundary.
 
     Parameters
     ----------
@@ -206,7 +226,144 @@ def psr_worker(sim_tuple):
     return {idx: metrics}
 
 
-def _run_workers(simulations, worker, num_threads):
+class WorkerPool:
+    """Long-lived pool of worker processes shared across a whole reduction run.
+
+    Starting a :class:`multiprocessing.Pool` costs a fork, module imports, and a
+    teardown. The graph-based methods and sensitivity analysis evaluate hundreds
+    of candidate models, so rather than paying that for every ``sample_metrics``
+    call, :func:`pymars.pymars.main` creates one ``WorkerPool`` and hands it to
+    each reduction stage. The worker processes are started lazily, on the first
+    parallel batch, and are reused until the pool is closed.
+
+    Parameters
+    ----------
+    num_threads : int, optional
+        Number of worker processes. Optional; default = 1, in which the
+        multiprocessing module is not used and jobs run serially in this process.
+        If 0, then use the available number of cores minus one.
+
+    Examples
+    --------
+    >>> with WorkerPool(4) as pool:
+    ...     metrics = sample_metrics('gri30.yaml', conditions, pool=pool)
+
+    """
+
+    def __init__(self, num_threads=1):
+        # If number of threads given as 0, use either max number of available
+        # cores minus 1, or use 1 if multiple cores not available.
+        if not num_threads:
+            num_threads = multiprocessing.cpu_count() - 1 or 1
+        self.num_threads = num_threads
+        self._pool = None
+
+    def map(self, worker, jobs):
+        """Apply ``worker`` to each job, returning the results in job order.
+
+        Parameters
+        ----------
+        worker : callable
+            Picklable (module-level) function applied to each job.
+        jobs : iterable
+            Jobs to pass to ``worker``.
+
+        Returns
+        -------
+        list
+            Results of ``worker`` for each job, in the order given.
+
+        """
+        jobs = tuple(jobs)
+        if self.num_threads == 1:
+            return [worker(job) for job in jobs]
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(processes=self.num_threads)
+        return self._pool.map(worker, jobs)
+
+    def imap_unordered(self, worker, jobs):
+        """Apply ``worker`` to each job, yielding the results as they finish.
+
+        Jobs are handed to the workers one at a time, only as workers become
+        free, so closing the generator early cancels every job not yet started.
+        Any jobs still running are left to finish and their results dropped, so
+        the worker processes, and the models they have cached, are kept for the
+        next batch.
+
+        Parameters
+        ----------
+        worker : callable
+            Picklable (module-level) function applied to each job.
+        jobs : iterable
+            Jobs to pass to ``worker``, started in the order given.
+
+        Yields
+        ------
+        object
+            Result of ``worker`` for each job, in the order the jobs finish.
+
+        """
+        jobs = iter(jobs)
+        if self.num_threads == 1:
+            for job in jobs:
+                yield worker(job)
+            return
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(processes=self.num_threads)
+
+        # results arrive through the callbacks, run by the pool's result thread
+        finished = queue.Queue()
+
+        def submit(job):
+            self._pool.apply_async(
+                worker,
+                (job,),
+                callback=lambda result: finished.put((True, result)),
+                error_callback=lambda error: finished.put((False, error)),
+            )
+
+        # If the generator is closed early, no further jobs are submitted; the
+        # results of those still running go to this call's queue and are dropped.
+        running = 0
+        for job in itertools.islice(jobs, self.num_threads):
+            submit(job)
+            running += 1
+        while running:
+            success, result = finished.get()
+            running -= 1
+            if not success:
+                raise result
+            for job in itertools.islice(jobs, 1):
+                submit(job)
+                running += 1
+            yield result
+
+    def close(self):
+        """Shut down the worker processes after their outstanding jobs finish."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        """Stop the worker processes immediately, discarding outstanding jobs."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        return False
+
+
+def _run_workers(simulations, worker, num_threads, pool=None):
     """Run ``worker`` over a list of job tuples and merge the per-case results.
 
     Parameters
@@ -216,7 +373,10 @@ def _run_workers(simulations, worker, num_threads):
     worker : callable
         Worker returning a ``{idx: result}`` dict for one job.
     num_threads : int
-        Number of processes to use; 1 runs serially.
+        Number of processes to use; 1 runs serially. Ignored if ``pool`` is given.
+    pool : WorkerPool, optional
+        Shared worker pool to run the jobs in; if not given, a pool is created
+        for this call only.
 
     Returns
     -------
@@ -224,61 +384,210 @@ def _run_workers(simulations, worker, num_threads):
         Merged ``{idx: result}`` mapping over all cases.
 
     """
-    jobs = tuple(simulations)
-    if num_threads == 1:
-        results = [worker(job) for job in jobs]
-    else:
-        pool = multiprocessing.Pool(processes=num_threads)
-        results = pool.map(worker, jobs)
-        pool.close()
-        pool.join()
+    if pool is None:
+        with WorkerPool(num_threads) as temp_pool:
+            return _run_workers(simulations, worker, num_threads, pool=temp_pool)
+
+    results = pool.map(worker, simulations)
     return {key: val for k in results for key, val in k.items()}
 
 
-def _run_sampling_jobs(simulations, worker, num_threads):
-    """Run data-sampling workers and collect their metrics and sampled data.
+# Wall-clock runtimes (s) of the cases run so far, keyed by the case conditions;
+# recorded by the baseline ``sample`` run and kept up to date by every later
+# evaluation, so that the longest cases can be started first.
+_case_runtimes = {}
+
 
-    For ``ignition_sample_worker`` / ``flame_sample_worker`` / ``psr_sample_worker``,
-    whose results are ``{idx: (metric, sampled_data)}``. The per-case metric may be
-    a scalar (ignition delay, flame speed) or a vector (the PSR metric triple); it
-    is flattened so each case contributes one or more entries, in case order.
+def _runtime_key(sim_tuple):
+    """Key of a case in ``_case_runtimes``: its kind and conditions."""
+    return repr(sim_tuple[0].properties)
+
+
+def case_worker(job):
+    """Worker running one case of any kind, timing it.
+
+    Parameters
+    ----------
+    job : tuple
+        Case number, the worker for the case, and the job tuple passed to that
+        worker
 
     Returns
     -------
-    metrics : numpy.ndarray
-        1-D array of the per-case global metrics, concatenated in case order.
-    data : numpy.ndarray
-        Stacked sampled-state rows from all cases.
+    tuple
+        Case number, the result of the worker for the case, and its runtime (s)
 
     """
-    results = _run_workers(simulations, worker, num_threads)
-    metrics = []
-    data = []
-    for idx in range(len(results)):
-        metric, case_data = results[idx]
-        metrics.append(np.atleast_1d(metric))
-        data += list(case_data)
-    metrics = np.concatenate(metrics) if metrics else np.array([])
-    return metrics, np.array(data)
+    case, worker, sim_tuple = job
+    start = time.perf_counter()
+    (result,) = worker(sim_tuple).values()
+    return case, result, time.perf_counter() - start
+
+
+def _longest_first(cases):
+    """Order cases by their recorded runtimes, longest first.
+
+    Runtimes are recorded by conditions alone, so the cases of several models
+    would otherwise be interleaved, and each worker would build every model in
+    turn for each condition, evicting them from the :func:`load_solution` cache
+    before their next case. The cases of each model are therefore kept
+    together: models are ordered by their longest case, and the cases of each
+    model longest first. Cases not run before count as longest, and ties keep
+    their given order.
+    """
+    expected = [_case_runtimes.get(_runtime_key(case[1]), np.inf) for case in cases]
+    models = [case[1][0].model for case in cases]
+    longest = {}
+    first = {}
+    for case, model in enumerate(models):
+        longest[model] = max(longest.get(model, -np.inf), expected[case])
+        first.setdefault(model, case)
+    return sorted(
+        range(len(cases)),
+        key=lambda case: (
+            -longest[models[case]],
+            first[models[case]],
+            -expected[case],
+        ),
+    )
+
+
+def _run_cases(cases, num_threads, pool=None):
+    """Run cases of any kind in a single queue, longest expected runtime first.
+
+    Cases are handed to the workers one at a time as they become free, so a
+    slow case does not hold up a whole batch, and cases of different kinds share
+    the workers without waiting on one another.
+
+    Parameters
+    ----------
+    cases : list of tuple
+        Worker and ``[sim, idx]`` job tuple of each case (further items ignored).
+    num_threads : int
+        Number of processes to use; 1 runs serially. Ignored if ``pool`` is given.
+    pool : WorkerPool, optional
+        Shared worker pool to run the jobs in; if not given, a pool is created
+        for this call only.
+
+    Returns
+    -------
+    list
+        Result of each case (the value of its worker's ``{idx: result}``), in
+        the order given.
 
+    """
+    if pool is None:
+        with WorkerPool(num_threads) as temp_pool:
+            return _run_cases(cases, num_threads, pool=temp_pool)
+
+    jobs = ((case, cases[case][0], cases[case][1]) for case in _longest_first(cases))
+    results = [None] * len(cases)
+    for case, result, runtime in pool.imap_unordered(case_worker, jobs):
+        results[case] = result
+        _case_runtimes[_runtime_key(cases[case][1])] = runtime
+    return results
 
-def _run_metric_jobs(simulations, worker, num_threads):
-    """Run metric-only workers and collect their per-case metrics.
 
-    For ``ignition_worker`` / ``flame_worker`` / ``psr_worker``, whose results are
-    ``{idx: metric}``. The per-case metric may be a scalar (ignition delay, flame
-    speed) or a vector (the PSR metric triple); it is flattened so each case
-    contributes one or more entries, in case order.
+def _simulation_cases(
+    model,
+    ignition_conditions,
+    psr_conditions=[],
+    flame_conditions=[],
+    phase_name="",
+    path="",
+    min_flame_speed=None,
+    sample_data=False,
+):
+    """List the jobs of all cases, in metric order.
+
+    Parameters
+    ----------
+    sample_data : bool, optional
+        If ``True``, use the workers that also sample thermochemical data;
+        otherwise the metric-only workers.
 
     Returns
     -------
-    numpy.ndarray
-        1-D array of the per-case global metrics, concatenated in case order.
+    list of tuple
+        Worker, ``[sim, idx]`` job tuple, and the slice of the combined metrics
+        filled by each case (ignition cases, then PSR cases, then flame cases)
 
     """
-    results = _run_workers(simulations, worker, num_threads)
-    metrics = [np.atleast_1d(results[idx]) for idx in range(len(results))]
-    return np.concatenate(metrics) if metrics else np.array([])
+    if sample_data:
+        workers = (ignition_sample_worker, psr_sample_worker, flame_sample_worker)
+    else:
+        workers = (ignition_worker, psr_worker, flame_worker)
+
+    cases = []
+    position = 0
+    for idx, case in enumerate(ignition_conditions):
+        sim = IgnitionSimulation(
+            idx, case, model, phase_name=phase_name, path=path, stream_samples=True
+        )
+        cases.append((workers[0], [sim, idx], slice(position, position + 1)))
+        position += 1
+    # each PSR case yields three metrics: extinction tau and two temperatures
+    for idx, case in enumerate(psr_conditions):
+        sim = PSRSimulation(idx, case, model, phase_name=phase_name, path=path)
+        cases.append((workers[1], [sim, idx], slice(position, position + 3)))
+        position += 3
+    for idx, case in enumerate(flame_conditions):
+        sim = FlameSimulation(
+            idx,
+            case,
+            model,
+            phase_name=phase_name,
+            path=path,
+            min_flame_speed=min_flame_speed,
+        )
+        cases.append((workers[2], [sim, idx], slice(position, position + 1)))
+        position += 1
+    return cases
+
+
+def _stream_error(cases, metrics_original, error_limit, order, pool):
+    """Run cases as a stream, stopping as soon as one exceeds the error limit.
+
+    Parameters
+    ----------
+    cases : list of tuple
+        Cases from :func:`_simulation_cases`
+    metrics_original : numpy.ndarray
+        Metrics serving as basis of error calculation
+    error_limit : float
+        Maximum allowable error level for reduced model
+    order : sequence of int
+        Order in which to start the cases
+    pool : WorkerPool
+        Worker pool for running the simulations
+
+    Returns
+    -------
+    metrics : numpy.ndarray
+        Metrics of the cases run; NaN for those cancelled
+    case_errors : numpy.ndarray
+        Error of each case run; NaN for those cancelled
+
+    """
+    metrics_original = np.asarray(metrics_original, dtype=float)
+    metrics = np.full(len(metrics_original), np.nan)
+    case_errors = np.full(len(cases), np.nan)
+    jobs = ((case, cases[case][0], cases[case][1]) for case in order)
+    results = pool.imap_unordered(case_worker, jobs)
+    try:
+        for case, metric, runtime in results:
+            _case_runtimes[_runtime_key(cases[case][1])] = runtime
+            positions = cases[case][2]
+            metrics[positions] = metric
+            case_errors[case] = calculate_error(
+                metrics_original[positions], metrics[positions]
+            )
+            if case_errors[case] > error_limit:
+                break
+    finally:
+        # cancels the cases not yet started; those running finish in the background
+        results.close()
+    return metrics, case_errors
 
 
 def calculate_error(metrics_original, metrics_test):
@@ -365,6 +674,7 @@ def sample_metrics(
     path="",
     reuse_saved=False,
     min_flame_speed=None,
+    pool=None,
 ):
     """Evaluates metrics used for determining error of reduced model
 
@@ -372,8 +682,9 @@ def sample_metrics(
 
     Parameters
     ----------
-    model : str
-        Filename for Cantera model for performing simulations
+    model : str or ModelSpec
+        Filename for Cantera model for performing simulations, or description of
+        an in-memory reduced model (built by each worker without any file I/O)
     ignition_conditions : list of InputIgnition
         List of autoignition initial conditions.
     psr_conditions : list of InputPSR, optional
@@ -391,6 +702,12 @@ def sample_metrics(
         Optional path for writing files
     reuse_saved : bool, optional
         Flag to reuse saved output
+    min_flame_speed : float, optional
+        Minimum laminar flame speed (m/s) treated as a real flame; ``None`` uses
+        the ``FlameSimulation`` default.
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for this call only.
 
     Returns
     -------
@@ -404,102 +721,495 @@ def sample_metrics(
     if not num_threads:
         num_threads = multiprocessing.cpu_count() - 1 or 1
 
-    ignition_delays = np.array([])
-    if ignition_conditions:
-        ignition_delays = np.zeros(len(ignition_conditions))
+    cases = _simulation_cases(
+        model,
+        ignition_conditions,
+        psr_conditions,
+        flame_conditions,
+        phase_name=phase_name,
+        path=path,
+        min_flame_speed=min_flame_speed,
+    )
 
-        exists_output = os.path.isfile(data_files["output_ignition"])
-        if reuse_saved and exists_output:
-            ignition_delays = np.atleast_1d(
-                np.genfromtxt(data_files["output_ignition"], delimiter=",")
-            )
+    # PSR cases contribute three metrics each (extinction residence time and the
+    # two response temperatures), concatenated in case order.
+    n_ignition = len(ignition_conditions)
+    n_psr = 3 * len(psr_conditions)
+    n_flame = len(flame_conditions)
+    metrics = np.zeros(n_ignition + n_psr + n_flame)
+
+    if reuse_saved:
+        saved_outputs = [
+            ("autoignition", "output_ignition", slice(0, n_ignition)),
+            ("PSR", "output_psr", slice(n_ignition, n_ignition + n_psr)),
+            ("laminar flame", "output_flame", slice(n_ignition + n_psr, None)),
+        ]
+        reused = np.zeros(metrics.size, dtype=bool)
+        for name, output, positions in saved_outputs:
+            if not metrics[positions].size or not os.path.isfile(data_files[output]):
+                continue
+            saved = np.atleast_1d(np.genfromtxt(data_files[output], delimiter=","))
+            if saved.size == metrics[positions].size:
+                logging.info(f"Reusing existing {name} samples for the starting model.")
+                metrics[positions] = saved
+                reused[positions] = True
+        cases = [case for case in cases if not reused[case[2]].any()]
+
+    # all remaining cases share a single queue, whatever their kind
+    results = _run_cases(cases, num_threads, pool=pool)
+    for case, metric in zip(cases, results):
+        metrics[case[2]] = metric
+    return metrics
+
+
+class CachedEvaluation(NamedTuple):
+    """Metrics and error of a reduced model evaluated earlier in the reduction."""
+
+    metrics: np.ndarray
+    error: float
+
+
+class EvaluationCache:
+    """Memo of reduced model evaluations shared across a whole reduction run.
+
+    A reduced model is completely determined by the species it retains (trimming
+    removes every reaction involving a removed species), so its metrics and error
+    under a given set of conditions are stored against the set of retained species
+    and a digest of those conditions. The graph-based methods and sensitivity
+    analysis look up every candidate here before simulating it, so no species set
+    is simulated twice. If ``filename`` is given, evaluations are appended to that
+    file as they are added and read back on construction, so a resumed run also
+    reuses the evaluations of earlier runs.
 
-        if reuse_saved and len(ignition_delays) == len(ignition_conditions):
-            logging.info(
-                "Reusing existing autoignition samples for the starting model."
-            )
-        else:
-            simulations = []
-            for idx, case in enumerate(ignition_conditions):
-                simulations.append(
-                    [
-                        IgnitionSimulation(
-                            idx, case, model, phase_name=phase_name, path=path
-                        ),
-                        idx,
-                    ]
-                )
+    Parameters
+    ----------
+    filename : str, optional
+        File (JSON lines) used to persist evaluations; if not given, evaluations
+        are kept in memory only.
 
-            ignition_delays = _run_metric_jobs(
-                simulations, ignition_worker, num_threads
-            )
+    """
 
-    # PSR cases contribute three metrics each (extinction residence time and the
-    # two response temperatures), concatenated in case order.
-    psr_metrics = np.array([])
-    if psr_conditions:
-        # each PSR case yields three metrics: extinction tau and two temperatures
-        n_psr_metrics = 3 * len(psr_conditions)
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._evaluations = {}
+        self._case_history = {}
+        if filename and os.path.isfile(filename):
+            with open(filename) as cache_file:
+                for line in cache_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        key = (frozenset(entry["species"]), entry["conditions"])
+                        self._evaluations[key] = CachedEvaluation(
+                            np.array(entry["metrics"], dtype=float), entry["error"]
+                        )
+
+    def __len__(self):
+        return len(self._evaluations)
+
+    def get(self, species_names, conditions):
+        """Look up the evaluation of a reduced model.
+
+        Parameters
+        ----------
+        species_names : iterable of str
+            Species retained in the reduced model
+        conditions : str
+            Digest of the evaluation conditions, from :func:`evaluation_conditions`
+
+        Returns
+        -------
+        CachedEvaluation or None
+            Stored metrics and error, or ``None`` if the model was not evaluated
+
+        """
+        return self._evaluations.get((frozenset(species_names), conditions))
+
+    def add(self, species_names, conditions, metrics, error):
+        """Store the evaluation of a reduced model.
+
+        Parameters
+        ----------
+        species_names : iterable of str
+            Species retained in the reduced model
+        conditions : str
+            Digest of the evaluation conditions, from :func:`evaluation_conditions`
+        metrics : numpy.ndarray
+            Metrics of the reduced model
+        error : float
+            Error of the reduced model
+
+        """
+        species = frozenset(species_names)
+        evaluation = CachedEvaluation(np.array(metrics, dtype=float), float(error))
+        self._evaluations[(species, conditions)] = evaluation
+        if self.filename:
+            with open(self.filename, "a") as cache_file:
+                entry = {
+                    "species": sorted(species),
+                    "conditions": conditions,
+                    "metrics": evaluation.metrics.tolist(),
+                    "error": evaluation.error,
+                }
+                cache_file.write(json.dumps(entry) + "\n")
+
+    def case_order(self, conditions, n_cases):
+        """Order in which to run the cases of an evaluation, hardest first.
+
+        Cases that have rejected the most reduced models come first, followed by
+        those with the largest errors seen; otherwise the case order is kept.
+
+        Parameters
+        ----------
+        conditions : str
+            Digest of the evaluation conditions, from :func:`evaluation_conditions`
+        n_cases : int
+            Number of cases
+
+        Returns
+        -------
+        numpy.ndarray
+            Case indices, hardest first
+
+        """
+        if conditions not in self._case_history:
+            return np.arange(n_cases)
+        rejections, max_errors = self._case_history[conditions]
+        return np.lexsort((-max_errors, -rejections))
+
+    def record_cases(self, conditions, case_errors, error_limit):
+        """Record the errors of the cases of an evaluation, for :meth:`case_order`.
+
+        Parameters
+        ----------
+        conditions : str
+            Digest of the evaluation conditions, from :func:`evaluation_conditions`
+        case_errors : numpy.ndarray
+            Error of each case; NaN for cases that were not run
+        error_limit : float
+            Maximum allowable error level for reduced model
+
+        """
+        n_cases = len(case_errors)
+        rejections, max_errors = self._case_history.setdefault(
+            conditions, (np.zeros(n_cases), np.zeros(n_cases))
+        )
+        with np.errstate(invalid="ignore"):
+            rejections += case_errors > error_limit
+        np.fmax(max_errors, case_errors, out=max_errors)
 
-        exists_output = os.path.isfile(data_files["output_psr"])
-        if reuse_saved and exists_output:
-            psr_metrics = np.atleast_1d(
-                np.genfromtxt(data_files["output_psr"], delimiter=",")
-            )
 
-        if reuse_saved and len(psr_metrics) == n_psr_metrics:
-            logging.info("Reusing existing PSR samples for the starting model.")
-        else:
-            simulations = []
-            for idx, case in enumerate(psr_conditions):
-                simulations.append(
-                    [
-                        PSRSimulation(
-                            idx, case, model, phase_name=phase_name, path=path
-                        ),
-                        idx,
-                    ]
+def evaluation_conditions(
+    metrics_original,
+    ignition_conditions,
+    psr_conditions=[],
+    flame_conditions=[],
+    phase_name="",
+    min_flame_speed=None,
+    model=None,
+):
+    """Digest of everything besides the retained species that sets a model's error.
+
+    Parameters
+    ----------
+    metrics_original : numpy.ndarray
+        Metrics serving as basis of error calculation
+    ignition_conditions : list of InputIgnition
+        List of autoignition initial conditions.
+    psr_conditions : list of InputPSR, optional
+        List of PSR simulation conditions.
+    flame_conditions : list of InputLaminarFlame, optional
+        List of laminar flame simulation conditions.
+    phase_name : str, optional
+        Optional name for phase to load from YAML file (e.g., 'gas').
+    min_flame_speed : float, optional
+        Minimum laminar flame speed (m/s) treated as a real flame.
+    model : str or ModelSpec, optional
+        Model file, or description of a reduced model; if given, the contents of
+        the (source) model file are part of the conditions, so evaluations are not
+        reused once the file changes.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest identifying the conditions
+
+    """
+    if isinstance(model, ModelSpec):
+        model = model.source
+    description = repr(
+        (
+            None if model is None else _model_digest(model),
+            list(ignition_conditions),
+            list(psr_conditions),
+            list(flame_conditions),
+            phase_name,
+            min_flame_speed,
+            np.asarray(metrics_original, dtype=float).tolist(),
+        )
+    )
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _retained_species(model, phase_name=""):
+    """Species of a model, without building a reduced model from its description.
+
+    Parameters
+    ----------
+    model : str or ModelSpec
+        Filename for Cantera model, or description of a reduced model
+    phase_name : str, optional
+        Optional name for phase to load from YAML file (e.g., 'gas').
+
+    Returns
+    -------
+    list of str
+        Names of the species in the model
+
+    """
+    if isinstance(model, ModelSpec):
+        excluded = set(model.exclusion_list)
+        return [
+            species
+            for species in load_solution(model.source, phase_name).species_names
+            if species not in excluded
+        ]
+    return load_solution(model, phase_name).species_names
+
+
+def evaluate_error(
+    model,
+    metrics_original,
+    ignition_conditions,
+    psr_conditions=[],
+    flame_conditions=[],
+    phase_name="",
+    num_threads=1,
+    path="",
+    min_flame_speed=None,
+    pool=None,
+    cache=None,
+    error_limit=None,
+):
+    """Evaluates the error of a reduced model, reusing any earlier evaluation.
+
+    Parameters
+    ----------
+    model : str or ModelSpec
+        Filename for Cantera model for performing simulations, or description of
+        an in-memory reduced model
+    metrics_original : numpy.ndarray
+        Metrics serving as basis of error calculation
+    ignition_conditions : list of InputIgnition
+        List of autoignition initial conditions.
+    psr_conditions : list of InputPSR, optional
+        List of PSR simulation conditions.
+    flame_conditions : list of InputLaminarFlame, optional
+        List of laminar flame simulation conditions.
+    phase_name : str, optional
+        Optional name for phase to load from YAML file (e.g., 'gas').
+    num_threads : int, optional
+        Number of CPU threads to use for performing simulations in parallel.
+    path : str, optional
+        Optional path for writing files
+    min_flame_speed : float, optional
+        Minimum laminar flame speed (m/s) treated as a real flame; ``None`` uses
+        the ``FlameSimulation`` default.
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for this call only.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models; if given, a model with the same
+        retained species is not simulated again, and new evaluations are added.
+    error_limit : float, optional
+        Maximum allowable error level for reduced model. If given, cases are run
+        one at a time as workers become free, the historically hardest first, and
+        as soon as one exceeds the limit the remaining cases are cancelled; the
+        error returned is then the largest over the cases run, which already
+        exceeds the limit.
+
+    Returns
+    -------
+    float
+        Maximum error over all metrics
+
+    """
+    if cache is not None:
+        species_names = _retained_species(model, phase_name)
+        conditions = evaluation_conditions(
+            metrics_original,
+            ignition_conditions,
+            psr_conditions,
+            flame_conditions,
+            phase_name,
+            min_flame_speed,
+            model,
+        )
+        evaluation = cache.get(species_names, conditions)
+        # an evaluation stopped early only tells whether the error exceeded the
+        # limit it was stopped at
+        if evaluation is not None and (
+            not np.isnan(evaluation.metrics).any()
+            or (error_limit is not None and evaluation.error > error_limit)
+        ):
+            return evaluation.error
+
+    if error_limit is None:
+        metrics = sample_metrics(
+            model,
+            ignition_conditions,
+            psr_conditions=psr_conditions,
+            flame_conditions=flame_conditions,
+            min_flame_speed=min_flame_speed,
+            phase_name=phase_name,
+            num_threads=num_threads,
+            pool=pool,
+            path=path,
+        )
+        error = calculate_error(metrics_original, metrics)
+    else:
+        if pool is None:
+            with WorkerPool(num_threads) as temp_pool:
+                return evaluate_error(
+                    model,
+                    metrics_original,
+                    ignition_conditions,
+                    psr_conditions=psr_conditions,
+                    flame_conditions=flame_conditions,
+                    phase_name=phase_name,
+                    num_threads=num_threads,
+                    path=path,
+                    min_flame_speed=min_flame_speed,
+                    pool=temp_pool,
+                    cache=cache,
+                    error_limit=error_limit,
                 )
 
-            psr_metrics = _run_metric_jobs(simulations, psr_worker, num_threads)
+        cases = _simulation_cases(
+            model,
+            ignition_conditions,
+            psr_conditions,
+            flame_conditions,
+            phase_name=phase_name,
+            path=path,
+            min_flame_speed=min_flame_speed,
+        )
+        order = np.arange(len(cases))
+        if cache is not None:
+            order = cache.case_order(conditions, len(cases))
+        metrics, case_errors = _stream_error(
+            cases, metrics_original, error_limit, order, pool
+        )
+        error = np.nanmax(case_errors) if len(cases) else 0.0
+        if cache is not None:
+            cache.record_cases(conditions, case_errors, error_limit)
 
-    flame_speeds = np.array([])
-    if flame_conditions:
-        flame_speeds = np.zeros(len(flame_conditions))
+    if cache is not None:
+        cache.add(species_names, conditions, metrics, error)
+    return error
 
-        exists_output = os.path.isfile(data_files["output_flame"])
-        if reuse_saved and exists_output:
-            flame_speeds = np.atleast_1d(
-                np.genfromtxt(data_files["output_flame"], delimiter=",")
-            )
 
-        if reuse_saved and len(flame_speeds) == len(flame_conditions):
-            logging.info(
-                "Reusing existing laminar flame samples for the starting model."
+def evaluate_errors(
+    models,
+    metrics_original,
+    ignition_conditions,
+    psr_conditions=[],
+    flame_conditions=[],
+    phase_name="",
+    num_threads=1,
+    path="",
+    min_flame_speed=None,
+    pool=None,
+    cache=None,
+):
+    """Evaluates the errors of several reduced models together.
+
+    Rather than running the cases of one model at a time, the cases of every
+    model (not already evaluated) share a single queue, so the number of
+    simulations that can run at once is the number of models times the number
+    of cases.
+
+    Parameters
+    ----------
+    models : list of str or ModelSpec
+        Filenames for Cantera models, or descriptions of in-memory reduced models
+    metrics_original : numpy.ndarray
+        Metrics serving as basis of error calculation
+    ignition_conditions : list of InputIgnition
+        List of autoignition initial conditions.
+    psr_conditions : list of InputPSR, optional
+        List of PSR simulation conditions.
+    flame_conditions : list of InputLaminarFlame, optional
+        List of laminar flame simulation conditions.
+    phase_name : str, optional
+        Optional name for phase to load from YAML file (e.g., 'gas').
+    num_threads : int, optional
+        Number of CPU threads to use for performing simulations in parallel.
+    path : str, optional
+        Optional path for writing files
+    min_flame_speed : float, optional
+        Minimum laminar flame speed (m/s) treated as a real flame; ``None`` uses
+        the ``FlameSimulation`` default.
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for this call only.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models; if given, models with the same
+        retained species are not simulated again, and new evaluations are added.
+
+    Returns
+    -------
+    numpy.ndarray
+        Maximum error over all metrics of each model
+
+    """
+    errors = np.zeros(len(models))
+    pending = []
+    for idx, model in enumerate(models):
+        species_names = None
+        conditions = None
+        if cache is not None:
+            species_names = _retained_species(model, phase_name)
+            conditions = evaluation_conditions(
+                metrics_original,
+                ignition_conditions,
+                psr_conditions,
+                flame_conditions,
+                phase_name,
+                min_flame_speed,
+                model,
             )
-        else:
-            simulations = []
-            for idx, case in enumerate(flame_conditions):
-                simulations.append(
-                    [
-                        FlameSimulation(
-                            idx,
-                            case,
-                            model,
-                            phase_name=phase_name,
-                            path=path,
-                            min_flame_speed=min_flame_speed,
-                        ),
-                        idx,
-                    ]
-                )
+            evaluation = cache.get(species_names, conditions)
+            if evaluation is not None and not np.isnan(evaluation.metrics).any():
+                errors[idx] = evaluation.error
+                continue
+
+        cases = _simulation_cases(
+            model,
+            ignition_conditions,
+            psr_conditions,
+            flame_conditions,
+            phase_name=phase_name,
+            path=path,
+            min_flame_speed=min_flame_speed,
+        )
+        pending.append((idx, species_names, conditions, cases))
 
-            flame_speeds = _run_metric_jobs(simulations, flame_worker, num_threads)
+    results = _run_cases(
+        [case for *_, cases in pending for case in cases], num_threads, pool=pool
+    )
 
-    metric_arrays = [
-        np.atleast_1d(m) for m in (ignition_delays, psr_metrics, flame_speeds) if m.size
-    ]
-    return np.concatenate(metric_arrays) if metric_arrays else np.array([])
+    first = 0
+    for idx, species_names, conditions, cases in pending:
+        metrics = np.zeros(len(metrics_original))
+        for case, result in zip(cases, results[first : first + len(cases)]):
+            metrics[case[2]] = result
+        first += len(cases)
+
+        errors[idx] = calculate_error(metrics_original, metrics)
+        if cache is not None:
+            cache.add(species_names, conditions, metrics, errors[idx])
+
+    return errors
 
 
 def sample(
@@ -511,6 +1221,7 @@ def sample(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
 ):
     """Samples thermochemical data and generates metrics for various phenomena.
 
@@ -535,6 +1246,12 @@ def sample(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    min_flame_speed : float, optional
+        Minimum laminar flame speed (m/s) treated as a real flame; ``None`` uses
+        the ``FlameSimulation`` default.
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for this call only.
 
     Returns
     -------
@@ -547,165 +1264,95 @@ def sample(
     if not num_threads:
         num_threads = multiprocessing.cpu_count() - 1 or 1
 
-    ignition_delays = np.array([])
-    ignition_data = []
-    if ignition_conditions:
-        ignition_delays = np.zeros(len(ignition_conditions))
-        ignition_data = []
-
-        # check for presence of data and output files; if present, reuse.
-        matches_number = False
-        matches_shape = False
-        exists_data = os.path.isfile(data_files["data_ignition"])
-        exists_output = os.path.isfile(data_files["output_ignition"])
-        if exists_data and exists_output:
-            ignition_delays = np.genfromtxt(
-                data_files["output_ignition"], delimiter=","
-            )
-            ignition_data = np.genfromtxt(data_files["data_ignition"], delimiter=",")
-            # need to check that saved data at least matches the number of cases
-            matches_number = ignition_delays.size == len(
-                ignition_conditions
-            ) and ignition_data.shape[0] / 20 == len(ignition_conditions)
-
-            # also check that expected data is right shape (e.g., in case number of species
-            # has changed if running a new model)
-            gas = ct.Solution(model, phase_name)
-            matches_shape = ignition_data.shape[1] == 2 + gas.n_species
-
-        if matches_number and matches_shape:
-            logging.info(
-                "Reusing existing autoignition samples for the starting model."
-            )
-        else:
-            logging.info("Running autoignition simulations for starting model.")
-            simulations = []
-            for idx, case in enumerate(ignition_conditions):
-                simulations.append(
-                    [
-                        IgnitionSimulation(
-                            idx, case, model, phase_name=phase_name, path=path
-                        ),
-                        idx,
-                    ]
-                )
-
-            ignition_delays, ignition_data = _run_sampling_jobs(
-                simulations, ignition_sample_worker, num_threads
-            )
-
-            np.savetxt(data_files["data_ignition"], ignition_data, delimiter=",")
-            np.savetxt(data_files["output_ignition"], ignition_delays, delimiter=",")
-
-    # PSR cases contribute three metrics each (extinction residence time and the
-    # two response temperatures) and ``num_sample_points`` sampled-state rows.
-    psr_metrics = np.array([])
-    psr_data = []
-    if psr_conditions:
-        n_rows = PSRSimulation.num_sample_points
-        n_psr_metrics = 3 * len(psr_conditions)
-
-        # check for presence of data and output files; if present, reuse.
-        matches_number = False
-        matches_shape = False
-        exists_data = os.path.isfile(data_files["data_psr"])
-        exists_output = os.path.isfile(data_files["output_psr"])
-        if exists_data and exists_output:
-            psr_metrics = np.atleast_1d(
-                np.genfromtxt(data_files["output_psr"], delimiter=",")
-            )
-            psr_data = np.genfromtxt(data_files["data_psr"], delimiter=",")
-            matches_number = psr_metrics.size == n_psr_metrics and psr_data.shape[
-                0
-            ] / n_rows == len(psr_conditions)
-
-            gas = ct.Solution(model, phase_name)
-            matches_shape = psr_data.shape[1] == 2 + gas.n_species
-
-        if matches_number and matches_shape:
-            logging.info("Reusing existing PSR samples for the starting model.")
-        else:
-            logging.info("Running PSR simulations for starting model.")
-            simulations = []
-            for idx, case in enumerate(psr_conditions):
-                simulations.append(
-                    [
-                        PSRSimulation(
-                            idx, case, model, phase_name=phase_name, path=path
-                        ),
-                        idx,
-                    ]
-                )
-
-            psr_metrics, psr_data = _run_sampling_jobs(
-                simulations, psr_sample_worker, num_threads
-            )
-
-            np.savetxt(data_files["data_psr"], psr_data, delimiter=",")
-            np.savetxt(data_files["output_psr"], psr_metrics, delimiter=",")
-
-    flame_speeds = np.array([])
-    flame_data = []
-    if flame_conditions:
-        flame_speeds = np.zeros(len(flame_conditions))
-        flame_data = []
-
-        # check for presence of data and output files; if present, reuse.
-        matches_number = False
-        matches_shape = False
-        exists_data = os.path.isfile(data_files["data_flame"])
-        exists_output = os.path.isfile(data_files["output_flame"])
-        if exists_data and exists_output:
-            flame_speeds = np.atleast_1d(
-                np.genfromtxt(data_files["output_flame"], delimiter=",")
-            )
-            flame_data = np.genfromtxt(data_files["data_flame"], delimiter=",")
-            # need to check that saved data at least matches the number of cases
-            matches_number = flame_speeds.size == len(
-                flame_conditions
-            ) and flame_data.shape[0] / 20 == len(flame_conditions)
-
-            # also check that expected data is right shape (e.g., in case number of species
-            # has changed if running a new model)
-            gas = ct.Solution(model, phase_name)
-            matches_shape = flame_data.shape[1] == 2 + gas.n_species
-
-        if matches_number and matches_shape:
-            logging.info(
-                "Reusing existing laminar flame samples for the starting model."
-            )
-        else:
-            logging.info("Running laminar flame simulations for starting model.")
-            simulations = []
-            for idx, case in enumerate(flame_conditions):
-                simulations.append(
-                    [
-                        FlameSimulation(
-                            idx,
-                            case,
-                            model,
-                            phase_name=phase_name,
-                            path=path,
-                            min_flame_speed=min_flame_speed,
-                        ),
-                        idx,
-                    ]
-                )
-
-            flame_speeds, flame_data = _run_sampling_jobs(
-                simulations, flame_sample_worker, num_threads
-            )
+    cases = _simulation_cases(
+        model,
+        ignition_conditions,
+        psr_conditions,
+        flame_conditions,
+        phase_name=phase_name,
+        path=path,
+        min_flame_speed=min_flame_speed,
+        sample_data=True,
+    )
+    n_species = load_solution(model, phase_name).n_species
+
+    # Each kind of case contributes a number of metrics per case (three for the
+    # PSR extinction residence time and response temperatures) and of
+    # sampled-state rows in total (set per case for autoignition and flames).
+    kinds = [
+        (
+            "autoignition",
+            "ignition",
+            ignition_conditions,
+            1,
+            sum(case.sample_points for case in ignition_conditions),
+        ),
+        (
+            "PSR",
+            "psr",
+            psr_conditions,
+            3,
+            PSRSimulation.num_sample_points * len(psr_conditions),
+        ),
+        (
+            "laminar flame",
+            "flame",
+            flame_conditions,
+            1,
+            sum(case.sample_points for case in flame_conditions),
+        ),
+    ]
 
-            np.savetxt(data_files["data_flame"], flame_data, delimiter=",")
-            np.savetxt(data_files["output_flame"], flame_speeds, delimiter=",")
+    # check for presence of data and output files; if present, reuse. Cases of
+    # all kinds that need to be run then share a single queue.
+    results = {}
+    run_cases = {}
+    first = 0
+    for name, kind, conditions, n_metrics, n_rows in kinds:
+        kind_cases = cases[first : first + len(conditions)]
+        first += len(conditions)
+        if not conditions:
+            continue
+
+        data_file = data_files[f"data_{kind}"]
+        output_file = data_files[f"output_{kind}"]
+        if os.path.isfile(data_file) and os.path.isfile(output_file):
+            metrics = np.atleast_1d(np.genfromtxt(output_file, delimiter=","))
+            data = np.atleast_2d(np.genfromtxt(data_file, delimiter=","))
+            # need to check that saved data at least matches the number of cases,
+            # and that expected data is right shape (e.g., in case number of
+            # species has changed if running a new model)
+            if (
+                metrics.size == n_metrics * len(conditions)
+                and data.shape[0] == n_rows
+                and data.shape[1] == 2 + n_species
+            ):
+                logging.info(f"Reusing existing {name} samples for the starting model.")
+                results[kind] = (metrics, data)
+                continue
+
+        logging.info(f"Running {name} simulations for starting model.")
+        run_cases[kind] = kind_cases
+
+    queue_results = _run_cases(
+        [case for kind_cases in run_cases.values() for case in kind_cases],
+        num_threads,
+        pool=pool,
+    )
+    first = 0
+    for kind, kind_cases in run_cases.items():
+        kind_results = queue_results[first : first + len(kind_cases)]
+        first += len(kind_cases)
+
+        metrics = np.concatenate([np.atleast_1d(m) for m, _ in kind_results])
+        data = np.array([row for _, case_data in kind_results for row in case_data])
+        np.savetxt(data_files[f"data_{kind}"], data, delimiter=",")
+        np.savetxt(data_files[f"output_{kind}"], metrics, delimiter=",")
+        results[kind] = (metrics, data)
 
     # combine metrics and sampled data from all phenomena (ignition, PSR, flame)
-    metric_arrays = [
-        np.atleast_1d(m) for m in (ignition_delays, psr_metrics, flame_speeds) if m.size
-    ]
-    data_arrays = [
-        np.asarray(d) for d in (ignition_data, psr_data, flame_data) if len(d)
-    ]
+    metric_arrays = [results[kind][0] for _, kind, *_ in kinds if kind in results]
+    data_arrays = [results[kind][1] for _, kind, *_ in kinds if kind in results]
     sampled_metrics = np.concatenate(metric_arrays) if metric_arrays else np.array([])
     sampled_data = np.vstack(data_arrays) if data_arrays else np.array([])
     return sampled_metrics, sampled_data
@@ -729,7 +1376,7 @@ def parse_ignition_inputs(model, conditions, phase_name=""):
         List of validated objects with autoignition input parameters
 
     """
-    gas = ct.Solution(model, phase_name)
+    gas = load_solution(model, phase_name)
 
     inputs = []
     for idx, case in enumerate(conditions):
@@ -795,6 +1442,15 @@ def parse_ignition_inputs(model, conditions, phase_name=""):
             pre + "composition-type: must be mole when specifying equivalence ratio"
         )
 
+        sample_points = case.get("sample-points", 20)
+        assert isinstance(sample_points, int) and sample_points > 0, (
+            pre + '"sample-points" needs to be an integer > 0'
+        )
+        sample_placement = case.get("sample-placement", "temperature")
+        assert sample_placement in SAMPLE_PLACEMENTS, (
+            pre + "sample-placement must be one of " + ", ".join(SAMPLE_PLACEMENTS)
+        )
+
         inputs.append(
             InputIgnition(
                 kind,
@@ -807,6 +1463,8 @@ def parse_ignition_inputs(model, conditions, phase_name=""):
                 oxidizer,
                 reactants,
                 composition_type,
+                sample_points,
+                sample_placement,
             )
         )
 
@@ -831,7 +1489,7 @@ def parse_psr_inputs(model, conditions, phase_name=""):
         List of validated objects with PSR input parameters
 
     """
-    gas = ct.Solution(model, phase_name)
+    gas = load_solution(model, phase_name)
 
     inputs = []
     for idx, case in enumerate(conditions):
@@ -923,7 +1581,7 @@ def parse_flame_inputs(model, conditions, phase_name=""):
         List of validated objects with laminar flame input parameters
 
     """
-    gas = ct.Solution(model, phase_name)
+    gas = load_solution(model, phase_name)
 
     inputs = []
     for idx, case in enumerate(conditions):
@@ -985,6 +1643,15 @@ def parse_flame_inputs(model, conditions, phase_name=""):
             pre + "composition-type: must be mole when specifying equivalence ratio"
         )
 
+        sample_points = case.get("sample-points", 20)
+        assert isinstance(sample_points, int) and sample_points > 0, (
+            pre + '"sample-points" needs to be an integer > 0'
+        )
+        sample_placement = case.get("sample-placement", "temperature")
+        assert sample_placement in SAMPLE_PLACEMENTS, (
+            pre + "sample-placement must be one of " + ", ".join(SAMPLE_PLACEMENTS)
+        )
+
         inputs.append(
             InputLaminarFlame(
                 temperature,
@@ -995,6 +1662,8 @@ def parse_flame_inputs(model, conditions, phase_name=""):
                 oxidizer,
                 reactants,
                 composition_type,
+                sample_points,
+                sample_placement,
             )
         )
 
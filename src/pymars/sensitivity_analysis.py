@@ -1,36 +1,16 @@
 """Module containing sensitivity analysis reduction stage."""
 
 import logging
+from heapq import heapify, heappush, heappop
 
 import numpy as np
-import cantera as ct
 
 from . import soln2yaml
-from .sampling import sample_metrics, calculate_error
-from .reduce_model import trim, ReducedModel
-
-# Taken from http://stackoverflow.com/a/22726782/1569494
-try:
-    from tempfile import TemporaryDirectory
-except ImportError:
-    from contextlib import contextmanager
-    import shutil
-    import tempfile
-    import errno
-
-    @contextmanager
-    def TemporaryDirectory():
-        name = tempfile.mkdtemp()
-        try:
-            yield name
-        finally:
-            try:
-                shutil.rmtree(name)
-            except OSError as e:
-                # Reraise unless ENOENT: No such file or directory
-                # (ok if directory has already been deleted)
-                if e.errno != errno.ENOENT:
-                    raise
+from .sampling import sample_metrics, evaluate_error, evaluate_errors
+from .reduce_model import ReducedModel, ModelSpec
+from .simulation import load_solution, copy_solution
+
+SENSITIVITY_TYPES = ["initial", "greedy", "lazy-greedy", "batch"]
 
 
 def evaluate_species_errors(
@@ -43,13 +23,16 @@ def evaluate_species_errors(
     phase_name="",
     num_threads=1,
     min_flame_speed=None,
+    pool=None,
+    cache=None,
 ):
     """Calculate error induced by removal of each limbo species
 
     Parameters
     ----------
-    starting_model : ReducedModel
-        Container with model and file information
+    starting_model : ReducedModel or ModelSpec
+        Container with model and file information, or specification of the
+        starting model in terms of its source file and removed species
     ignition_conditions : list of InputIgnition
         List of autoignition initial conditions.
     metrics : numpy.ndarray
@@ -65,6 +48,12 @@ def evaluate_species_errors(
         Optional; default = 1, in which the multiprocessing module is not used.
         If 0, then use the available number of cores minus one. Otherwise,
         use the specified number of threads.
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
 
     Returns
     -------
@@ -72,30 +61,25 @@ def evaluate_species_errors(
         Maximum errors induced by removal of each limbo species
 
     """
-    species_errors = np.zeros(len(species_limbo))
-    with TemporaryDirectory() as temp_dir:
-        for idx, species in enumerate(species_limbo):
-            test_model = trim(
-                starting_model.filename,
-                [species],
-                f"reduced_model_{species}.yaml",
-                phase_name=phase_name,
-            )
-            test_model_file = soln2yaml.write(
-                test_model, f"reduced_model_{species}.yaml", path=temp_dir
-            )
-            reduced_model_metrics = sample_metrics(
-                test_model_file,
-                ignition_conditions,
-                psr_conditions=psr_conditions,
-                flame_conditions=flame_conditions,
-                min_flame_speed=min_flame_speed,
-                phase_name=phase_name,
-                num_threads=num_threads,
-            )
-            species_errors[idx] = calculate_error(metrics, reduced_model_metrics)
+    if isinstance(starting_model, ModelSpec):
+        base_spec = starting_model
+    else:
+        base_spec = ModelSpec(starting_model.filename)
 
-    return species_errors
+    # The simulations of all candidates share a single queue, so that every
+    # (species, condition) pair can run at once.
+    return evaluate_errors(
+        [base_spec.remove([species]) for species in species_limbo],
+        metrics,
+        ignition_conditions,
+        psr_conditions=psr_conditions,
+        flame_conditions=flame_conditions,
+        min_flame_speed=min_flame_speed,
+        phase_name=phase_name,
+        num_threads=num_threads,
+        pool=pool,
+        cache=cache,
+    )
 
 
 def run_sa(
@@ -112,13 +96,16 @@ def run_sa(
     num_threads=1,
     path="",
     min_flame_speed=None,
+    pool=None,
+    cache=None,
 ):
     """Runs a sensitivity analysis to remove species on a given model.
 
     Parameters
     ----------
-    model_file : str
-        Model being analyzed
+    model_file : str or ModelSpec
+        Model being analyzed; a reduced model given as the species removed from
+        the original model shares cached evaluations with the earlier stages
     starting_error : float
         Error percentage between the reduced and original models
     ignition_conditions : list of InputIgnition
@@ -133,9 +120,16 @@ def run_sa(
         List of species names to always be retained
     phase_name : str, optional
         Optional name for phase to load from CTI file (e.g., 'gas').
-    algorithm_type : {'initial', 'greedy'}
-        Type of sensitivity analysis: initial (order based on initial error), or
-        greedy (all species error re-evaluated after each removal)
+    algorithm_type : {'initial', 'greedy', 'lazy-greedy', 'batch'}
+        Type of sensitivity analysis: initial (order based on initial error),
+        greedy (all species error re-evaluated after each removal),
+        lazy-greedy (only the species with the lowest, possibly out of date,
+        error re-evaluated after each removal, until one still ranks first; unlike
+        greedy, which removes the species whose error is closest to the current
+        model's, this removes the one with the lowest error, which is the same
+        species unless removing some species lowers the error), or
+        batch (order based on initial error, removing species in batches that
+        double in size while they meet the error limit and are halved when not)
     species_limbo : list of str, optional
         List of species to consider; if empty, consider all not in ``species_safe``
     num_threads : int, optional
@@ -145,6 +139,12 @@ def run_sa(
         use the specified number of threads.
     path : str, optional
         Optional path for writing files
+    pool : WorkerPool, optional
+        Shared worker pool for running the simulations; if not given, a pool of
+        ``num_threads`` processes is created for each set of simulations.
+    cache : EvaluationCache, optional
+        Evaluations of earlier reduced models, so that a reduced model with the
+        same species is not simulated again.
 
     Returns
     -------
@@ -152,10 +152,16 @@ def run_sa(
         Return reduced model and associated metadata
 
     """
+    # Candidate models are described by the species removed from ``model_file``
+    # and built in memory, rather than written to and read back from disk.
+    if isinstance(model_file, ModelSpec):
+        current_spec = model_file
+    else:
+        current_spec = ModelSpec(model_file)
     current_model = ReducedModel(
-        model=ct.Solution(model_file, phase_name),
+        model=load_solution(current_spec, phase_name),
         error=starting_error,
-        filename=model_file,
+        filename="" if current_spec.exclusion_list else current_spec.source,
     )
 
     logging.info(
@@ -164,7 +170,7 @@ def run_sa(
 
     # The metrics for the starting model need to be determined or read
     initial_metrics = sample_metrics(
-        model_file,
+        current_spec,
         ignition_conditions,
         psr_conditions=psr_conditions,
         flame_conditions=flame_conditions,
@@ -172,6 +178,7 @@ def run_sa(
         reuse_saved=True,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
         path=path,
     )
 
@@ -186,7 +193,7 @@ def run_sa(
     # Need to first evaluate all induced errors of species; for the ``initial`` method,
     # this will be the only evaluation.
     species_errors = evaluate_species_errors(
-        current_model,
+        current_spec,
         ignition_conditions,
         initial_metrics,
         species_limbo,
@@ -195,40 +202,119 @@ def run_sa(
         min_flame_speed=min_flame_speed,
         phase_name=phase_name,
         num_threads=num_threads,
+        pool=pool,
+        cache=cache,
     )
 
-    # Use a temporary directory to avoid cluttering the working directory with
-    # all the temporary model files
-    with TemporaryDirectory() as temp_dir:
+    if algorithm_type == "batch":
+        # Species are removed in order of their initial errors, several at a time:
+        # the batch size doubles after each batch that meets the error limit and
+        # is halved after one that does not, stopping when a single species
+        # cannot be removed.
+        species_order = [species_limbo[idx] for idx in np.argsort(species_errors)]
+        batch_size = 1
+        while species_order:
+            batch = species_order[:batch_size]
+            test_spec = current_spec.remove(batch)
+            test_model = load_solution(test_spec, phase_name)
+
+            error = evaluate_error(
+                test_spec,
+                initial_metrics,
+                ignition_conditions,
+                psr_conditions=psr_conditions,
+                flame_conditions=flame_conditions,
+                min_flame_speed=min_flame_speed,
+                phase_name=phase_name,
+                num_threads=num_threads,
+                pool=pool,
+                path=path,
+                cache=cache,
+                error_limit=error_limit,
+            )
+
+            removed = batch[0] if len(batch) == 1 else f"{len(batch)} species"
+            logging.info(f"{test_model.n_species:^17} | {removed:^17} | {error:^.2f}")
+
+            if error <= error_limit:
+                current_spec = test_spec
+                current_model = ReducedModel(model=test_model, error=error)
+                del species_order[:batch_size]
+                batch_size *= 2
+            elif batch_size > 1:
+                batch_size //= 2
+            else:
+                break
+    elif algorithm_type == "lazy-greedy":
+        # Induced errors generally only grow as species are removed, so rather
+        # than re-evaluating every species after each removal, species are kept
+        # in a heap by their last evaluated error (and the number of removals at
+        # that evaluation). Only the top species is re-evaluated; once its error
+        # is up to date and it still ranks first, it is removed. This is the
+        # species with the lowest induced error, rather than the one closest to
+        # the current error as in greedy; the two differ only when some removal
+        # would lower the error.
+        heap = [
+            (error, species, 0) for species, error in zip(species_limbo, species_errors)
+        ]
+        heapify(heap)
+        num_removed = 0
+        while heap:
+            error, species_remove, evaluated_at = heappop(heap)
+            test_spec = current_spec.remove([species_remove])
+            if evaluated_at < num_removed:
+                error = evaluate_error(
+                    test_spec,
+                    initial_metrics,
+                    ignition_conditions,
+                    psr_conditions=psr_conditions,
+                    flame_conditions=flame_conditions,
+                    min_flame_speed=min_flame_speed,
+                    phase_name=phase_name,
+                    num_threads=num_threads,
+                    pool=pool,
+                    path=path,
+                    cache=cache,
+                    error_limit=error_limit,
+                )
+                heappush(heap, (error, species_remove, num_removed))
+                continue
+
+            test_model = load_solution(test_spec, phase_name)
+            logging.info(
+                f"{test_model.n_species:^17} | {species_remove:^17} | {error:^.2f}"
+            )
+
+            # Ensure new error isn't too high
+            if error > error_limit:
+                break
+            current_spec = test_spec
+            current_model = ReducedModel(model=test_model, error=error)
+            num_removed += 1
+    else:
         while species_limbo:
             # use difference between error and current error to find species to remove
             idx = np.argmin(np.abs(species_errors - current_model.error))
             species_errors = np.delete(species_errors, idx)
             species_remove = species_limbo.pop(idx)
 
-            test_model = trim(
-                current_model.filename,
-                [species_remove],
-                f"reduced_model_{species_remove}.yaml",
-                phase_name=phase_name,
-            )
-            test_model_file = soln2yaml.write(
-                test_model,
-                output_filename=f"reduced_model_{species_remove}.yaml",
-                path=temp_dir,
-            )
+            test_spec = current_spec.remove([species_remove])
+            test_model = load_solution(test_spec, phase_name)
 
-            reduced_model_metrics = sample_metrics(
-                test_model_file,
+            error = evaluate_error(
+                test_spec,
+                initial_metrics,
                 ignition_conditions,
                 psr_conditions=psr_conditions,
                 flame_conditions=flame_conditions,
                 min_flame_speed=min_flame_speed,
                 phase_name=phase_name,
                 num_threads=num_threads,
+                pool=pool,
                 path=path,
+                cache=cache,
+                error_limit=error_limit,
             )
-            error = calculate_error(initial_metrics, reduced_model_metrics)
 
             logging.info(
                 f"{test_model.n_species:^17} | {species_remove:^17} | {error:^.2f}"
@@ -238,14 +324,13 @@ def run_sa(
             if error > error_limit:
                 break
             else:
-                current_model = ReducedModel(
-                    model=test_model, filename=test_model_file, error=error
-                )
+                current_spec = test_spec
+                current_model = ReducedModel(model=test_model, error=error)
 
             # If using the greedy algorithm, now need to reevaluate all species errors
             if algorithm_type == "greedy":
                 species_errors = evaluate_species_errors(
-                    current_model,
+                    current_spec,
                     ignition_conditions,
                     initial_metrics,
                     species_limbo,
@@ -254,13 +339,15 @@ def run_sa(
                     min_flame_speed=min_flame_speed,
                     phase_name=phase_name,
                     num_threads=num_threads,
+                    pool=pool,
+                    cache=cache,
                 )
                 if min(species_errors) > error_limit:
                     break
 
-    # Final model; may need to rewrite
+    # Final model, copied rather than shared with the model cache; may need to rewrite
     reduced_model = ReducedModel(
-        model=current_model.model,
+        model=copy_solution(current_model.model),
         filename=f"reduced_{current_model.model.n_species}.yaml",
         error=current_model.error,
     )
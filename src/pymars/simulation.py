@@ -9,14 +9,206 @@ types: :class:`IgnitionSimulation` (autoignition) and :class:`FlameSimulation`
 """
 
 import os
+import hashlib
 import logging
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 import numpy as np
 import h5py
 import cantera as ct
 
 from .psr_solver import trace_extinction_curve
+from .reduce_model import ModelSpec, Trimmer, trim
+
+#: Maximum number of parsed models held by :func:`load_solution` in each process.
+SOLUTION_CACHE_SIZE = 8
+
+#: Minimum number of rows a :class:`TrajectoryBuffer` allocates or grows by at once.
+TRAJECTORY_CHUNK_ROWS = 1024
+
+#: Number of candidate states a :class:`StreamingSampler` keeps for each sample.
+STREAMING_RING_SIZE = 8
+
+#: Placements of the sampled points along a profile: at evenly-spaced fractions of
+#: the temperature rise, or of the total variation of the heat release rate.
+SAMPLE_PLACEMENTS = ["temperature", "heat-release"]
+
+#: Fraction of the estimated temperature rise past the last threshold over which a
+#: :class:`StreamingSampler` keeps looking for the last sample.
+STREAMING_MARGIN = 1e-3
+
+# Parsed models keyed by (file content hash, phase name), least recently used first.
+_solution_cache = OrderedDict()
+
+# Trimmers of the source models of reduced models, keyed and bounded the same way.
+_trimmer_cache = OrderedDict()
+
+# Content hashes of model files, keyed by path, with the (mtime, size) hashed.
+_digest_cache = {}
+
+
+def _model_digest(model):
+    """Hash the contents of a model file, so a rewritten file is never reused.
+
+    Looks for the file in the same places as Cantera (the working directory, then
+    Cantera's data directories, e.g. for ``gri30.yaml``). If the file cannot be
+    found the name itself is returned, leaving Cantera to report the error. The
+    hash of each file is kept until its modification time or size changes, so
+    looking up a cached model does not read the whole file again.
+    """
+    for directory in ct.get_data_directories():
+        filename = os.path.abspath(os.path.join(directory, model))
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = _digest_cache.get(filename)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(filename, "rb") as the_file:
+            digest = hashlib.sha1(the_file.read()).hexdigest()
+        _digest_cache[filename] = (signature, digest)
+        return digest
+    return model
+
+
+def load_solution(model, phase_name=""):
+    """Return a Cantera Solution for a model, parsing each model once per process.
+
+    Parsing a large model (and fitting its transport properties) dominates the
+    setup of a short simulation, and every case of every candidate model used to
+    parse its file again. Solutions are instead cached per process, keyed by the
+    file's content hash and the phase name, and at most ``SOLUTION_CACHE_SIZE``
+    are kept (least recently used are dropped first). Worker processes of a
+    :class:`pymars.sampling.WorkerPool` persist, so each parses a given model
+    only once over a whole reduction.
+
+    A model may also be given as a :class:`pymars.reduce_model.ModelSpec`, in
+    which case it is built by trimming the cached source model, and is then
+    cached under the source's hash and the set of removed species.
+
+    The same object is handed out on every call, reset to the state it was
+    loaded in, so the state left by one caller never reaches the next. Callers
+    must not modify its species or reactions, and one that keeps the model while
+    others may load it again (e.g., as a final result) should keep a
+    :func:`copy_solution` instead.
+
+    Parameters
+    ----------
+    model : str or ModelSpec
+        Filename for Cantera-format model, or description of a reduced model
+    phase_name : str, optional
+        Optional name for phase to load from YAML file (e.g., 'gas').
+
+    Returns
+    -------
+    cantera.Solution
+        Parsed model
+
+    """
+    if isinstance(model, ModelSpec):
+        key = (
+            _model_digest(model.source),
+            phase_name,
+            frozenset(model.exclusion_list),
+        )
+    else:
+        key = (_model_digest(model), phase_name)
+
+    cached = _solution_cache.pop(key, None)
+    if cached is None:
+        if isinstance(model, ModelSpec):
+            solution = trim(
+                None,
+                model.exclusion_list,
+                f"reduced_{os.path.basename(model.source)}",
+                phase_name=phase_name,
+                trimmer=_load_trimmer(model.source, phase_name),
+            )
+        else:
+            solution = ct.Solution(model, phase_name)
+        cached = (solution, solution.state)
+    _solution_cache[key] = cached
+
+    while len(_solution_cache) > SOLUTION_CACHE_SIZE:
+        _solution_cache.popitem(last=False)
+
+    solution, state = cached
+    solution.state = state
+    return solution
+
+
+def copy_solution(solution):
+    """Return a copy of an ideal gas model that shares no state with the original.
+
+    Used for the models handed back by the reduction stages, which would
+    otherwise be the objects cached by :func:`load_solution`.
+
+    Parameters
+    ----------
+    solution : cantera.Solution
+        Model to copy
+
+    Returns
+    -------
+    cantera.Solution
+        New model with the same species, reactions, transport model, and state
+
+    """
+    copy = ct.Solution(
+        species=solution.species(),
+        reactions=solution.reactions(),
+        thermo="ideal-gas",
+        kinetics="bulk",
+        transport_model=solution.transport_model,
+    )
+    copy.name = solution.name
+    copy.state = solution.state
+    return copy
+
+
+def _load_trimmer(model, phase_name=""):
+    """Return a :class:`pymars.reduce_model.Trimmer` for a model file.
+
+    Each source model's trimmer is built once per process, like the parsed
+    models of :func:`load_solution`, so that every reduced model built from it
+    reuses its species and reaction objects.
+    """
+    key = (_model_digest(model), phase_name)
+    trimmer = _trimmer_cache.pop(key, None)
+    if trimmer is None:
+        trimmer = Trimmer(load_solution(model, phase_name))
+    _trimmer_cache[key] = trimmer
+
+    while len(_trimmer_cache) > SOLUTION_CACHE_SIZE:
+        _trimmer_cache.popitem(last=False)
+
+    return trimmer
+
+
+def sample_thresholds(num_points, temperature_initial, temperature_final):
+    """Temperatures at ``num_points`` evenly-spaced fractions of a temperature rise.
+
+    Parameters
+    ----------
+    num_points : int
+        Number of fractions of the rise, the last of which is the whole rise.
+    temperature_initial : float
+        Temperature at the start of the rise.
+    temperature_final : float
+        Temperature at the end of the rise.
+
+    Returns
+    -------
+    numpy.ndarray
+        Threshold temperatures, in increasing order for a positive rise.
+
+    """
+    delta = 1.0 / num_points
+    deltas = np.arange(delta, 1 + delta, delta)
+    return temperature_initial + deltas * (temperature_final - temperature_initial)
 
 
 class BaseSimulation(ABC):
@@ -28,8 +220,9 @@ class BaseSimulation(ABC):
         Identifier index for case
     properties : InputIgnition or InputLaminarFlame
         Object with initial conditions for the simulation
-    model : str
-        Filename for Cantera-format model to be used
+    model : str or ModelSpec
+        Filename for Cantera-format model to be used, or description of an
+        in-memory reduced model
     phase_name : str, optional
         Optional name for phase to load from YAML file (e.g., 'gas').
     path : str, optional
@@ -47,6 +240,12 @@ class BaseSimulation(ABC):
         self.phase_name = phase_name
         self.path = path
 
+        # Number and placement of the sampled points, if the case sets them
+        self.num_sample_points = getattr(
+            properties, "sample_points", self.num_sample_points
+        )
+        self.sample_placement = getattr(properties, "sample_placement", "temperature")
+
         #: Path to any intermediate data file written during the run. Simulation
         #: types that write one (e.g., autoignition) set this in ``setup_case``;
         #: those that don't (e.g., laminar flame) leave it ``None``.
@@ -55,13 +254,16 @@ class BaseSimulation(ABC):
     def _setup_gas(self):
         """Create the gas object and set its initial temperature, pressure, and composition.
 
+        The gas object comes from the per-process cache of :func:`load_solution`,
+        so the model is only parsed for the first case run in each process.
+
         Returns
         -------
         cantera.Solution
             The initialized gas object (also stored as ``self.gas``).
 
         """
-        self.gas = ct.Solution(self.model, self.phase_name)
+        self.gas = load_solution(self.model, self.phase_name)
 
         self.gas.TP = (
             self.properties.temperature,
@@ -75,6 +277,12 @@ class BaseSimulation(ABC):
                 self.properties.fuel,
                 self.properties.oxidizer,
             )
+            # Set the pressure again for the new composition, so that the initial
+            # state does not depend on the composition the gas object held before
+            self.gas.TP = (
+                self.properties.temperature,
+                self.properties.pressure * ct.one_atm,
+            )
         else:
             if self.properties.composition_type == "mole":
                 self.gas.TPX = (
@@ -92,50 +300,241 @@ class BaseSimulation(ABC):
         return self.gas
 
     @classmethod
-    def _sample_profile(cls, temperatures, pressures, mass_fractions):
+    def _sample_thresholds(
+        cls, temperature_initial, temperature_final, num_points=None
+    ):
+        """Temperatures at evenly-spaced fractions of the rise to the final temperature.
+
+        Parameters
+        ----------
+        temperature_initial : float
+            Temperature at the start of the profile.
+        temperature_final : float
+            Temperature at the end of the profile.
+        num_points : int, optional
+            Number of thresholds; defaults to ``num_sample_points``.
+
+        Returns
+        -------
+        numpy.ndarray
+            The ``num_points`` threshold temperatures, in increasing order.
+
+        """
+        if num_points is None:
+            num_points = cls.num_sample_points
+        return sample_thresholds(num_points, temperature_initial, temperature_final)
+
+    @classmethod
+    def _sample_indices(cls, temperatures, num_points=None):
+        """Find the profile points sampled by :meth:`_sample_profile`.
+
+        Each sample is the first point, after the previous sample, at or above its
+        fraction of the temperature rise. The first crossings of all thresholds
+        are found at once by searching the running maximum of the temperature; a
+        point that crosses several thresholds (a large step) only takes the first
+        of them, and the following ones are looked for after it.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperature at each profile point, or a 2-D array of profiles of
+            equal length indexed as ``[profile, point]``.
+        num_points : int, optional
+            Number of points to sample; defaults to ``num_sample_points``.
+
+        Returns
+        -------
+        numpy.ndarray
+            Indices of the sampled points, shaped ``(..., num_points)``; the
+            length of the profile marks a threshold that is never reached.
+
+        """
+        profile_length = temperatures.shape[-1]
+        thresholds = cls._sample_thresholds(
+            temperatures[..., :1], temperatures[..., -1:], num_points
+        )
+        running_max = np.maximum.accumulate(temperatures, axis=-1)
+        if temperatures.ndim == 1:
+            indices = np.searchsorted(running_max, thresholds)
+        else:
+            indices = np.sum(running_max[..., None, :] < thresholds[..., None], axis=-1)
+
+        for row, profile, row_thresholds in zip(
+            indices.reshape(-1, indices.shape[-1]),
+            temperatures.reshape(-1, profile_length),
+            thresholds.reshape(-1, thresholds.shape[-1]),
+        ):
+            if np.all(np.diff(row) > 0):
+                continue
+            previous = -1
+            for idx in range(len(row)):
+                if row[idx] <= previous:
+                    later = np.flatnonzero(
+                        profile[previous + 1 :] >= row_thresholds[idx]
+                    )
+                    row[idx] = previous + 1 + later[0] if later.size else profile_length
+                if row[idx] >= profile_length:
+                    # the scan stops at a threshold that is never reached
+                    row[idx:] = profile_length
+                    break
+                previous = row[idx]
+
+        return indices
+
+    @classmethod
+    def _sample_profile(cls, temperatures, pressures, mass_fractions, num_points=None):
         """Sample state at evenly-spaced fractions of the total temperature rise.
 
         Samples ``num_sample_points`` rows of ``[temperature, pressure, *mass_fractions]``
         at the points where the temperature first crosses each evenly-spaced fraction
-        of the total rise from the initial to the maximum (final) temperature.
+        of the total rise from the initial to the maximum (final) temperature. Rows
+        for fractions that are never reached are left as zeros.
 
         Parameters
         ----------
         temperatures : numpy.ndarray
-            Temperature at each point along the profile (time or space).
+            Temperature at each point along the profile (time or space), or a 2-D
+            array of profiles of equal length indexed as ``[profile, point]``.
         pressures : numpy.ndarray
-            Pressure at each profile point.
+            Pressure at each profile point, shaped like ``temperatures``.
         mass_fractions : numpy.ndarray
-            Mass fractions indexed as ``[profile_point, species]``.
+            Mass fractions indexed as ``[profile_point, species]``, or
+            ``[profile, profile_point, species]`` for 2-D ``temperatures``.
+        num_points : int, optional
+            Number of points to sample; defaults to ``num_sample_points``.
 
         Returns
         -------
         numpy.ndarray
-            Array of shape ``(num_sample_points, 2 + n_species)``.
+            Array of shape ``(num_points, 2 + n_species)``, or
+            ``(n_profiles, num_points, 2 + n_species)`` for 2-D input.
 
         """
-        delta = 1.0 / cls.num_sample_points
-        deltas = np.arange(delta, 1 + delta, delta)
+        temperatures = np.asarray(temperatures)
+        indices = cls._sample_indices(temperatures, num_points)
+        return cls._gather_samples(indices, temperatures, pressures, mass_fractions)
 
-        n_species = mass_fractions.shape[1]
-        temperature_initial = temperatures[0]
-        temperature_diff = temperatures[-1] - temperature_initial
+    @classmethod
+    def _sample_profile_heat_release(
+        cls,
+        heat_release_rates,
+        temperatures,
+        pressures,
+        mass_fractions,
+        num_points=None,
+    ):
+        """Sample state at evenly-spaced fractions of the heat release rate variation.
 
-        sampled_data = np.zeros((len(deltas), 2 + n_species))
+        Places the points where the heat release rate changes fastest, rather
+        than at fractions of the temperature rise: each sample is the first point
+        at which the cumulative absolute change of the heat release rate along
+        the profile reaches its fraction of the total variation. Most of the
+        variation happens over few points, so points are moved to the next one
+        (or, near the end of the profile, the previous one) as needed to keep
+        them distinct; every point is then sampled as long as the profile has at
+        least ``num_points`` points.
 
-        idx = 0
-        for point in range(len(temperatures)):
-            if idx >= len(deltas):
-                break
-            if temperatures[point] >= temperature_initial + (
-                deltas[idx] * temperature_diff
-            ):
-                sampled_data[idx, 0:2] = [temperatures[point], pressures[point]]
-                sampled_data[idx, 2:] = mass_fractions[point]
-                idx += 1
+        Parameters
+        ----------
+        heat_release_rates : numpy.ndarray
+            Heat release rate at each profile point, shaped like ``temperatures``.
+        temperatures : numpy.ndarray
+            Temperature at each point along the profile (time or space), or a 2-D
+            array of profiles of equal length indexed as ``[profile, point]``.
+        pressures : numpy.ndarray
+            Pressure at each profile point, shaped like ``temperatures``.
+        mass_fractions : numpy.ndarray
+            Mass fractions indexed as ``[profile_point, species]``, or
+            ``[profile, profile_point, species]`` for 2-D ``temperatures``.
+        num_points : int, optional
+            Number of points to sample; defaults to ``num_sample_points``.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape ``(num_points, 2 + n_species)``, or
+            ``(n_profiles, num_points, 2 + n_species)`` for 2-D input.
+
+        """
+        heat_release_rates = np.asarray(heat_release_rates)
+        variation = np.cumsum(np.abs(np.diff(heat_release_rates, axis=-1)), axis=-1)
+        variation = np.concatenate(
+            (np.zeros(variation.shape[:-1] + (1,)), variation), axis=-1
+        )
+        if num_points is None:
+            num_points = cls.num_sample_points
+        profile_length = variation.shape[-1]
+        if profile_length < num_points:
+            indices = cls._sample_indices(variation, num_points)
+        else:
+            thresholds = cls._sample_thresholds(
+                variation[..., :1], variation[..., -1:], num_points
+            )
+            indices = np.sum(variation[..., None, :] < thresholds[..., None], axis=-1)
+            # offsets from consecutive points, made nondecreasing and capped so
+            # the last point is at most the end of the profile
+            offsets = np.arange(num_points)
+            indices = np.minimum(
+                np.maximum.accumulate(indices - offsets, axis=-1),
+                profile_length - num_points,
+            )
+            indices += offsets
+        return cls._gather_samples(
+            indices, np.asarray(temperatures), pressures, mass_fractions
+        )
+
+    @staticmethod
+    def _gather_samples(indices, temperatures, pressures, mass_fractions):
+        """Collect ``[temperature, pressure, *mass_fractions]`` at the sampled indices.
+
+        Rows for indices past the end of the profile are left as zeros.
+        """
+        n_species = mass_fractions.shape[-1]
+        sampled_data = np.zeros(indices.shape + (2 + n_species,))
+
+        reached = indices < temperatures.shape[-1]
+        points = np.nonzero(reached)[:-1] + (indices[reached],)
+        sampled_data[reached, 0] = temperatures[points]
+        sampled_data[reached, 1] = pressures[points]
+        sampled_data[reached, 2:] = mass_fractions[points]
 
         return sampled_data
 
+    def _sample_states(
+        self, temperatures, pressures, mass_fractions, heat_release_rates=None
+    ):
+        """Sample a profile with the number and placement of points of this case.
+
+        Parameters
+        ----------
+        temperatures : numpy.ndarray
+            Temperature at each point along the profile.
+        pressures : numpy.ndarray
+            Pressure at each profile point.
+        mass_fractions : numpy.ndarray
+            Mass fractions indexed as ``[profile_point, species]``.
+        heat_release_rates : numpy.ndarray, optional
+            Heat release rate at each profile point; needed for placement by
+            heat release.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape ``(num_sample_points, 2 + n_species)``.
+
+        """
+        if self.sample_placement == "heat-release":
+            return self._sample_profile_heat_release(
+                heat_release_rates,
+                temperatures,
+                pressures,
+                mass_fractions,
+                self.num_sample_points,
+            )
+        return self._sample_profile(
+            temperatures, pressures, mass_fractions, self.num_sample_points
+        )
+
     @abstractmethod
     def setup_case(self):
         """Initialize the simulation case."""
@@ -165,6 +564,253 @@ class BaseSimulation(ABC):
                 pass
 
 
+class TrajectoryBuffer:
+    """Growable float64 array recording the state at each step of a trajectory.
+
+    Each row holds ``[time, temperature, pressure, *mass_fractions]`` for one
+    step, or ``[temperature, pressure, *mass_fractions]`` when time is not
+    recorded (only the columns needed for sampling). Rows are written into
+    preallocated contiguous storage, which grows by chunks of at least
+    ``TRAJECTORY_CHUNK_ROWS`` rows (a quarter of the current size for longer
+    trajectories). The storage is resized in place where possible, so the
+    recorded rows are normally neither copied while growing nor when trimmed
+    at the end, and the columns are returned as views rather than copies.
+
+    Parameters
+    ----------
+    n_species : int
+        Number of species mass fractions recorded per step
+    max_rows : int, optional
+        Upper bound on the number of rows, if known; the storage never grows
+        past it
+    record_time : bool, optional
+        If ``False``, do not record the time of each step
+
+    """
+
+    def __init__(self, n_species, max_rows=None, record_time=True):
+        self.record_time = record_time
+        self.max_rows = max_rows
+        self._offset = 1 if record_time else 0
+        self._num_rows = 0
+
+        rows = TRAJECTORY_CHUNK_ROWS
+        if max_rows is not None:
+            rows = min(rows, max_rows)
+        self._data = np.empty((rows, self._offset + 2 + n_species))
+
+    def __len__(self):
+        return self._num_rows
+
+    def _resize(self, rows):
+        """Change the storage to ``rows`` rows, keeping the recorded ones."""
+        try:
+            # resizing in place lets the allocator extend (or shrink) the block
+            # without copying; it refuses if views of the data are still alive
+            self._data.resize((rows, self._data.shape[1]))
+        except ValueError:
+            data = np.empty((rows, self._data.shape[1]))
+            data[: self._num_rows] = self._data[: self._num_rows]
+            self._data = data
+
+    def record(self, time, temperature, pressure, mass_fractions):
+        """Record the state at one step, growing the storage if it is full.
+
+        The values are copied into the next row, so ``mass_fractions`` may be a
+        temporary array (such as ``reactor.Y``) that is released afterwards.
+        """
+        if self._num_rows == self._data.shape[0]:
+            rows = self._num_rows + max(TRAJECTORY_CHUNK_ROWS, self._num_rows // 4)
+            if self.max_rows is not None:
+                rows = min(rows, self.max_rows)
+            if rows <= self._num_rows:
+                raise IndexError("Trajectory buffer is full")
+            self._resize(rows)
+
+        row = self._data[self._num_rows]
+        if self.record_time:
+            row[0] = time
+        row[self._offset] = temperature
+        row[self._offset + 1] = pressure
+        row[self._offset + 2 :] = mass_fractions
+        self._num_rows += 1
+
+    def trim(self):
+        """Release the storage beyond the recorded rows."""
+        if self._num_rows < self._data.shape[0]:
+            self._resize(self._num_rows)
+
+    @property
+    def time(self):
+        """numpy.ndarray or None: Time of each step, if recorded."""
+        if not self.record_time:
+            return None
+        return self._data[: self._num_rows, 0]
+
+    @property
+    def temperature(self):
+        """numpy.ndarray: Temperature at each step."""
+        return self._data[: self._num_rows, self._offset]
+
+    @property
+    def pressure(self):
+        """numpy.ndarray: Pressure at each step."""
+        return self._data[: self._num_rows, self._offset + 1]
+
+    @property
+    def mass_fractions(self):
+        """numpy.ndarray: Mass fractions indexed as ``[step, species]``."""
+        return self._data[: self._num_rows, self._offset + 2 :]
+
+
+class _SampleSearch:
+    """States that raised the maximum temperature while searching for one sample.
+
+    Only the last ``ring_size`` of them are kept, in a ring; ``floor`` is the
+    highest temperature among those dropped. ``stopped`` marks a search for the
+    last sample given up before the end of the profile.
+    """
+
+    def __init__(self, ring_size, num_columns):
+        self.rows = np.empty((ring_size, num_columns))
+        self.count = 0
+        self.floor = -np.inf
+        self.stopped = False
+
+    def push(self, temperature, pressure, mass_fractions):
+        """Keep a state, dropping the oldest one if the ring is full."""
+        slot = self.count % len(self.rows)
+        row = self.rows[slot]
+        if self.count >= len(self.rows):
+            self.floor = max(self.floor, row[0])
+        row[0] = temperature
+        row[1] = pressure
+        row[2:] = mass_fractions
+        self.count += 1
+
+    def chronological(self):
+        """Kept states, oldest (and coolest) first."""
+        num = min(self.count, len(self.rows))
+        slots = np.arange(self.count - num, self.count) % len(self.rows)
+        return self.rows[slots]
+
+
+class StreamingSampler:
+    """Sample states at fractions of the temperature rise while integrating.
+
+    Selects the same states as :meth:`BaseSimulation._sample_profile`, where each
+    sample is the first state after the previous sample at or above its fraction
+    of the rise from the initial to the final temperature, without storing the
+    whole profile. The final temperature is only known at the end, so states are
+    selected as they arrive against thresholds from an estimate of it (e.g., the
+    equilibrium temperature). While searching for each sample, the last
+    ``ring_size`` states that raised the maximum temperature are kept; these are
+    the only states that can be a first crossing, so :meth:`resolve` can correct
+    the selection once the final temperature is known, provided it is close
+    enough to the estimate. Memory is O(num_points * ring_size * n_species).
+
+    Parameters
+    ----------
+    num_points : int
+        Number of states to sample
+    n_species : int
+        Number of species mass fractions in each state
+    temperature_estimate : float or None
+        Estimate of the final temperature; if ``None``, the selection can only
+        be resolved from the last states.
+    ring_size : int, optional
+        Number of candidate states kept for each sample
+
+    """
+
+    def __init__(self, num_points, n_species, temperature_estimate, ring_size=None):
+        self.num_points = num_points
+        self.n_species = n_species
+        self.temperature_estimate = temperature_estimate
+        self.ring_size = ring_size if ring_size is not None else STREAMING_RING_SIZE
+
+        self.temperature_initial = None
+        self.temperature_final = None
+        self._thresholds = None
+        self._searches = []
+        self._max = -np.inf
+
+    def _start_search(self):
+        self._searches.append(_SampleSearch(self.ring_size, 2 + self.n_species))
+        self._max = -np.inf
+
+    def record(self, temperature, pressure, mass_fractions):
+        """Consider the state at one step."""
+        if self._thresholds is None:
+            self.temperature_initial = temperature
+            estimate = self.temperature_estimate
+            self._thresholds = sample_thresholds(
+                self.num_points,
+                temperature,
+                estimate if estimate is not None else np.inf,
+            )
+            self._start_search()
+            self._limit = self._thresholds[-1] + STREAMING_MARGIN * abs(
+                self._thresholds[-1] - temperature
+            )
+        self.temperature_final = temperature
+
+        # states no hotter than an earlier one in the same search cannot be a
+        # first crossing, whatever the final temperature
+        search = self._searches[-1]
+        if search.stopped or temperature <= self._max:
+            return
+        self._max = temperature
+
+        search.push(temperature, pressure, mass_fractions)
+        if len(self._searches) < len(self._thresholds):
+            if temperature >= self._thresholds[len(self._searches) - 1]:
+                self._start_search()
+        elif temperature > self._limit:
+            # the search for the last sample carries on past its threshold, in
+            # case the final temperature is higher, up to a small margin
+            search.stopped = True
+
+    def resolve(self):
+        """Select the sampled states for the actual final temperature.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Array of shape ``(num_points, 2 + n_species)``, identical to that of
+            :meth:`BaseSimulation._sample_profile` for the whole profile, or
+            ``None`` if the final temperature is too far from the estimate for
+            the kept states to determine it.
+
+        """
+        thresholds = sample_thresholds(
+            self.num_points, self.temperature_initial, self.temperature_final
+        )
+        sampled_data = np.zeros((len(thresholds), 2 + self.n_species))
+
+        for idx, threshold in enumerate(thresholds):
+            search = self._searches[idx]
+            if threshold <= search.floor:
+                return None
+
+            # the last search started covers the rest of the profile, unless stopped
+            last_search = idx == len(self._searches) - 1
+            states = search.chronological()
+            crossings = np.flatnonzero(states[:, 0] >= threshold)
+            if not crossings.size:
+                # the remaining samples are never reached, as with the full profile
+                return sampled_data if last_search and not search.stopped else None
+
+            sampled_data[idx] = states[crossings[0]]
+            if idx == len(thresholds) - 1:
+                break
+            if last_search or crossings[0] < len(states) - 1:
+                # the next search would start from a different state
+                return None
+
+        return sampled_data
+
+
 class IgnitionSimulation(BaseSimulation):
     """Class for ignition delay simulations
 
@@ -174,15 +820,52 @@ class IgnitionSimulation(BaseSimulation):
         Identifer index for case
     properties : InputIgnition
         Object with initial conditions for simulation
-    model : str
-        Filename for Cantera-format model to be used
+    model : str or ModelSpec
+        Filename for Cantera-format model to be used, or description of an
+        in-memory reduced model
     phase_name : str, optional
         Optional name for phase to load from YAML file (e.g., 'gas').
     path : str, optional
         Path for location of output files
+    archive_profile : bool, optional
+        If ``True``, ``run_case`` also writes the time history to an HDF5 file
+        in ``path``. By default it is only kept in memory.
+    record_time : bool, optional
+        If ``False``, ``run_case`` keeps only the columns needed for sampling
+        (temperature, pressure and mass fractions), and ``process_results``
+        uses the ignition delay found during the integration. Time is always
+        recorded when archiving.
+    stream_samples : bool, optional
+        If ``True``, ``run_case`` selects the sampled states with a
+        :class:`StreamingSampler` as it integrates instead of keeping the time
+        history, unless archiving or placing the samples by heat release. The
+        samples are selected against the equilibrium temperature; if the final temperature turns out too far
+        from it, ``process_results`` integrates the case a second time, keeping
+        the time history.
 
     """
 
+    def __init__(
+        self,
+        idx,
+        properties,
+        model,
+        phase_name="",
+        path="",
+        archive_profile=False,
+        record_time=True,
+        stream_samples=False,
+    ):
+        super().__init__(idx, properties, model, phase_name=phase_name, path=path)
+        self.archive_profile = archive_profile
+        self.record_time = record_time
+        self.stream_samples = stream_samples
+
+        #: Time history recorded by ``run_case``, as a :class:`TrajectoryBuffer`.
+        self.profile = None
+        #: States sampled by ``run_case`` when streaming, as a :class:`StreamingSampler`.
+        self.sampler = None
+
     def setup_case(self):
         """Initialize simulation case."""
         self._setup_gas()
@@ -210,8 +893,11 @@ class IgnitionSimulation(BaseSimulation):
         self.sim = ct.ReactorNet([self.reac])
         self.sim.preconditioner = ct.AdaptivePreconditioner()
 
-        # Set file for later data file
-        self.save_file = os.path.join(self.path, str(self.idx) + ".h5")
+        # Set file for archiving the time history, if requested
+        if self.archive_profile:
+            self.save_file = os.path.join(self.path, str(self.idx) + ".h5")
+        self.profile = None
+        self.sampler = None
         self.sample_points = []
 
         self.ignition_delay = 0.0
@@ -237,6 +923,30 @@ class IgnitionSimulation(BaseSimulation):
         """
         return self.sim.step()
 
+    def _estimate_final_temperature(self):
+        """Estimate the final temperature of the case from chemical equilibrium.
+
+        Equilibrates at constant internal energy and volume, or enthalpy and
+        pressure, and then restores the initial state.
+
+        Returns
+        -------
+        float or None
+            Estimated final temperature, or ``None`` if equilibrium fails.
+
+        """
+        state = self.gas.state
+        try:
+            if self.properties.kind == "constant pressure":
+                self.gas.equilibrate("HP")
+            else:
+                self.gas.equilibrate("UV")
+            return self.gas.T
+        except ct.CanteraError:
+            return None
+        finally:
+            self.gas.state = state
+
     def run_case(self, stop_at_ignition=False, restart=False):
         """Run simulation case set up ``setup_case``.
 
@@ -251,7 +961,7 @@ class IgnitionSimulation(BaseSimulation):
         stop_at_ignition : bool
             If ``True``, stop integration at ignition point, don't save data.
         restart : bool
-            If ``True``, skip if results file exists.
+            If ``True``, skip if the archived results file exists.
 
         Returns
         -------
@@ -260,21 +970,41 @@ class IgnitionSimulation(BaseSimulation):
 
         """
 
-        if restart and os.path.isfile(self.save_file):
+        if restart and self.save_file is not None and os.path.isfile(self.save_file):
             print("Skipped existing case ", self.idx)
             return
 
-        # Collect simulation results in lists, then write in bulk.
-        times = []
-        temperatures = []
-        pressures = []
-        mass_fractions = []
+        # Only samples placed by temperature can be selected while integrating
+        if (
+            self.stream_samples
+            and not self.archive_profile
+            and self.sample_placement == "temperature"
+        ):
+            # Select the sampled states as the integration proceeds
+            self.sampler = StreamingSampler(
+                self.num_sample_points,
+                self.gas.n_species,
+                self._estimate_final_temperature(),
+            )
 
-        def record():
-            times.append(self.sim.time)
-            temperatures.append(self.reac.T)
-            pressures.append(self.reac.phase.P)
-            mass_fractions.append(self.reac.Y.copy())
+            def record():
+                self.sampler.record(self.reac.T, self.reac.phase.P, self.reac.Y)
+
+        else:
+            # Record the state at each step into preallocated storage; only the
+            # temporary mass fraction array read from the reactor is allocated per
+            # step. Without an end time the number of steps is bounded by
+            # ``max_steps``.
+            self.profile = TrajectoryBuffer(
+                self.gas.n_species,
+                max_rows=None if self.time_end else self.max_steps + 1,
+                record_time=self.record_time or self.archive_profile,
+            )
+
+            def record():
+                self.profile.record(
+                    self.sim.time, self.reac.T, self.reac.phase.P, self.reac.Y
+                )
 
         # Save initial conditions
         record()
@@ -351,13 +1081,18 @@ class IgnitionSimulation(BaseSimulation):
                 f"Integration failed for ignition case {self.idx}"
             ) from error
 
-        # Write collected data to HDF5 file
-        with h5py.File(self.save_file, "w") as h5file:
-            grp = h5file.create_group("simulation")
-            grp.create_dataset("time", data=np.array(times))
-            grp.create_dataset("temperature", data=np.array(temperatures))
-            grp.create_dataset("pressure", data=np.array(pressures))
-            grp.create_dataset("mass_fractions", data=np.array(mass_fractions))
+        if self.profile is not None:
+            self.profile.trim()
+
+        # Only write the time history to disk when archiving is requested;
+        # ``process_results`` otherwise samples it directly from memory.
+        if self.save_file is not None:
+            with h5py.File(self.save_file, "w") as h5file:
+                grp = h5file.create_group("simulation")
+                grp.create_dataset("time", data=self.profile.time)
+                grp.create_dataset("temperature", data=self.profile.temperature)
+                grp.create_dataset("pressure", data=self.profile.pressure)
+                grp.create_dataset("mass_fractions", data=self.profile.mass_fractions)
 
         if not ignition_flag:
             logging.error(f"No ignition detected for ignition case {self.idx}")
@@ -420,6 +1155,11 @@ class IgnitionSimulation(BaseSimulation):
     def process_results(self, skip_data=False):
         """Process integration results to sample data
 
+        Uses the states sampled while streaming or the time history kept in
+        memory by ``run_case``; if there are neither (e.g., for a case run
+        earlier and archived), the time history is read from the HDF5 file in
+        ``path``.
+
         Parameters
         ----------
         skip_data : bool
@@ -431,31 +1171,75 @@ class IgnitionSimulation(BaseSimulation):
             Ignition delay, or ignition delay and sampled data
 
         """
-        # Load saved integration results
-        self.save_file = os.path.join(self.path, str(self.idx) + ".h5")
-        with h5py.File(self.save_file, "r") as h5file:
-            grp = h5file["simulation"]
-            times = grp["time"][:]
-            temperatures = grp["temperature"][:]
-            pressures = grp["pressure"][:]
-            mass_fractions = grp["mass_fractions"][:]
+        if self.sampler is not None:
+            if skip_data:
+                return self.ignition_delay
+            sampled_data = self.sampler.resolve()
+            if sampled_data is not None:
+                self.sampled_data = sampled_data
+                return self.ignition_delay, sampled_data
+
+            # Integrate again, keeping the time history this time
+            logging.info(
+                f"Final temperature of ignition case {self.idx} too far from its "
+                "estimate to select the sampled states; running the case again"
+            )
+            self.stream_samples = False
+            try:
+                self.setup_case()
+                self.run_case()
+            finally:
+                self.stream_samples = True
+
+        if self.profile is not None:
+            times = self.profile.time
+            temperatures = self.profile.temperature
+            pressures = self.profile.pressure
+            mass_fractions = self.profile.mass_fractions
+        else:
+            # Load archived integration results
+            self.save_file = os.path.join(self.path, str(self.idx) + ".h5")
+            with h5py.File(self.save_file, "r") as h5file:
+                grp = h5file["simulation"]
+                times = grp["time"][:]
+                temperatures = grp["temperature"][:]
+                pressures = grp["pressure"][:]
+                mass_fractions = grp["mass_fractions"][:]
 
         temperature_initial = temperatures[0]
 
-        # ignition delay: first time the temperature rises 400 K above its initial value
-        self.ignition_delay = 0.0
-        for time, temp in zip(times, temperatures):
-            if temp >= temperature_initial + 400.0:
-                self.ignition_delay = time
-                break
+        # ignition delay: first time the temperature rises 400 K above its initial
+        # value. Without recorded times, keep the one found during integration.
+        if times is not None:
+            self.ignition_delay = 0.0
+            for time, temp in zip(times, temperatures):
+                if temp >= temperature_initial + 400.0:
+                    self.ignition_delay = time
+                    break
 
         if skip_data:
             return self.ignition_delay
 
-        sampled_data = self._sample_profile(temperatures, pressures, mass_fractions)
+        heat_release_rates = None
+        if self.sample_placement == "heat-release":
+            states = ct.SolutionArray(
+                load_solution(self.model, self.phase_name), len(temperatures)
+            )
+            states.TPY = temperatures, pressures, mass_fractions
+            heat_release_rates = states.heat_release_rate
+
+        sampled_data = self._sample_states(
+            temperatures, pressures, mass_fractions, heat_release_rates
+        )
         self.sampled_data = sampled_data
         return self.ignition_delay, sampled_data
 
+    def clean(self):
+        """Release the in-memory results and remove any archived data file."""
+        super().clean()
+        self.profile = None
+        self.sampler = None
+
 
 class FlameSimulation(BaseSimulation):
     """Class for one-dimensional freely-propagating laminar flame simulations.
@@ -468,8 +1252,9 @@ class FlameSimulation(BaseSimulation):
         Identifier index for case
     properties : InputLaminarFlame
         Object with initial conditions for simulation
-    model : str
-        Filename for Cantera-format model to be used
+    model : str or ModelSpec
+        Filename for Cantera-format model to be used, or description of an
+        in-memory reduced model
     phase_name : str, optional
         Optional name for phase to load from YAML file (e.g., 'gas').
     path : str, optional
@@ -622,7 +1407,9 @@ class FlameSimulation(BaseSimulation):
         # flame.Y is indexed [species, grid point]; the sampler expects [point, species]
         mass_fractions = self.flame.Y.T
 
-        sampled_data = self._sample_profile(temperatures, pressures, mass_fractions)
+        sampled_data = self._sample_states(
+            temperatures, pressures, mass_fractions, self.flame.heat_release_rate
+        )
         self.sampled_data = sampled_data
         return self.flame_speed, sampled_data
 
@@ -648,8 +1435,9 @@ class PSRSimulation(BaseSimulation):
         Identifier index for case
     properties : InputPSR
         Object with inlet conditions for the simulation
-    model : str
-        Filename for Cantera-format model to be used
+    model : str or ModelSpec
+        Filename for Cantera-format model to be used, or description of an
+        in-memory reduced model
     phase_name : str, optional
         Optional name for phase to load from YAML file (e.g., 'gas').
     path : str, optional
@@ -0,0 +1,24 @@
+"""Reference implementations shared by the tests."""
+
+import numpy as np
+
+
+def loop_numerator(state, solution, signed=False):
+    """Direct interaction numerators found one species at a time, for reference."""
+    solution.TPY = state
+    net_stoich = solution.product_stoich_coeffs - solution.reactant_stoich_coeffs
+    flags = (solution.product_stoich_coeffs != 0) | (
+        solution.reactant_stoich_coeffs != 0
+    )
+    valid_reactions = np.where(solution.net_rates_of_progress != 0)[0]
+    base_rates = (
+        net_stoich[:, valid_reactions] * solution.net_rates_of_progress[valid_reactions]
+    )
+    if not signed:
+        base_rates = np.abs(base_rates)
+    numerator = np.zeros((solution.n_species, solution.n_species))
+    for sp_b in range(solution.n_species):
+        numerator[:, sp_b] += np.sum(
+            base_rates[:, np.where(flags[sp_b, valid_reactions])[0]], axis=1
+        )
+    return np.abs(numerator), base_rates
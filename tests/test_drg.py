@@ -4,11 +4,15 @@ import os
 import pathlib
 
 import numpy as np
+import scipy.sparse
 import networkx as nx
 import cantera as ct
 
 from pymars.sampling import data_files, InputIgnition
 from pymars.drg import graph_search, create_drg_matrix, run_drg, trim_drg, reduce_drg
+from pymars.drg import get_critical_thresholds, create_drg_matrices, reachable_species
+
+from helpers import loop_numerator
 
 # Taken from http://stackoverflow.com/a/22726782/1569494
 try:
@@ -168,6 +172,58 @@ class TestCreateDRGMatrix:
         )
         assert np.allclose(correct, matrix, rtol=1e-3)
 
+    def test_matches_species_loop(self):
+        """The matrix product gives the same coefficients as summing per species."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        for state in data[::4]:
+            state = (state[0], state[1], state[2:])
+            numerator, base_rates = loop_numerator(state, model)
+            denominator = np.sum(base_rates, axis=1)[:, np.newaxis]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                expected = np.where(denominator != 0, numerator / denominator, 0)
+            np.fill_diagonal(expected, 0.0)
+
+            matrix = create_drg_matrix(state, model)
+            assert np.allclose(matrix, expected, rtol=1e-12, atol=0.0)
+
+
+class TestCreateDRGMatrices:
+    """Tests for create_drg_matrices method"""
+
+    def test_chunks_match_states(self):
+        """Matrices built in chunks match those built one state at a time."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        matrices = list(create_drg_matrices(data, model, chunk_size=7))
+
+        assert len(matrices) == data.shape[0]
+        for state, matrix in zip(data, matrices):
+            expected = create_drg_matrix((state[0], state[1], state[2:]), model)
+            assert np.allclose(matrix, expected, rtol=1e-12, atol=0.0)
+
+    def test_sparse_matches_dense(self):
+        """Sparse matrices hold the same coefficients as the dense ones."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        dense = create_drg_matrices(data, model)
+        sparse = create_drg_matrices(data, model, sparse=True)
+        for dense_matrix, sparse_matrix in zip(dense, sparse):
+            assert scipy.sparse.issparse(sparse_matrix)
+            assert np.all(sparse_matrix.data != 0.0)
+            assert np.allclose(
+                sparse_matrix.toarray(), dense_matrix, rtol=1e-10, atol=0.0
+            )
+
 
 class TestTrimDRG:
     """Tests for trim_drg method"""
@@ -254,6 +310,56 @@ class TestTrimDRG:
 
         assert check_equal(reached, ["F", "P"])
 
+    def test_sparse_matrix(self):
+        """Sparse adjacency matrices are trimmed the same as dense ones."""
+        matrix = np.array(
+            [
+                [0, 0.5, 0, 0, 0, 0],
+                [0, 0, 0.15, 0.9, 0, 0],
+                [0, 0.5, 0, 0.5, 0, 0],
+                [0, 0.9, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0, 1.0],
+                [0, 0, 0, 0, 1.0, 0],
+            ]
+        )
+        names = ["A", "B", "C", "D", "E", "F"]
+        for threshold in [0.0, 0.1, 0.2, 0.6, 1.0]:
+            for targets in [["A"], ["E"], ["C", "E"]]:
+                assert check_equal(
+                    trim_drg(scipy.sparse.csr_array(matrix), names, targets, threshold),
+                    trim_drg(matrix, names, targets, threshold),
+                )
+
+    def test_zero_threshold(self):
+        """Zero entries are never edges, even with a zero threshold."""
+        matrix = np.array([[0, 0.5, 0], [0, 0, 0], [0, 0, 0]])
+        reached = trim_drg(matrix, ["A", "B", "C"], ["A"], 0.0)
+        assert check_equal(reached, ["A", "B"])
+
+
+class TestReachableSpecies:
+    def test_multiple_targets(self):
+        adjacency = scipy.sparse.csr_array(
+            np.array(
+                [
+                    [0, 1, 0, 0, 0],
+                    [0, 0, 1, 0, 0],
+                    [0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 1],
+                    [1, 0, 0, 0, 0],
+                ],
+                dtype=bool,
+            )
+        )
+        assert reachable_species(adjacency, [1]).tolist() == [
+            False,
+            True,
+            True,
+            False,
+            False,
+        ]
+        assert reachable_species(adjacency, [1, 3]).all()
+
 
 class TestGraphSearch:
     """Tests for graph_search method"""
@@ -484,6 +590,90 @@ class TestGraphSearch:
         assert [n not in essential_nodes for n in ["B", "G", "J", "K", "L", "M", "N"]]
 
 
+class TestGetCriticalThresholds:
+    def test_simple(self):
+        """Widest path value is the smallest edge along the best path."""
+        # A -> B (0.5), B -> C (0.9), A -> C (0.2), D -> A (1.0)
+        matrix = np.array(
+            [
+                [0.0, 0.5, 0.2, 0.0],
+                [0.0, 0.0, 0.9, 0.0],
+                [0.0, 0.0, 0.0, 0.0],
+                [1.0, 0.0, 0.0, 0.0],
+            ]
+        )
+        critical = get_critical_thresholds(["A", "B", "C", "D"], ["A"], [matrix])
+        assert critical == {"A": np.inf, "B": 0.5, "C": 0.5, "D": 0.0}
+
+    def test_max_over_states(self):
+        matrices = [
+            np.array([[0.0, 0.3], [0.0, 0.0]]),
+            np.array([[0.0, 0.1], [0.0, 0.0]]),
+        ]
+        critical = get_critical_thresholds(["A", "B"], ["A"], matrices)
+        assert critical["B"] == 0.3
+
+    def test_matches_graph_search(self):
+        """Gives the same retained species as searching the trimmed graphs."""
+        rng = np.random.default_rng(0)
+        species_names = [f"S{idx}" for idx in range(15)]
+        targets = ["S0", "S3"]
+        matrices = []
+        for _ in range(4):
+            matrix = rng.random((15, 15)) * (rng.random((15, 15)) < 0.2)
+            np.fill_diagonal(matrix, 0.0)
+            matrices.append(matrix)
+
+        critical = get_critical_thresholds(species_names, targets, matrices)
+        for threshold in np.unique(np.concatenate(matrices)):
+            if threshold == 0.0:
+                continue
+            reached = set()
+            for matrix in matrices:
+                reached.update(trim_drg(matrix, species_names, targets, threshold))
+            assert reached == {sp for sp in species_names if critical[sp] >= threshold}
+
+    def test_gri_matches_graph_search(self):
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        matrices = [
+            create_drg_matrix((state[0], state[1], state[2:]), model) for state in data
+        ]
+        targets = ["CH4", "O2"]
+
+        critical = get_critical_thresholds(model.species_names, targets, matrices)
+        for threshold in [0.01, 0.05, 0.14, 0.3, 0.6]:
+            reached = set()
+            for matrix in matrices:
+                reached.update(
+                    trim_drg(matrix, model.species_names, targets, threshold)
+                )
+            assert reached == {
+                sp for sp in model.species_names if critical[sp] >= threshold
+            }
+
+    def test_sparse_matches_dense(self):
+        """The search over sparse matrices finds the same widest paths."""
+        rng = np.random.default_rng(1)
+        species_names = [f"S{idx}" for idx in range(30)]
+        matrices = []
+        for _ in range(3):
+            matrix = rng.random((30, 30)) * (rng.random((30, 30)) < 0.1)
+            np.fill_diagonal(matrix, 0.0)
+            matrices.append(matrix)
+
+        dense = get_critical_thresholds(species_names, ["S0", "S5"], matrices)
+        sparse = get_critical_thresholds(
+            species_names,
+            ["S0", "S5"],
+            [scipy.sparse.csr_array(matrix) for matrix in matrices],
+        )
+        assert dense == sparse
+
+
 class TestReduceDRG:
     def test_gri_reduction_multiple_cases(self):
         """Tests reduce_drg method with multiple cases"""
@@ -522,10 +712,9 @@ class TestReduceDRG:
         with TemporaryDirectory() as temp_dir:
             reduced_model = reduce_drg(
                 model_file,
-                ["CH4", "O2"],
                 ["N2"],
                 0.14,
-                matrices,
+                get_critical_thresholds(model.species_names, ["CH4", "O2"], matrices),
                 conditions,
                 np.array([1.066766136745876281e00, 4.334773545084597696e-02]),
                 previous_model=None,
@@ -609,10 +798,9 @@ class TestReduceDRG:
         with TemporaryDirectory() as temp_dir:
             reduced_model = reduce_drg(
                 model_file,
-                ["CH4", "O2"],
                 ["N2"],
                 0.14,
-                matrices,
+                get_critical_thresholds(model.species_names, ["CH4", "O2"], matrices),
                 conditions,
                 np.array([1.066766136745876281e00]),
                 previous_model=None,
@@ -725,3 +913,45 @@ class TestRunDRG:
         )
         assert reduced_model.model.n_reactions == expected_model.n_reactions
         assert round(reduced_model.error, 2) == 3.64
+
+    def test_gri_reduction_sparse(self, monkeypatch):
+        """Tests driver run_drg method using sparse matrices"""
+        monkeypatch.setattr("pymars.drg.SPARSE_MIN_SPECIES", 0)
+        conditions = [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for temperature in [1000.0, 1200.0]
+        ]
+        data_files["output_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_output.txt")
+        )
+        data_files["data_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_data.dat")
+        )
+
+        with TemporaryDirectory() as temp_dir:
+            reduced_model = run_drg(
+                "gri30.yaml",
+                conditions,
+                [],
+                [],
+                5.0,
+                ["CH4", "O2"],
+                ["N2"],
+                num_threads=1,
+                path=temp_dir,
+            )
+
+        expected_model = ct.Solution(
+            relative_location(os.path.join("assets", "drg_gri30.yaml"))
+        )
+        assert check_equal(
+            reduced_model.model.species_names, expected_model.species_names
+        )
+        assert round(reduced_model.error, 2) == 3.64
@@ -5,12 +5,17 @@ import pathlib
 
 import pytest
 import numpy as np
+import scipy.sparse
 import cantera as ct
 import networkx as nx
 
 from pymars.sampling import data_files, InputIgnition, InputPSR, InputLaminarFlame
 from pymars.drgep import graph_search_drgep, get_importance_coeffs
-from pymars.drgep import run_drgep
+from pymars.drgep import run_drgep, create_drgep_matrix, create_drgep_matrices
+from pymars import drgep
+from pymars.reduce_model import deduplicate_states
+
+from helpers import loop_numerator
 
 # Taken from http://stackoverflow.com/a/22726782/1569494
 try:
@@ -61,6 +66,65 @@ def check_equal(list1, list2):
     return len(list1) == len(list2) and sorted(list1) == sorted(list2)
 
 
+class TestCreateDRGEPMatrix:
+    """Tests for create_drgep_matrix method"""
+
+    def test_matches_species_loop(self):
+        """The matrix product gives the same coefficients as summing per species."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        for state in data[::4]:
+            state = (state[0], state[1], state[2:])
+            numerator, base_rates = loop_numerator(state, model, signed=True)
+            denominator = np.maximum(
+                np.sum(np.maximum(0.0, base_rates), axis=1),
+                np.sum(np.maximum(0.0, -base_rates), axis=1),
+            )[:, np.newaxis]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                expected = np.where(denominator != 0, numerator / denominator, 0)
+            np.fill_diagonal(expected, 0.0)
+
+            matrix = create_drgep_matrix(state, model)
+            assert np.allclose(matrix, expected, rtol=1e-12, atol=0.0)
+
+
+class TestCreateDRGEPMatrices:
+    """Tests for create_drgep_matrices method"""
+
+    def test_chunks_match_states(self):
+        """Matrices built in chunks match those built one state at a time."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        matrices = list(create_drgep_matrices(data, model, chunk_size=7))
+
+        assert len(matrices) == data.shape[0]
+        for state, matrix in zip(data, matrices):
+            expected = create_drgep_matrix((state[0], state[1], state[2:]), model)
+            assert np.allclose(matrix, expected, rtol=1e-12, atol=0.0)
+
+    def test_sparse_matches_dense(self):
+        """Sparse matrices hold the same coefficients as the dense ones."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        dense = create_drgep_matrices(data, model)
+        sparse = create_drgep_matrices(data, model, sparse=True)
+        for dense_matrix, sparse_matrix in zip(dense, sparse):
+            assert scipy.sparse.issparse(sparse_matrix)
+            assert np.all(sparse_matrix.data != 0.0)
+            assert np.allclose(
+                sparse_matrix.toarray(), dense_matrix, rtol=1e-10, atol=0.0
+            )
+
+
 class TestGraphSearchDRGEP:
     def test_DRGEP_GraphSearchSimple(self):
         graph = nx.DiGraph()
@@ -436,6 +500,41 @@ class TestGetImportanceCoeffs:
         assert coefficients["A"] == 1.0
         assert coefficients["B"] == 0.6
 
+    def _networkx_coefficients(self, species_names, target_species, matrices):
+        """Importance coefficients from a networkx graph search, for reference."""
+        coefficients = {species: 0.0 for species in species_names}
+        for matrix in matrices:
+            graph = nx.DiGraph(matrix)
+            nx.relabel_nodes(graph, dict(enumerate(species_names)), copy=False)
+            for species, value in graph_search_drgep(graph, target_species).items():
+                coefficients[species] = max(coefficients[species], value)
+        return coefficients
+
+    def _gri_matrices(self):
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        return model, list(create_drgep_matrices(data, model))
+
+    def test_matches_networkx_search(self):
+        """Same coefficients as searching networkx graphs from each target."""
+        model, matrices = self._gri_matrices()
+        targets = ["CH4", "O2", "NO"]
+
+        expected = self._networkx_coefficients(model.species_names, targets, matrices)
+        coefficients = get_importance_coeffs(model.species_names, targets, matrices)
+        for species in model.species_names:
+            assert coefficients[species] == pytest.approx(
+                expected[species], rel=1e-12, abs=0.0
+            )
+
+        sparse_coefficients = get_importance_coeffs(
+            model.species_names, targets, [scipy.sparse.csr_array(m) for m in matrices]
+        )
+        assert sparse_coefficients == pytest.approx(coefficients, rel=1e-12, abs=0.0)
+
 
 class TestRunDRGEP:
     def test_gri_reduction(self):
@@ -495,6 +594,63 @@ class TestRunDRGEP:
         assert reduced_model.model.n_reactions == expected_model.n_reactions
         assert round(reduced_model.error, 2) == 3.22
 
+    def test_gri_reduction_bisect(self, monkeypatch):
+        """Tests driver run_drgep method bisecting over the threshold breakpoints"""
+        tolerances = []
+
+        def recording_deduplicate_states(sampled_data, tolerance):
+            tolerances.append(tolerance)
+            return deduplicate_states(sampled_data, tolerance)
+
+        monkeypatch.setattr(drgep, "deduplicate_states", recording_deduplicate_states)
+        conditions = [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=1000.0,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            ),
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=1200.0,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            ),
+        ]
+        error = 5.0
+
+        with TemporaryDirectory() as temp_dir:
+            reduced_model = run_drgep(
+                "gri30.yaml",
+                conditions,
+                [],
+                [],
+                error,
+                ["CH4", "O2"],
+                ["N2"],
+                num_threads=1,
+                path=temp_dir,
+                threshold_search="bisect",
+                state_tolerance=0.01,
+            )
+
+        # the sampled states are all distinct at this tolerance
+        assert tolerances == [0.01]
+        expected_model = ct.Solution(
+            relative_location(os.path.join("assets", "drgep_gri30.yaml"))
+        )
+
+        # same model as found by the fixed threshold steps
+        assert check_equal(
+            reduced_model.model.species_names, expected_model.species_names
+        )
+        assert reduced_model.model.n_reactions == expected_model.n_reactions
+        assert round(reduced_model.error, 2) == 3.22
+
     def test_flame_reduction(self, monkeypatch):
         """Tests a DRGEP reduction driven by laminar flame speed (no ignition)."""
         model_file = "h2o2.yaml"
@@ -5,11 +5,14 @@ import pathlib
 
 
 import numpy as np
+import scipy.sparse
 import networkx as nx
 import cantera as ct
 
 from pymars.sampling import data_files, InputIgnition
-from pymars.pfa import graph_search, create_pfa_matrix, run_pfa, reduce_pfa
+from pymars.pfa import graph_search, create_pfa_matrix, run_pfa, reduce_pfa, trim_pfa
+from pymars.pfa import create_pfa_matrices
+from pymars.drg import get_critical_thresholds
 
 # Taken from http://stackoverflow.com/a/22726782/1569494
 try:
@@ -60,6 +63,48 @@ def check_equal(list1, list2):
     return len(list1) == len(list2) and sorted(list1) == sorted(list2)
 
 
+def loop_matrix(state, solution):
+    """PFA adjacency matrix found one species at a time, for reference."""
+    solution.TPY = state
+    net_stoich = solution.product_stoich_coeffs - solution.reactant_stoich_coeffs
+    flags = (solution.product_stoich_coeffs != 0) | (
+        solution.reactant_stoich_coeffs != 0
+    )
+    rates = solution.net_rates_of_progress
+    valid_reactions = np.where(rates != 0)[0]
+    base_rates = net_stoich[:, valid_reactions] * rates[valid_reactions]
+
+    production_AB = np.zeros((solution.n_species, solution.n_species))
+    consumption_AB = np.zeros((solution.n_species, solution.n_species))
+    for sp_b in range(solution.n_species):
+        reactions = np.where(flags[sp_b, valid_reactions])[0]
+        production_AB[:, sp_b] = np.sum(np.maximum(base_rates[:, reactions], 0), axis=1)
+        consumption_AB[:, sp_b] = np.sum(
+            np.maximum(-base_rates[:, reactions], 0), axis=1
+        )
+    denominator = np.maximum(
+        np.sum(np.maximum(base_rates, 0), axis=1),
+        np.sum(np.maximum(-base_rates, 0), axis=1),
+    )[:, np.newaxis]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_pro_AB1 = np.where(denominator != 0, production_AB / denominator, 0)
+        r_con_AB1 = np.where(denominator != 0, consumption_AB / denominator, 0)
+
+    r_pro_AB2 = np.zeros((solution.n_species, solution.n_species))
+    r_con_AB2 = np.zeros((solution.n_species, solution.n_species))
+    for sp_m in range(solution.n_species):
+        for r_AB1, r_AB2 in ((r_pro_AB1, r_pro_AB2), (r_con_AB1, r_con_AB2)):
+            to_m = r_AB1[:, sp_m].copy()
+            from_m = r_AB1[sp_m, :].copy()
+            to_m[sp_m] = 0
+            from_m[sp_m] = 0
+            r_AB2 += np.outer(to_m, from_m)
+
+    matrix = r_pro_AB1 + r_con_AB1 + r_pro_AB2 + r_con_AB2
+    np.fill_diagonal(matrix, 0.0)
+    return matrix
+
+
 class TestCreatePFAMatrix:
     """Tests for create_pfa_matrix method"""
 
@@ -177,6 +222,52 @@ class TestCreatePFAMatrix:
         )
         assert np.allclose(correct, matrix, rtol=1e-3)
 
+    def test_matches_species_loop(self):
+        """The matrix products give the same coefficients as summing per species."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        for state in data[::4]:
+            state = (state[0], state[1], state[2:])
+            matrix = create_pfa_matrix(state, model)
+            assert np.allclose(matrix, loop_matrix(state, model), rtol=1e-12, atol=0.0)
+
+
+class TestCreatePFAMatrices:
+    """Tests for create_pfa_matrices method"""
+
+    def test_chunks_match_states(self):
+        """Matrices built in chunks match those built one state at a time."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        matrices = list(create_pfa_matrices(data, model, chunk_size=7))
+
+        assert len(matrices) == data.shape[0]
+        for state, matrix in zip(data, matrices):
+            expected = create_pfa_matrix((state[0], state[1], state[2:]), model)
+            assert np.allclose(matrix, expected, rtol=1e-12, atol=0.0)
+
+    def test_sparse_matches_dense(self):
+        """Sparse matrices hold the same coefficients as the dense ones."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        dense = create_pfa_matrices(data, model)
+        sparse = create_pfa_matrices(data, model, sparse=True)
+        for dense_matrix, sparse_matrix in zip(dense, sparse):
+            assert scipy.sparse.issparse(sparse_matrix)
+            assert np.all(sparse_matrix.data != 0.0)
+            assert np.allclose(
+                sparse_matrix.toarray(), dense_matrix, rtol=1e-10, atol=0.0
+            )
+
 
 class TestGraphSearch:
     """Tests for graph_search method"""
@@ -407,6 +498,31 @@ class TestGraphSearch:
         assert [n not in essential_nodes for n in ["B", "G", "J", "K", "L", "M", "N"]]
 
 
+class TestCriticalThresholds:
+    def test_gri_matches_graph_search(self):
+        """Critical thresholds give the same species as searching trimmed graphs."""
+        model = ct.Solution("gri30.yaml")
+        data = np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+        matrices = [
+            create_pfa_matrix((state[0], state[1], state[2:]), model) for state in data
+        ]
+        targets = ["CH4", "O2"]
+
+        critical = get_critical_thresholds(model.species_names, targets, matrices)
+        for threshold in [0.01, 0.05, 0.14, 0.3, 0.6, 1.5]:
+            reached = set()
+            for matrix in matrices:
+                reached.update(
+                    trim_pfa(matrix, model.species_names, targets, threshold)
+                )
+            assert reached == {
+                sp for sp in model.species_names if critical[sp] >= threshold
+            }
+
+
 class TestReducePFA:
     def test_gri_reduction_multiple_thresholds(self):
         """Tests reduce_pfa method with multiple thresholds"""
@@ -445,10 +561,9 @@ class TestReducePFA:
         with TemporaryDirectory() as temp_dir:
             reduced_model = reduce_pfa(
                 model_file,
-                ["CH4", "O2"],
                 ["N2"],
                 0.14,
-                matrices,
+                get_critical_thresholds(model.species_names, ["CH4", "O2"], matrices),
                 conditions,
                 np.array([1.066766136745876281e00, 4.334773545084597696e-02]),
                 previous_model=None,
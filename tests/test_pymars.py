@@ -1,6 +1,9 @@
 """Tests for the top-level pymars input parsing."""
 
+import pytest
+
 from pymars.pymars import parse_inputs
+from pymars.reduce_model import STATE_TOLERANCE
 
 
 def _base_inputs(conditions, **overrides):
@@ -125,3 +128,96 @@ class TestMinFlameSpeedInput:
         input_dict["min-flame-speed"] = 0.2
         inputs = parse_inputs(input_dict)
         assert inputs.min_flame_speed == 0.2
+
+
+class TestThresholdSearchInput:
+    """The ``threshold-search`` input is parsed and checked."""
+
+    def _ignition(self):
+        return [
+            {
+                "kind": "constant volume",
+                "pressure": 1.0,
+                "temperature": 1000.0,
+                "equivalence-ratio": 1.0,
+                "fuel": {"CH4": 1.0},
+                "oxidizer": {"O2": 1.0, "N2": 3.76},
+            }
+        ]
+
+    def test_default_is_linear(self):
+        inputs = parse_inputs(_base_inputs(self._ignition()))
+        assert inputs.threshold_search == "linear"
+
+    def test_bisect(self):
+        input_dict = _base_inputs(self._ignition(), **{"threshold-search": "bisect"})
+        inputs = parse_inputs(input_dict)
+        assert inputs.threshold_search == "bisect"
+
+    def test_unknown_search_rejected(self):
+        input_dict = _base_inputs(self._ignition(), **{"threshold-search": "random"})
+        with pytest.raises(AssertionError):
+            parse_inputs(input_dict)
+
+
+class TestStateToleranceInput:
+    """The ``state-tolerance`` input is parsed and checked."""
+
+    def _ignition(self):
+        return [
+            {
+                "kind": "constant volume",
+                "pressure": 1.0,
+                "temperature": 1000.0,
+                "equivalence-ratio": 1.0,
+                "fuel": {"CH4": 1.0},
+                "oxidizer": {"O2": 1.0, "N2": 3.76},
+            }
+        ]
+
+    def test_default(self):
+        inputs = parse_inputs(_base_inputs(self._ignition()))
+        assert inputs.state_tolerance == STATE_TOLERANCE
+
+    def test_override_from_input_file(self):
+        input_dict = _base_inputs(self._ignition(), **{"state-tolerance": 0.01})
+        assert parse_inputs(input_dict).state_tolerance == 0.01
+
+    @pytest.mark.parametrize("tolerance", [-0.01, "small"])
+    def test_invalid_tolerance_rejected(self, tolerance):
+        input_dict = _base_inputs(self._ignition(), **{"state-tolerance": tolerance})
+        with pytest.raises(AssertionError):
+            parse_inputs(input_dict)
+
+
+class TestSensitivityTypeInput:
+    """The ``sensitivity-type`` input is parsed and checked."""
+
+    def _ignition(self):
+        return [
+            {
+                "kind": "constant volume",
+                "pressure": 1.0,
+                "temperature": 1000.0,
+                "equivalence-ratio": 1.0,
+                "fuel": {"CH4": 1.0},
+                "oxidizer": {"O2": 1.0, "N2": 3.76},
+            }
+        ]
+
+    @pytest.mark.parametrize("sensitivity_type", ["lazy-greedy", "batch"])
+    def test_sensitivity_types(self, sensitivity_type):
+        input_dict = _base_inputs(
+            self._ignition(),
+            **{"sensitivity-analysis": True, "sensitivity-type": sensitivity_type},
+        )
+        inputs = parse_inputs(input_dict)
+        assert inputs.sensitivity_type == sensitivity_type
+
+    def test_unknown_type_rejected(self):
+        input_dict = _base_inputs(
+            self._ignition(),
+            **{"sensitivity-analysis": True, "sensitivity-type": "random"},
+        )
+        with pytest.raises(AssertionError):
+            parse_inputs(input_dict)
@@ -3,9 +3,20 @@
 import os
 import pathlib
 
+import numpy as np
 import pytest
+import cantera as ct
 
-from pymars.reduce_model import trim
+from pymars.reduce_model import trim, ModelSpec, ReducedModel, Trimmer
+from pymars import reduce_model
+from pymars.reduce_model import threshold_breakpoints, bisect_threshold
+from pymars.reduce_model import get_rates_of_progress, get_participation_matrices
+from pymars.reduce_model import deduplicate_states
+from pymars.drg import create_drg_matrices, get_critical_thresholds
+from pymars.drgep import create_drgep_matrices, get_importance_coeffs
+from pymars.pfa import create_pfa_matrices
+from pymars.sampling import InputIgnition
+from pymars.simulation import load_solution, IgnitionSimulation
 
 
 def relative_location(file):
@@ -202,3 +213,356 @@ class TestTrim:
 
         assert reduced_model.n_species == 4
         assert reduced_model.n_reactions == 1
+
+    def test_solution_input_not_modified(self):
+        """Trimming a loaded model leaves its third-body efficiencies untouched."""
+        initial_model = load_solution("gri30.yaml")
+        reduced_model = trim(initial_model, ["AR"], "reduced_gri30.yaml")
+
+        assert initial_model.n_species == 53
+        assert any(
+            "AR" in rxn.third_body.efficiencies
+            for rxn in initial_model.reactions()
+            if rxn.third_body is not None
+        )
+        assert not any(
+            "AR" in rxn.third_body.efficiencies
+            for rxn in reduced_model.reactions()
+            if rxn.third_body is not None
+        )
+
+
+def loop_reactions(solution, exclusion_list):
+    """Reactions kept by trimming, found by searching species lists, for reference.
+
+    Returns the equation and third-body efficiencies of each reaction kept.
+    """
+    final_species_names = [
+        sp for sp in solution.species_names if sp not in exclusion_list
+    ]
+    reactions = []
+    for reaction in solution.reactions():
+        tb = reaction.third_body
+        if tb is not None and not tb.default_efficiency:
+            if (
+                len(tb.efficiencies) == 1
+                and list(tb.efficiencies.keys())[0] in exclusion_list
+            ):
+                continue
+        reaction_species = list(reaction.products) + list(reaction.reactants)
+        if all(sp in final_species_names for sp in reaction_species):
+            efficiencies = {}
+            if tb is not None:
+                efficiencies = {
+                    sp: val
+                    for sp, val in tb.efficiencies.items()
+                    if sp in final_species_names
+                }
+            reactions.append((reaction.equation, efficiencies))
+    return reactions
+
+
+class TestTrimmer:
+    @pytest.mark.parametrize(
+        "model, phase_name", [("gri30.yaml", ""), ("model-third-bodies.yaml", "")]
+    )
+    def test_matches_species_loop(self, model, phase_name):
+        """Masks keep the same species, reactions and efficiencies as list searches."""
+        if model.startswith("model-"):
+            model = relative_location(os.path.join("assets", model))
+        solution = ct.Solution(model, phase_name)
+        trimmer = Trimmer(solution)
+
+        rng = np.random.default_rng(0)
+        exclusion_lists = [["ar"], ["he", "h2o"]] + [
+            list(rng.choice(solution.species_names, num_removed, replace=False))
+            for num_removed in [0, 1, 3, 10, solution.n_species // 2]
+            if num_removed <= solution.n_species
+        ]
+        for exclusion_list in exclusion_lists:
+            reduced_model = trimmer.trim(exclusion_list + ["NOT_A_SPECIES"])
+
+            assert reduced_model.species_names == [
+                sp for sp in solution.species_names if sp not in exclusion_list
+            ]
+            reactions = [
+                (
+                    rxn.equation,
+                    rxn.third_body.efficiencies if rxn.third_body is not None else {},
+                )
+                for rxn in reduced_model.reactions()
+            ]
+            assert reactions == loop_reactions(solution, exclusion_list)
+
+    def test_reused(self):
+        """One trimmer serves many exclusion lists without modifying its model."""
+        solution = ct.Solution("gri30.yaml")
+        trimmer = Trimmer(solution)
+        first = trimmer.trim(["AR", "CH4"], "first")
+        second = trimmer.trim(["C2H6"], "second")
+
+        assert first.name == "first"
+        assert first.n_species == 51
+        assert second.n_species == 52
+        assert "AR" in second.reactions()[0].third_body.efficiencies
+        assert solution.n_species == 53
+        assert solution.n_reactions == 325
+
+
+class TestModelSpec:
+    def test_remove(self):
+        spec = ModelSpec("gri30.yaml")
+        reduced_spec = spec.remove(["CH4", "O2"])
+
+        assert spec.exclusion_list == ()
+        assert reduced_spec == ModelSpec("gri30.yaml", ("CH4", "O2"))
+        assert reduced_spec.remove(["N2"]).exclusion_list == ("CH4", "O2", "N2")
+
+    def test_load_matches_trim(self):
+        """Building a model from its specification matches trimming the file."""
+        exclusion_list = ["CH4", "O2", "N2"]
+        expected = trim("gri30.yaml", exclusion_list, "reduced_gri30.yaml")
+        reduced_model = load_solution(ModelSpec("gri30.yaml", tuple(exclusion_list)))
+
+        assert reduced_model.species_names == expected.species_names
+        assert reduced_model.n_reactions == expected.n_reactions
+        assert reduced_model.name == "reduced_gri30"
+        # built once per process, like any other model
+        assert reduced_model is load_solution(
+            ModelSpec("gri30.yaml", ("N2", "O2", "CH4"))
+        )
+
+
+class TestThresholdSearch:
+    # critical thresholds: each species is retained up to and including its value
+    critical = {"A": 1.0, "B": 0.5, "C": 0.5, "D": 0.2, "E": 0.01, "F": 0.0}
+
+    def test_threshold_breakpoints(self):
+        assert threshold_breakpoints(self.critical) == [0.01, 0.2, 0.5, 1.0]
+
+    def test_threshold_breakpoints_safe(self):
+        """Species always retained do not change the retained set."""
+        assert threshold_breakpoints(self.critical, ["A", "D"]) == [0.01, 0.5]
+        assert threshold_breakpoints({"A": np.inf, "B": 0.0}) == []
+
+    def test_bisect_threshold(self):
+        """Largest breakpoint meeting the error limit, with few evaluations."""
+        breakpoints = list(np.linspace(0.01, 1.0, 100))
+        evaluated = []
+
+        def reduce(threshold):
+            evaluated.append(threshold)
+            # error increases with the threshold
+            return ReducedModel(
+                model=load_solution("h2o2.yaml"), error=100.0 * threshold
+            )
+
+        threshold, reduced_model = bisect_threshold(
+            breakpoints, reduce, 42.5, ReducedModel(model=load_solution("h2o2.yaml"))
+        )
+        assert threshold == pytest.approx(0.42)
+        assert reduced_model.error == pytest.approx(42.0)
+        assert len(evaluated) <= 7
+
+    def test_bisect_threshold_no_viable_model(self):
+        """The starting model is kept if no breakpoint meets the error limit."""
+        starting_model = ReducedModel(model=load_solution("h2o2.yaml"))
+        threshold, reduced_model = bisect_threshold(
+            [0.1, 0.2],
+            lambda threshold: ReducedModel(
+                model=load_solution("h2o2.yaml"), error=10.0
+            ),
+            1.0,
+            starting_model,
+        )
+        assert threshold == 0.0
+        assert reduced_model is starting_model
+
+
+class TestGetRatesOfProgress:
+    def _data(self):
+        return np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+
+    def test_matches_states(self):
+        data = self._data()
+        model = ct.Solution("gri30.yaml")
+        chunks = list(get_rates_of_progress(data, model, chunk_size=15))
+
+        assert [chunk.shape for chunk in chunks] == [(15, 325), (15, 325), (10, 325)]
+        rates = np.vstack(chunks)
+        gas = ct.Solution("gri30.yaml")
+        for state, state_rates in zip(data, rates):
+            gas.TPY = state[0], state[1], state[2:]
+            assert np.array_equal(gas.net_rates_of_progress, state_rates)
+
+    def test_default_chunk_size(self, monkeypatch):
+        """Chunks are sized to the memory budget."""
+        model = ct.Solution("gri30.yaml")
+        # room for four states of (species x reactions) values
+        monkeypatch.setattr(reduce_model, "MATRIX_CHUNK_BYTES", 4 * 8 * 53 * 325)
+        chunks = list(get_rates_of_progress(self._data(), model))
+        assert max(chunk.shape[0] for chunk in chunks) == 4
+        assert sum(chunk.shape[0] for chunk in chunks) == 40
+
+    def test_single_state(self):
+        model = ct.Solution("gri30.yaml")
+        (chunk,) = get_rates_of_progress(self._data()[0], model)
+        assert chunk.shape == (1, 325)
+
+
+class TestGetParticipationMatrices:
+    def test_gri(self):
+        model = ct.Solution("gri30.yaml")
+        net_stoich, participation = get_participation_matrices(model)
+
+        assert net_stoich.format == participation.format == "csr"
+        assert np.array_equal(
+            net_stoich.toarray(),
+            model.product_stoich_coeffs - model.reactant_stoich_coeffs,
+        )
+        assert np.array_equal(
+            participation.toarray(),
+            (model.product_stoich_coeffs != 0) | (model.reactant_stoich_coeffs != 0),
+        )
+        # far fewer entries than species x reactions
+        assert participation.nnz < 0.1 * model.n_species * model.n_reactions
+
+
+class TestDeduplicateStates:
+    def _data(self):
+        return np.genfromtxt(
+            relative_location(os.path.join("assets", "example_ignition_data.dat")),
+            delimiter=",",
+        )
+
+    def _perturbed(self, data, scale):
+        """Data followed by a copy with every value changed by up to ``scale``."""
+        rng = np.random.default_rng(0)
+        copy = data * np.exp(rng.uniform(-scale, scale, data.shape))
+        return np.vstack((data, copy))
+
+    def test_distinct_states_kept(self):
+        data = self._data()
+        states = deduplicate_states(data)
+        assert np.array_equal(states.data, data)
+        assert np.array_equal(states.representatives, np.arange(40))
+        assert states.max_distance == 0.0
+
+    def test_near_duplicates_removed(self):
+        data = self._data()
+        sampled_data = self._perturbed(data, 0.005)
+        states = deduplicate_states(sampled_data, tolerance=0.01)
+
+        assert np.array_equal(states.data, data)
+        assert np.array_equal(states.representatives, np.tile(np.arange(40), 2))
+        assert 0.0 < states.max_distance <= 0.01
+
+        # every state is within the tolerance of its representative
+        normalized = np.log(np.maximum(sampled_data, reduce_model.MASS_FRACTION_FLOOR))
+        representatives = np.log(
+            np.maximum(states.data, reduce_model.MASS_FRACTION_FLOOR)
+        )[states.representatives]
+        assert np.abs(normalized - representatives).max() == states.max_distance
+
+    def test_mass_fraction_floor(self):
+        """Differences in the amount of species below the floor are ignored."""
+        data = self._data()[:1]
+        trace = data.copy()
+        trace[0, 2:] = np.where(trace[0, 2:] < 1e-12, 1e-15, trace[0, 2:])
+        states = deduplicate_states(np.vstack((data, trace)), floor=1e-12)
+        assert states.data.shape[0] == 1
+        states = deduplicate_states(np.vstack((data, trace)), floor=1e-20)
+        assert states.data.shape[0] == 2
+
+    def test_disabled(self):
+        sampled_data = self._perturbed(self._data(), 1e-8)
+        states = deduplicate_states(sampled_data, tolerance=0.0)
+        assert np.array_equal(states.data, sampled_data)
+        assert np.array_equal(states.representatives, np.arange(80))
+
+    def test_within_tolerance_of_representative(self):
+        """A chain of close states is not merged into its first state."""
+        state = self._data()[:1]
+        steps = np.exp(np.array([0.0, 0.006, 0.012, 0.0])).reshape(-1, 1)
+        states = deduplicate_states(state * steps, tolerance=0.01)
+        # the third state is within the tolerance of the second, which is merged,
+        # but not of the first
+        assert np.array_equal(states.data, (state * steps)[[0, 2]])
+        assert np.array_equal(states.representatives, [0, 0, 1, 0])
+        assert np.isclose(states.max_distance, 0.006)
+
+    def test_unreached_samples(self):
+        """Rows of zeros, for sampled points never reached, are compared as well."""
+        data = self._data()
+        sampled_data = np.vstack((data[:2], np.zeros((2, data.shape[1]))))
+        with np.errstate(all="raise"):
+            states = deduplicate_states(sampled_data)
+        assert np.array_equal(states.data, sampled_data[:3])
+        assert np.array_equal(states.representatives, [0, 1, 2, 2])
+
+    def test_importance_coeffs(self):
+        """Coefficients from the representatives differ only by the perturbation."""
+        model = ct.Solution("gri30.yaml")
+        targets = ["CH4", "O2"]
+        sampled_data = self._perturbed(self._data(), 1e-7)
+        states = deduplicate_states(sampled_data)
+        assert states.data.shape[0] == 40
+        assert states.max_distance <= reduce_model.STATE_TOLERANCE
+
+        coefficients = get_importance_coeffs(
+            model.species_names, targets, create_drgep_matrices(sampled_data, model)
+        )
+        deduplicated = get_importance_coeffs(
+            model.species_names, targets, create_drgep_matrices(states.data, model)
+        )
+        for species in model.species_names:
+            # maxima over fewer states are never larger, and barely change
+            assert deduplicated[species] <= coefficients[species]
+            assert deduplicated[species] >= 0.99 * coefficients[species]
+
+    def test_default_keeps_retained_species(self):
+        """Merging at the default tolerance keeps the species retained at each step.
+
+        The stored states are sampled by temperature; the same cases are sampled
+        again by heat release, so some states nearly coincide.
+        """
+        model = ct.Solution("gri30.yaml")
+        targets = ["CH4", "O2"]
+        heat_release = []
+        for idx, temperature in enumerate((1000.0, 1200.0)):
+            case = InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+                sample_placement="heat-release",
+            )
+            sim = IgnitionSimulation(idx, case, "gri30.yaml")
+            sim.setup_case()
+            sim.run_case()
+            heat_release.append(sim.process_results()[1])
+        sampled_data = np.vstack([self._data()] + heat_release)
+
+        states = deduplicate_states(sampled_data)
+        assert states.data.shape[0] < sampled_data.shape[0]
+
+        for get_values, create_matrices in [
+            (get_critical_thresholds, create_drg_matrices),
+            (get_importance_coeffs, create_drgep_matrices),
+            (get_critical_thresholds, create_pfa_matrices),
+        ]:
+            values = get_values(
+                model.species_names, targets, create_matrices(sampled_data, model)
+            )
+            merged = get_values(
+                model.species_names, targets, create_matrices(states.data, model)
+            )
+            for threshold in np.arange(0.01, 1.0, 0.01):
+                assert {sp for sp in merged if merged[sp] >= threshold} == {
+                    sp for sp in values if values[sp] >= threshold
+                }
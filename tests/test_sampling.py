@@ -1,12 +1,16 @@
 """Tests the sampling module in pyMARS"""
 
+import os
+import itertools
 import pathlib
 
 import pytest
 import numpy as np
 import cantera as ct
 
-from pymars import sampling
+from pymars import sampling, simulation
+from pymars.reduce_model import ModelSpec, Trimmer
+from pymars.simulation import load_solution
 from pymars.sampling import (
     parse_ignition_inputs,
     parse_psr_inputs,
@@ -88,6 +92,35 @@ class TestCheckInputs:
         for item in conditions:
             assert isinstance(item, InputIgnition)
 
+    def test_sample_points_and_placement(self):
+        """Tests the number and placement of sampled points."""
+        case = {
+            "kind": "constant volume",
+            "pressure": 1.0,
+            "temperature": 1000.0,
+            "fuel": {"CH4": 1.0},
+            "oxidizer": {"O2": 1.0, "N2": 3.76},
+            "equivalence-ratio": 1.0,
+        }
+        conditions = parse_ignition_inputs("gri30.yaml", [case])
+        assert conditions[0].sample_points == 20
+        assert conditions[0].sample_placement == "temperature"
+
+        conditions = parse_ignition_inputs(
+            "gri30.yaml",
+            [dict(case, **{"sample-points": 6, "sample-placement": "heat-release"})],
+        )
+        assert conditions[0].sample_points == 6
+        assert conditions[0].sample_placement == "heat-release"
+
+        for key, value in [
+            ("sample-points", 0),
+            ("sample-points", 6.5),
+            ("sample-placement", "pressure"),
+        ]:
+            with pytest.raises(AssertionError):
+                parse_ignition_inputs("gri30.yaml", [dict(case, **{key: value})])
+
     @pytest.mark.parametrize(
         "key",
         ["kind", "pressure", "temperature", "fuel", "oxidizer", "equivalence-ratio"],
@@ -479,6 +512,30 @@ class TestIgnitionSampling:
             oxidizer={"O2": 1.0, "N2": 3.76},
         )
 
+    def test_sample_points_per_case(self, tmp_path, monkeypatch):
+        """Cases sample their own number of points, and are reused as such."""
+        for key in ("data_ignition", "output_ignition"):
+            monkeypatch.setitem(sampling.data_files, key, str(tmp_path / key))
+        ignition_conditions = [
+            self._hydrogen_ignition()._replace(sample_points=6),
+            self._hydrogen_ignition()._replace(
+                sample_points=10, sample_placement="heat-release"
+            ),
+        ]
+
+        metrics, data = sample("h2o2.yaml", ignition_conditions, num_threads=1)
+        assert metrics.shape == (2,)
+        assert data.shape == (16, 2 + ct.Solution("h2o2.yaml").n_species)
+
+        def no_simulations(cases, *args, **kwargs):
+            assert not cases, "saved samples should have been reused"
+            return []
+
+        monkeypatch.setattr(sampling, "_run_cases", no_simulations)
+        metrics_reuse, data_reuse = sample("h2o2.yaml", ignition_conditions)
+        assert np.array_equal(metrics_reuse, metrics)
+        assert np.allclose(data_reuse, data)
+
     def test_sample_metrics_integration_failure_is_zero(self, monkeypatch):
         """A reduced model whose ignition integration fails yields a 0.0 metric.
 
@@ -647,6 +704,12 @@ def _double_worker(job):
     return {idx: idx * 2}
 
 
+def _pid_worker(job):
+    """Picklable worker reporting which process ran the job."""
+    _sim, idx = job
+    return {idx: os.getpid()}
+
+
 class TestRunWorkers:
     """The shared dispatch helper merges results identically, serial or parallel."""
 
@@ -655,3 +718,500 @@ class TestRunWorkers:
         serial = sampling._run_workers(simulations, _double_worker, num_threads=1)
         parallel = sampling._run_workers(simulations, _double_worker, num_threads=2)
         assert serial == parallel == {0: 0, 1: 2, 2: 4, 3: 6}
+
+    def test_shared_pool_matches_serial(self):
+        simulations = [[None, idx] for idx in range(4)]
+        serial = sampling._run_workers(simulations, _double_worker, num_threads=1)
+        with sampling.WorkerPool(2) as pool:
+            parallel = sampling._run_workers(
+                simulations, _double_worker, num_threads=2, pool=pool
+            )
+        assert serial == parallel == {0: 0, 1: 2, 2: 4, 3: 6}
+
+    def test_shared_pool_reuses_processes(self):
+        """Successive batches run in the same worker processes, not fresh ones."""
+        simulations = [[None, idx] for idx in range(4)]
+        with sampling.WorkerPool(2) as pool:
+            first = sampling._run_workers(simulations, _pid_worker, 2, pool=pool)
+            second = sampling._run_workers(simulations, _pid_worker, 2, pool=pool)
+        pids = set(first.values()) | set(second.values())
+        assert os.getpid() not in pids
+        assert len(pids) <= 2
+
+    def test_serial_pool_runs_in_process(self):
+        simulations = [[None, idx] for idx in range(2)]
+        with sampling.WorkerPool(1) as pool:
+            results = sampling._run_workers(simulations, _pid_worker, 1, pool=pool)
+        assert set(results.values()) == {os.getpid()}
+
+
+class TestEvaluationCache:
+    """Reduced models with the same species and conditions are simulated once."""
+
+    def _hydrogen_ignition(self):
+        return InputIgnition(
+            kind="constant volume",
+            pressure=1.0,
+            temperature=1200.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+
+    def test_add_and_get(self):
+        cache = sampling.EvaluationCache()
+        conditions = sampling.evaluation_conditions([1.0], [self._hydrogen_ignition()])
+        assert cache.get(["H2", "O2"], conditions) is None
+
+        cache.add(["H2", "O2"], conditions, [2.0], 100.0)
+        evaluation = cache.get(["O2", "H2"], conditions)
+        assert np.array_equal(evaluation.metrics, [2.0])
+        assert evaluation.error == 100.0
+        assert cache.get(["H2", "O2", "N2"], conditions) is None
+        assert len(cache) == 1
+
+    def test_conditions_distinguish_evaluations(self):
+        ignition = self._hydrogen_ignition()
+        conditions = sampling.evaluation_conditions([1.0], [ignition])
+        assert conditions == sampling.evaluation_conditions([1.0], [ignition])
+        assert conditions != sampling.evaluation_conditions([2.0], [ignition])
+        assert conditions != sampling.evaluation_conditions(
+            [1.0], [ignition._replace(temperature=1300.0)]
+        )
+        assert conditions != sampling.evaluation_conditions(
+            [1.0], [ignition], phase_name="gas"
+        )
+
+    def test_conditions_include_model_contents(self, tmp_path):
+        """Evaluations are not reused once the model file is rewritten."""
+        ignition = self._hydrogen_ignition()
+        filename = str(tmp_path / "model.yaml")
+        ct.Solution("h2o2.yaml").write_yaml(filename)
+        conditions = sampling.evaluation_conditions([1.0], [ignition], model=filename)
+        # a reduced model is evaluated under the conditions of its source
+        assert conditions == sampling.evaluation_conditions(
+            [1.0], [ignition], model=ModelSpec(filename, ("HO2",))
+        )
+
+        with open(filename, "a") as the_file:
+            the_file.write("\n")
+        assert conditions != sampling.evaluation_conditions(
+            [1.0], [ignition], model=filename
+        )
+
+    def test_retained_species(self, monkeypatch):
+        """The species of a reduced model are found without building it."""
+        monkeypatch.setattr(simulation, "_solution_cache", simulation.OrderedDict())
+        model = ModelSpec("h2o2.yaml", ("HO2", "H2O2"))
+        species_names = sampling._retained_species(model)
+        assert list(simulation._solution_cache) == [
+            (simulation._model_digest("h2o2.yaml"), "")
+        ]
+        assert species_names == load_solution(model).species_names
+
+    def test_persists_to_file(self, tmp_path):
+        filename = str(tmp_path / "evaluations.jsonl")
+        cache = sampling.EvaluationCache(filename)
+        cache.add(["H2", "O2"], "abc", [2.0, np.nan], 50.0)
+
+        reloaded = sampling.EvaluationCache(filename)
+        evaluation = reloaded.get(["H2", "O2"], "abc")
+        assert len(reloaded) == 1
+        assert evaluation.error == 50.0
+        assert evaluation.metrics[0] == 2.0
+        assert np.isnan(evaluation.metrics[1])
+
+    def test_evaluate_error_simulates_once(self, monkeypatch):
+        conditions = [self._hydrogen_ignition()]
+        metrics = sample_metrics("h2o2.yaml", conditions)
+
+        calls = []
+
+        def counting_sample_metrics(model, *args, **kwargs):
+            calls.append(model)
+            return sample_metrics(model, *args, **kwargs)
+
+        monkeypatch.setattr(sampling, "sample_metrics", counting_sample_metrics)
+        cache = sampling.EvaluationCache()
+        error = sampling.evaluate_error(
+            ModelSpec("h2o2.yaml", ("AR",)), metrics, conditions, cache=cache
+        )
+        # the same species retained, though described differently
+        repeated = sampling.evaluate_error(
+            ModelSpec("h2o2.yaml", ("AR", "AR")), metrics, conditions, cache=cache
+        )
+        assert repeated == error
+        assert len(calls) == 1
+
+        sampling.evaluate_error(
+            ModelSpec("h2o2.yaml", ("AR", "H2O2")), metrics, conditions, cache=cache
+        )
+        assert len(calls) == 2
+        assert len(cache) == 2
+
+
+def _fake_ignition_delays(delays, calls):
+    """Ignition worker returning given delays, recording the cases run."""
+
+    def worker(sim_tuple):
+        _sim, idx = sim_tuple
+        calls.append(idx)
+        return {idx: delays[idx]}
+
+    return worker
+
+
+class TestEarlyAbort:
+    """Candidates are rejected as soon as one case exceeds the error limit."""
+
+    def _conditions(self, n_cases):
+        return [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=1000.0 + 100.0 * idx,
+                equivalence_ratio=1.0,
+                fuel={"H2": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for idx in range(n_cases)
+        ]
+
+    def test_imap_unordered_serial_is_lazy(self):
+        calls = []
+
+        def worker(job):
+            calls.append(job)
+            return job * 2
+
+        pool = sampling.WorkerPool(1)
+        results = pool.imap_unordered(worker, range(4))
+        assert next(results) == 0
+        results.close()
+        assert calls == [0]
+
+    def test_imap_unordered_parallel(self):
+        simulations = [[None, idx] for idx in range(6)]
+        with sampling.WorkerPool(2) as pool:
+            results = list(pool.imap_unordered(_double_worker, simulations))
+            assert sorted(next(iter(r.values())) for r in results) == list(
+                range(0, 12, 2)
+            )
+
+            # stopping early keeps the worker processes for the next batch
+            workers = pool._pool
+            partial = pool.imap_unordered(_pid_worker, simulations)
+            next(partial)
+            partial.close()
+            assert pool._pool is workers
+            assert len(pool.map(_double_worker, simulations)) == 6
+
+    def test_aborted_evaluation_keeps_workers(self):
+        """Rejecting a model early does not restart the shared worker processes."""
+        original = sample_metrics("h2o2.yaml", self._conditions(4))
+        simulations = [[None, idx] for idx in range(4)]
+        with sampling.WorkerPool(2) as pool:
+            sampling._run_workers(simulations, _pid_worker, 2, pool=pool)
+            workers = pool._pool
+            pids = {process.pid for process in workers._pool}
+            # without the hydroperoxyl radical, the first case finished already
+            # exceeds the limit, while the other worker is still running a case
+            error = sampling.evaluate_error(
+                ModelSpec("h2o2.yaml", ("HO2",)),
+                original,
+                self._conditions(4),
+                pool=pool,
+                error_limit=1.0,
+            )
+            results = sampling._run_workers(simulations, _pid_worker, 2, pool=pool)
+            assert pool._pool is workers
+            assert {process.pid for process in workers._pool} == pids
+        assert error > 1.0
+        assert set(results.values()) <= pids
+
+    def test_stops_at_first_failing_case(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(
+            sampling,
+            "ignition_worker",
+            _fake_ignition_delays([1.0, 2.0, 1.0, 1.0], calls),
+        )
+        original = np.ones(4)
+        error = sampling.evaluate_error(
+            "h2o2.yaml", original, self._conditions(4), error_limit=10.0
+        )
+        assert error == 100.0
+        assert calls == [0, 1]
+
+    def test_matches_full_evaluation(self, monkeypatch):
+        calls = []
+        delays = [1.0, 1.05, 0.98, 1.01]
+        monkeypatch.setattr(
+            sampling, "ignition_worker", _fake_ignition_delays(delays, calls)
+        )
+        original = np.ones(4)
+        error = sampling.evaluate_error(
+            "h2o2.yaml", original, self._conditions(4), error_limit=10.0
+        )
+        assert calls == [0, 1, 2, 3]
+        assert np.isclose(error, sampling.calculate_error(original, np.array(delays)))
+
+    def test_hardest_cases_first(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(
+            sampling,
+            "ignition_worker",
+            _fake_ignition_delays([1.0, 1.0, 1.5, 1.0], calls),
+        )
+        from pymars.reduce_model import ModelSpec
+
+        cache = sampling.EvaluationCache()
+        original = np.ones(4)
+        conditions = self._conditions(4)
+        for species in ["H2O2", "HO2"]:
+            sampling.evaluate_error(
+                ModelSpec("h2o2.yaml", (species,)),
+                original,
+                conditions,
+                cache=cache,
+                error_limit=10.0,
+            )
+        # case 2 rejected the first candidate, so runs first for the second
+        assert calls == [0, 1, 2, 2]
+
+    def test_stopped_evaluation_not_reused_at_higher_limit(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(
+            sampling,
+            "ignition_worker",
+            _fake_ignition_delays([1.5, 1.0], calls),
+        )
+        cache = sampling.EvaluationCache()
+        original = np.ones(2)
+        conditions = self._conditions(2)
+        args = ("h2o2.yaml", original, conditions)
+        assert sampling.evaluate_error(*args, cache=cache, error_limit=10.0) == 50.0
+        assert sampling.evaluate_error(*args, cache=cache, error_limit=20.0) == 50.0
+        assert len(calls) == 1
+        assert sampling.evaluate_error(*args, cache=cache, error_limit=60.0) == 50.0
+        assert calls == [0, 0, 1]
+
+
+class _Case:
+    """Stand-in simulation with the conditions used to look up its runtime."""
+
+    def __init__(self, properties, model="model.yaml"):
+        self.properties = properties
+        self.model = model
+
+
+def _order_worker(order):
+    def worker(sim_tuple):
+        sim, idx = sim_tuple
+        order.append(sim.properties)
+        return {idx: sim.properties}
+
+    return worker
+
+
+class TestCaseScheduling:
+    """Cases run in one queue, longest recorded runtime first."""
+
+    def test_longest_first(self, monkeypatch):
+        monkeypatch.setattr(
+            sampling, "_case_runtimes", {"'fast'": 0.1, "'slow'": 5.0, "'mid'": 1.0}
+        )
+        order = []
+        worker = _order_worker(order)
+        cases = [
+            (worker, [_Case(name), idx])
+            for idx, name in enumerate(["fast", "new", "slow", "mid"])
+        ]
+        results = sampling._run_cases(cases, 1)
+
+        # results in case order, but never-run cases first, then slowest
+        assert results == ["fast", "new", "slow", "mid"]
+        assert order == ["new", "slow", "mid", "fast"]
+
+    def test_cases_of_a_model_together(self, monkeypatch):
+        monkeypatch.setattr(
+            sampling, "_case_runtimes", {"'fast'": 0.1, "'slow'": 5.0, "'mid'": 1.0}
+        )
+        order = []
+        worker = _order_worker(order)
+        cases = [
+            (worker, [_Case(name, model), idx])
+            for idx, (model, name) in enumerate(
+                (model, name)
+                for model in ["a.yaml", "b.yaml"]
+                for name in ["fast", "slow", "mid"]
+            )
+        ]
+        sampling._run_cases(cases, 1)
+        assert order == 2 * ["slow", "mid", "fast"]
+
+    def test_models_built_once(self, monkeypatch):
+        """Evaluating many reduced models builds each one once, not once per case."""
+        monkeypatch.setattr(simulation, "_solution_cache", simulation.OrderedDict())
+        trims = []
+        trim = Trimmer.trim
+
+        def counting_trim(self, exclusion_list, name=""):
+            trims.append(tuple(exclusion_list))
+            return trim(self, exclusion_list, name)
+
+        def loading_worker(sim_tuple):
+            sim, idx = sim_tuple
+            load_solution(sim.model, sim.phase_name)
+            return {idx: 1.0}
+
+        monkeypatch.setattr(Trimmer, "trim", counting_trim)
+        monkeypatch.setattr(sampling, "ignition_worker", loading_worker)
+
+        conditions = [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"H2": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for temperature in (1000.0, 1100.0, 1200.0)
+        ]
+        # runtimes recorded for every condition, as after the baseline sampling
+        monkeypatch.setattr(
+            sampling,
+            "_case_runtimes",
+            {repr(case): 1.0 + idx for idx, case in enumerate(conditions)},
+        )
+        species = ["AR", "HO2", "H2O2", "O", "OH", "H"]
+        models = [
+            ModelSpec("h2o2.yaml", exclusion)
+            for exclusion in itertools.chain(
+                itertools.combinations(species, 1),
+                itertools.combinations(species, 2),
+            )
+        ][:16]
+
+        errors = sampling.evaluate_errors(models, np.ones(3), conditions)
+        assert np.array_equal(errors, np.zeros(16))
+        assert len(trims) == 16
+
+    def test_runtimes_recorded(self, monkeypatch):
+        monkeypatch.setattr(sampling, "_case_runtimes", {})
+        ignition = InputIgnition(
+            kind="constant volume",
+            pressure=1.0,
+            temperature=1200.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+        sample_metrics("h2o2.yaml", [ignition])
+        assert list(sampling._case_runtimes) == [repr(ignition)]
+        assert sampling._case_runtimes[repr(ignition)] > 0.0
+
+    def test_parallel_results_in_case_order(self):
+        cases = [(_double_worker, [_Case(idx), idx]) for idx in range(5)]
+        with sampling.WorkerPool(2) as pool:
+            assert sampling._run_cases(cases, 2, pool=pool) == [0, 2, 4, 6, 8]
+
+
+class TestSingleQueue:
+    """Ignition, PSR and flame cases are dispatched together in one queue."""
+
+    def _conditions(self):
+        ignition = [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"H2": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for temperature in (1000.0, 1200.0)
+        ]
+        psr = [
+            InputPSR(
+                pressure=1.0,
+                temperature=300.0,
+                equivalence_ratio=1.0,
+                fuel={"H2": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+        ]
+        flame = [
+            InputLaminarFlame(
+                pressure=1.0,
+                temperature=300.0,
+                equivalence_ratio=1.0,
+                fuel={"H2": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+                width=0.03,
+            )
+        ]
+        return ignition, psr, flame
+
+    def _fake_queue(self, monkeypatch, n_species):
+        """Replace the queue by one returning case-numbered fake results."""
+        queues = []
+        n_rows = {
+            sampling.ignition_sample_worker: 20,
+            sampling.psr_sample_worker: sampling.PSRSimulation.num_sample_points,
+            sampling.flame_sample_worker: 20,
+        }
+
+        def run_cases(cases, num_threads, pool=None):
+            queues.append([case[0] for case in cases])
+            results = []
+            for number, (worker, _job, *_) in enumerate(cases):
+                metric = [number] * (3 if "psr" in worker.__name__ else 1)
+                if worker in n_rows:
+                    data = np.full((n_rows[worker], 2 + n_species), number)
+                    results.append((metric, data))
+                else:
+                    results.append(metric)
+            return results
+
+        monkeypatch.setattr(sampling, "_run_cases", run_cases)
+        return queues
+
+    def test_sample_metrics(self, monkeypatch):
+        queues = self._fake_queue(monkeypatch, 10)
+        ignition, psr, flame = self._conditions()
+        metrics = sample_metrics(
+            "h2o2.yaml", ignition, psr_conditions=psr, flame_conditions=flame
+        )
+        assert queues == [
+            [
+                sampling.ignition_worker,
+                sampling.ignition_worker,
+                sampling.psr_worker,
+                sampling.flame_worker,
+            ]
+        ]
+        assert np.array_equal(metrics, [0, 1, 2, 2, 2, 3])
+
+    def test_sample(self, tmp_path, monkeypatch):
+        for key in sampling.data_files:
+            monkeypatch.setitem(sampling.data_files, key, str(tmp_path / key))
+        queues = self._fake_queue(monkeypatch, 10)
+        ignition, psr, flame = self._conditions()
+        metrics, data = sample(
+            "h2o2.yaml", ignition, psr_conditions=psr, flame_conditions=flame
+        )
+        assert len(queues) == 1
+        assert len(queues[0]) == 4
+        assert np.array_equal(metrics, [0, 1, 2, 2, 2, 3])
+        n_psr = sampling.PSRSimulation.num_sample_points
+        assert np.array_equal(data[:, 0], [0] * 20 + [1] * 20 + [2] * n_psr + [3] * 20)
+
+        # saved samples of every kind are reused, leaving nothing to run
+        metrics_reused, data_reused = sample(
+            "h2o2.yaml", ignition, psr_conditions=psr, flame_conditions=flame
+        )
+        assert queues[1] == []
+        assert np.array_equal(metrics_reused, metrics)
+        assert np.array_equal(data_reused, data)
@@ -1,10 +1,14 @@
 import os
 import pathlib
 
+import numpy as np
 import cantera as ct
 
-from pymars.sampling import data_files, InputIgnition
-from pymars.sensitivity_analysis import run_sa
+from pymars import sampling
+from pymars.sampling import data_files, InputIgnition, evaluate_error
+from pymars.reduce_model import ModelSpec
+from pymars.sensitivity_analysis import run_sa, evaluate_species_errors
+from pymars.simulation import load_solution
 
 # Taken from http://stackoverflow.com/a/22726782/1569494
 try:
@@ -55,6 +59,78 @@ def check_equal(list1, list2):
     return len(list1) == len(list2) and sorted(list1) == sorted(list2)
 
 
+class TestEvaluateSpeciesErrors:
+    def _conditions(self):
+        return [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for temperature in (1000.0, 1200.0)
+        ]
+
+    def test_matches_one_at_a_time(self, monkeypatch):
+        """All candidates share one queue, with the same errors as one by one."""
+        starting_model = relative_location(os.path.join("assets", "drgep_gri30.yaml"))
+        conditions = self._conditions()
+        metrics = sampling.sample_metrics(starting_model, conditions)
+        limbo_species = ["H2O2", "C2H6", "HCCO"]
+
+        expected = [
+            evaluate_error(ModelSpec(starting_model, (species,)), metrics, conditions)
+            for species in limbo_species
+        ]
+
+        queues = []
+        run_cases = sampling._run_cases
+
+        def counting_run_cases(cases, num_threads, pool=None):
+            # without a pool, one is made and the call repeated with it
+            if pool is not None:
+                queues.append(len(cases))
+            return run_cases(cases, num_threads, pool=pool)
+
+        monkeypatch.setattr(sampling, "_run_cases", counting_run_cases)
+        species_errors = evaluate_species_errors(
+            ModelSpec(starting_model), conditions, metrics, limbo_species
+        )
+        assert queues == [len(limbo_species) * len(conditions)]
+        assert np.allclose(species_errors, expected, rtol=1e-9, atol=0.0)
+
+        species_errors = evaluate_species_errors(
+            ModelSpec(starting_model),
+            conditions,
+            metrics,
+            limbo_species,
+            num_threads=2,
+        )
+        assert np.allclose(species_errors, expected, rtol=1e-9, atol=0.0)
+
+    def test_cached_candidates_not_run(self):
+        starting_model = relative_location(os.path.join("assets", "drgep_gri30.yaml"))
+        conditions = self._conditions()[:1]
+        metrics = np.array([1.0e-2])
+        cache = sampling.EvaluationCache()
+        first = evaluate_species_errors(
+            ModelSpec(starting_model), conditions, metrics, ["H2O2"], cache=cache
+        )
+        assert len(cache) == 1
+
+        both = evaluate_species_errors(
+            ModelSpec(starting_model),
+            conditions,
+            metrics,
+            ["H2O2", "C2H6"],
+            cache=cache,
+        )
+        assert both[0] == first[0]
+        assert len(cache) == 2
+
+
 class TestRunSA:
     def test_drgepsa(self):
         """Test SA using stored DRGEP result with upper_threshold = 0.5"""
@@ -145,3 +221,189 @@ class TestRunSA:
         )
         assert reduced_model.model.n_reactions == expected_model.n_reactions
         assert round(reduced_model.error, 2) == 3.20
+
+    def test_shares_graph_evaluations(self, monkeypatch):
+        """A candidate already evaluated by the graph-based stage is not re-run."""
+        conditions = [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for temperature in (1000.0, 1200.0)
+        ]
+        data_files["output_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_output.txt")
+        )
+        data_files["data_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_data.dat")
+        )
+        # the DRGEP result, described as the species it removes from GRI-Mech 3.0
+        retained = ct.Solution(
+            relative_location(os.path.join("assets", "drgep_gri30.yaml"))
+        ).species_names
+        starting_spec = ModelSpec(
+            "gri30.yaml",
+            tuple(
+                sp
+                for sp in ct.Solution("gri30.yaml").species_names
+                if sp not in retained
+            ),
+        )
+        metrics = sampling.sample_metrics(starting_spec, conditions, reuse_saved=True)
+
+        # a candidate of the graph-based stage, with one more species removed
+        cache = sampling.EvaluationCache()
+        graph_error = evaluate_error(
+            starting_spec.remove(["H2O2"]), metrics, conditions, cache=cache
+        )
+        assert len(cache) == 1
+
+        simulated = []
+        run_cases = sampling._run_cases
+
+        def counting_run_cases(cases, num_threads, pool=None):
+            simulated.extend(cases)
+            return run_cases(cases, num_threads, pool=pool)
+
+        monkeypatch.setattr(sampling, "_run_cases", counting_run_cases)
+        with TemporaryDirectory() as temp_dir:
+            reduced_model = run_sa(
+                starting_spec,
+                3.22,
+                conditions,
+                [],
+                [],
+                100.0,
+                ["N2"],
+                algorithm_type="initial",
+                species_limbo=["H2O2"],
+                path=temp_dir,
+                cache=cache,
+            )
+
+        assert "H2O2" not in reduced_model.model.species_names
+        assert reduced_model.model.n_species == len(retained) - 1
+        assert reduced_model.error == graph_error
+        assert simulated == []
+        # the final model is not the object shared through the model cache
+        assert reduced_model.model is not load_solution(starting_spec.remove(["H2O2"]))
+        assert len(cache) == 1
+
+    def test_lazy_greedy(self):
+        """Lazy-greedy SA reaches the greedy model with fewer simulations."""
+        starting_model = relative_location(os.path.join("assets", "drgep_gri30.yaml"))
+        conditions = [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for temperature in (1000.0, 1200.0)
+        ]
+        data_files["output_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_output.txt")
+        )
+        data_files["data_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_data.dat")
+        )
+        limbo_species = [
+            "H2",
+            "H2O2",
+            "CH2(S)",
+            "C2H4",
+            "C2H5",
+            "C2H6",
+            "HCCO",
+            "CH2CO",
+        ]
+        expected_model = ct.Solution(
+            relative_location(os.path.join("assets", "drgepsa_gri30.yaml"))
+        )
+
+        cache = sampling.EvaluationCache()
+        with TemporaryDirectory() as temp_dir:
+            reduced_model = run_sa(
+                starting_model,
+                3.22,
+                conditions,
+                [],
+                [],
+                5.0,
+                ["N2"],
+                algorithm_type="lazy-greedy",
+                species_limbo=limbo_species[:],
+                num_threads=1,
+                path=temp_dir,
+                cache=cache,
+            )
+
+        assert check_equal(
+            reduced_model.model.species_names, expected_model.species_names
+        )
+        assert reduced_model.model.n_reactions == expected_model.n_reactions
+        assert round(reduced_model.error, 2) == 3.20
+
+        # greedy SA evaluates 26 distinct reduced models here
+        assert len(cache) < 20
+
+    def test_batch(self):
+        """Batch removal reaches the same model as removing species one at a time."""
+        starting_model = relative_location(os.path.join("assets", "drgep_gri30.yaml"))
+        conditions = [
+            InputIgnition(
+                kind="constant volume",
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"CH4": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for temperature in (1000.0, 1200.0)
+        ]
+        data_files["output_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_output.txt")
+        )
+        data_files["data_ignition"] = relative_location(
+            os.path.join("assets", "example_ignition_data.dat")
+        )
+        limbo_species = [
+            "H2",
+            "H2O2",
+            "CH2(S)",
+            "C2H4",
+            "C2H5",
+            "C2H6",
+            "HCCO",
+            "CH2CO",
+        ]
+        expected_model = ct.Solution(
+            relative_location(os.path.join("assets", "drgepsa_gri30.yaml"))
+        )
+
+        with TemporaryDirectory() as temp_dir:
+            reduced_model = run_sa(
+                starting_model,
+                3.22,
+                conditions,
+                [],
+                [],
+                5.0,
+                ["N2"],
+                algorithm_type="batch",
+                species_limbo=limbo_species[:],
+                num_threads=1,
+                path=temp_dir,
+            )
+
+        assert check_equal(
+            reduced_model.model.species_names, expected_model.species_names
+        )
+        assert reduced_model.model.n_reactions == expected_model.n_reactions
+        assert round(reduced_model.error, 2) == 3.20
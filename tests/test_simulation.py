@@ -10,11 +10,16 @@ import h5py
 import cantera as ct
 
 from pymars.sampling import InputIgnition, InputPSR, InputLaminarFlame
+from pymars import simulation
 from pymars.simulation import (
     BaseSimulation,
     IgnitionSimulation,
     FlameSimulation,
     PSRSimulation,
+    StreamingSampler,
+    TrajectoryBuffer,
+    load_solution,
+    copy_solution,
 )
 
 
@@ -112,7 +117,9 @@ class TestIgnitionSimulation:
             oxidizer={"O2": 1.0, "N2": 3.76},
         )
         with TemporaryDirectory() as temp_dir:
-            sim = IgnitionSimulation(0, case, "gri30.yaml", path=temp_dir)
+            sim = IgnitionSimulation(
+                0, case, "gri30.yaml", path=temp_dir, archive_profile=True
+            )
             sim.setup_case()
             assert np.allclose(sim.run_case(), 1.066766)
 
@@ -140,6 +147,123 @@ class TestIgnitionSimulation:
             ) / np.sqrt(sim.sim.n_vars - 1)
             assert residual < 1.0e-8
 
+    def test_run_case_in_memory(self):
+        """Test that without archiving the profile is kept in memory, not written."""
+        case = InputIgnition(
+            kind="constant volume",
+            pressure=1.0,
+            temperature=1000.0,
+            equivalence_ratio=1.0,
+            fuel={"CH4": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+        with TemporaryDirectory() as temp_dir:
+            sim = IgnitionSimulation(0, case, "gri30.yaml", path=temp_dir)
+            sim.setup_case()
+            assert np.allclose(sim.run_case(), 1.066766)
+            assert sim.save_file is None
+            assert os.listdir(temp_dir) == []
+
+            num_steps = len(sim.profile.time)
+            assert sim.profile.temperature.shape == (num_steps,)
+            assert sim.profile.mass_fractions.shape == (num_steps, sim.gas.n_species)
+
+            ignition_delay, sampled_data = sim.process_results()
+            assert np.allclose(ignition_delay, 1.066766)
+            assert sampled_data.shape == (20, 2 + sim.gas.n_species)
+
+            sim.clean()
+            assert sim.profile is None
+
+    def test_archived_profile_matches_memory(self):
+        """Test that archiving writes the same profile that is sampled from memory."""
+        case = InputIgnition(
+            kind="constant volume",
+            pressure=1.0,
+            temperature=1000.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+        with TemporaryDirectory() as temp_dir:
+            sim = IgnitionSimulation(
+                0, case, "h2o2.yaml", path=temp_dir, archive_profile=True
+            )
+            sim.setup_case()
+            sim.run_case()
+            memory_results = sim.process_results()
+
+            with h5py.File(sim.save_file, "r") as h5file:
+                grp = h5file["simulation"]
+                assert np.array_equal(grp["time"][:], sim.profile.time)
+                assert np.array_equal(
+                    grp["mass_fractions"][:], sim.profile.mass_fractions
+                )
+
+            # without the in-memory profile, the archived file is read instead
+            sim.profile = None
+            archived_results = sim.process_results()
+            assert archived_results[0] == memory_results[0]
+            assert np.array_equal(archived_results[1], memory_results[1])
+
+            sim.clean()
+            assert not os.path.isfile(sim.save_file)
+
+    def test_run_case_without_time(self):
+        """Test that recording only the sampling columns gives the same results."""
+        case = InputIgnition(
+            kind="constant volume",
+            pressure=1.0,
+            temperature=1000.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+        with TemporaryDirectory() as temp_dir:
+            sim = IgnitionSimulation(0, case, "h2o2.yaml", path=temp_dir)
+            sim.setup_case()
+            sim.run_case()
+            ignition_delay, sampled_data = sim.process_results()
+
+            sim = IgnitionSimulation(
+                0, case, "h2o2.yaml", path=temp_dir, record_time=False
+            )
+            sim.setup_case()
+            sim.run_case()
+            assert sim.profile.time is None
+            assert sim.profile._data.shape[1] == 2 + sim.gas.n_species
+
+            results = sim.process_results()
+            assert results[0] == ignition_delay
+            assert np.array_equal(results[1], sampled_data)
+
+    @pytest.mark.parametrize("placement", ["temperature", "heat-release"])
+    def test_sample_points_and_placement(self, placement):
+        """Test sampling the number of points and with the placement of the case."""
+        case = InputIgnition(
+            kind="constant pressure",
+            pressure=1.0,
+            temperature=1000.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+            sample_points=6,
+            sample_placement=placement,
+        )
+        sim = IgnitionSimulation(0, case, "h2o2.yaml", stream_samples=True)
+        sim.setup_case()
+        sim.run_case()
+        ignition_delay, sampled_data = sim.process_results()
+
+        assert sampled_data.shape == (6, 2 + sim.gas.n_species)
+        # every sample is a distinct state along the trajectory, hottest last
+        assert len(np.unique(sampled_data[:, 0])) == 6
+        assert np.all(sampled_data[:, 0] >= case.temperature)
+        if placement == "heat-release":
+            # the heat release rate is needed, so the time history is kept
+            assert sim.sampler is None
+            assert len(sim.profile) > 0
+
     def test_run_case_end_time(self):
         """Test running a case with a specified end time."""
         case = InputIgnition(
@@ -301,6 +425,73 @@ class TestIgnitionSimulation:
             assert not os.path.isfile(sim.save_file)
 
 
+class TestTrajectoryBuffer:
+    def _states(self, num_rows, n_species=3):
+        rng = np.random.default_rng(0)
+        return rng.random((num_rows, 3 + n_species))
+
+    def test_grows_and_trims(self, monkeypatch):
+        """Test that recording past the allocated rows keeps every row."""
+        monkeypatch.setattr(simulation, "TRAJECTORY_CHUNK_ROWS", 4)
+        states = self._states(23)
+
+        buffer = TrajectoryBuffer(3)
+        assert buffer._data.shape == (4, 6)
+        for state in states:
+            buffer.record(state[0], state[1], state[2], state[3:])
+        assert len(buffer) == 23
+        assert buffer._data.shape[0] >= 23
+
+        buffer.trim()
+        assert buffer._data.shape == (23, 6)
+        assert np.array_equal(buffer.time, states[:, 0])
+        assert np.array_equal(buffer.temperature, states[:, 1])
+        assert np.array_equal(buffer.pressure, states[:, 2])
+        assert np.array_equal(buffer.mass_fractions, states[:, 3:])
+
+    def test_grows_with_views(self, monkeypatch):
+        """Test that growing while views of the data are alive copies instead."""
+        monkeypatch.setattr(simulation, "TRAJECTORY_CHUNK_ROWS", 4)
+        states = self._states(10)
+
+        buffer = TrajectoryBuffer(3)
+        for state in states[:4]:
+            buffer.record(state[0], state[1], state[2], state[3:])
+        temperatures = buffer.temperature
+        for state in states[4:]:
+            buffer.record(state[0], state[1], state[2], state[3:])
+
+        assert np.array_equal(temperatures, states[:4, 1])
+        assert np.array_equal(buffer.temperature, states[:, 1])
+        assert np.array_equal(buffer.mass_fractions, states[:, 3:])
+
+    def test_without_time(self):
+        """Test recording only the columns needed for sampling."""
+        states = self._states(5)
+
+        buffer = TrajectoryBuffer(3, record_time=False)
+        for state in states:
+            buffer.record(state[0], state[1], state[2], state[3:])
+
+        assert buffer.time is None
+        assert buffer._data.shape[1] == 5
+        assert np.array_equal(buffer.temperature, states[:, 1])
+        assert np.array_equal(buffer.mass_fractions, states[:, 3:])
+
+    def test_max_rows(self, monkeypatch):
+        """Test that the storage never grows past the given number of rows."""
+        monkeypatch.setattr(simulation, "TRAJECTORY_CHUNK_ROWS", 4)
+        states = self._states(7)
+
+        buffer = TrajectoryBuffer(3, max_rows=6)
+        for state in states[:6]:
+            buffer.record(state[0], state[1], state[2], state[3:])
+        assert buffer._data.shape == (6, 6)
+
+        with pytest.raises(IndexError):
+            buffer.record(states[6, 0], states[6, 1], states[6, 2], states[6, 3:])
+
+
 class TestIgnitionFailure:
     """An ignition integration that fails should be handled gracefully rather
     than crashing the reduction (see issue #69).
@@ -583,6 +774,160 @@ class TestFlameFailure:
         assert sim2.calculate() > 0.0
 
 
+class TestLoadSolution:
+    """The per-process cache of parsed models."""
+
+    def test_reuses_parsed_model(self):
+        assert load_solution("h2o2.yaml") is load_solution("h2o2.yaml")
+
+    def test_keyed_by_content(self, tmp_path):
+        """Rewriting a model file under the same name gives a freshly parsed model."""
+        filename = str(tmp_path / "model.yaml")
+        ct.Solution("h2o2.yaml").write_yaml(filename)
+        first = load_solution(filename)
+
+        gas = ct.Solution("gri30.yaml")
+        os.remove(filename)
+        gas.write_yaml(filename)
+        second = load_solution(filename)
+
+        assert second is not first
+        assert second.n_species == gas.n_species
+
+    def test_digest_memoized(self, tmp_path, monkeypatch):
+        """A model file is hashed again only once its mtime or size changes."""
+        filename = str(tmp_path / "model.yaml")
+        ct.Solution("h2o2.yaml").write_yaml(filename)
+
+        hashed = []
+        sha1 = simulation.hashlib.sha1
+
+        def counting_sha1(data):
+            hashed.append(len(data))
+            return sha1(data)
+
+        monkeypatch.setattr(simulation.hashlib, "sha1", counting_sha1)
+        first = simulation._model_digest(filename)
+        assert simulation._model_digest(filename) == first
+        assert len(hashed) == 1
+
+        with open(filename, "a") as the_file:
+            the_file.write("\n")
+        assert simulation._model_digest(filename) != first
+        assert len(hashed) == 2
+
+    def test_state_reset(self):
+        """The state left by one caller does not reach the next."""
+        gas = load_solution("h2o2.yaml")
+        state = gas.state
+        gas.TPX = 1500.0, 2.0 * ct.one_atm, "H2:1.0"
+
+        assert load_solution("h2o2.yaml") is gas
+        assert np.array_equal(gas.state, state)
+
+    def test_copy_solution(self):
+        gas = load_solution("h2o2.yaml")
+        gas.TPX = 1500.0, 2.0 * ct.one_atm, "H2:1.0, O2:0.5"
+        copy = copy_solution(gas)
+
+        assert copy is not gas
+        assert copy.species_names == gas.species_names
+        assert copy.n_reactions == gas.n_reactions
+        assert copy.transport_model == gas.transport_model
+        assert np.array_equal(copy.state, gas.state)
+
+        # the copy keeps its state when the cached model is loaded again
+        state = copy.state
+        load_solution("h2o2.yaml")
+        assert np.array_equal(copy.state, state)
+
+    def test_lru_bound(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(simulation, "SOLUTION_CACHE_SIZE", 2)
+        monkeypatch.setattr(simulation, "_solution_cache", simulation.OrderedDict())
+
+        gas = ct.Solution("h2o2.yaml")
+        filenames = []
+        for idx in range(3):
+            # distinct contents, so each file is its own cache entry
+            gas.name = f"model{idx}"
+            filenames.append(str(tmp_path / f"model{idx}.yaml"))
+            gas.write_yaml(filenames[-1])
+
+        first = load_solution(filenames[0])
+        load_solution(filenames[1])
+        load_solution(filenames[2])
+
+        assert len(simulation._solution_cache) == 2
+        # the least recently used model was evicted, so it is parsed again
+        assert load_solution(filenames[0]) is not first
+
+    def test_repeated_cases_match_fresh_model(self):
+        """Cases sharing a cached model give the same result as separately parsed ones."""
+        case = InputIgnition(
+            kind="constant pressure",
+            pressure=1.0,
+            temperature=1000.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+        delays = []
+        for idx in range(2):
+            sim = IgnitionSimulation(idx, case, "h2o2.yaml")
+            sim.setup_case()
+            delays.append(sim.calculate())
+        assert delays[0] > 0.0
+        # equal to within the integrator tolerances
+        assert np.isclose(delays[0], delays[1], rtol=1e-6)
+
+    def test_repeat_runs_identical(self):
+        """Test that a case gives the same result whatever was run before it."""
+        cases = [
+            InputIgnition(
+                kind=kind,
+                pressure=1.0,
+                temperature=temperature,
+                equivalence_ratio=1.0,
+                fuel={"H2": 1.0},
+                oxidizer={"O2": 1.0, "N2": 3.76},
+            )
+            for kind, temperature in [
+                ("constant pressure", 1000.0),
+                ("constant volume", 1200.0),
+            ]
+        ]
+        ignition_delays = []
+        for case in cases + cases[::-1]:
+            sim = IgnitionSimulation(0, case, "h2o2.yaml")
+            sim.setup_case()
+            ignition_delays.append(sim.calculate())
+        assert ignition_delays == ignition_delays[::-1]
+
+
+def loop_sample_profile(temperatures, pressures, mass_fractions):
+    """Profile sampled by scanning one point at a time, for reference."""
+    num = BaseSimulation.num_sample_points
+    delta = 1.0 / num
+    deltas = np.arange(delta, 1 + delta, delta)
+
+    temperature_initial = temperatures[0]
+    temperature_diff = temperatures[-1] - temperature_initial
+    sampled_data = np.zeros((len(deltas), 2 + mass_fractions.shape[1]))
+
+    idx = 0
+    for point in range(len(temperatures)):
+        if idx >= len(deltas):
+            break
+        if temperatures[point] >= temperature_initial + (
+            deltas[idx] * temperature_diff
+        ):
+            sampled_data[idx, 0:2] = [temperatures[point], pressures[point]]
+            sampled_data[idx, 2:] = mass_fractions[point]
+            idx += 1
+
+    return sampled_data
+
+
 class TestSampleProfile:
     """Exercises the shared profile sampler used by every simulation type."""
 
@@ -627,6 +972,237 @@ class TestSampleProfile:
                 # a threshold beyond the maximum temperature leaves the row unset
                 assert np.array_equal(data[k], np.zeros(2 + n_species))
 
+    def test_matches_point_loop(self):
+        """Test that the sampled rows match a point-by-point scan, including
+        steps that cross several thresholds at once and cooling profiles."""
+        rng = np.random.default_rng(1)
+        profiles = _synthetic_profiles() + [
+            np.array([300.0, 2300.0, 2300.0, 2299.0, 2300.0, 2300.0]),
+            np.array([300.0, 2300.0, 2000.0, 1000.0, 2250.0, 2300.0]),
+            np.linspace(2300.0, 300.0, 50),
+            np.full(10, 1000.0),
+        ]
+        for _ in range(20):
+            steps = rng.choice([0.0, 1.0, 50.0, 400.0], size=60) * rng.random(60)
+            profiles.append(1000.0 + np.cumsum(steps - 0.2 * steps.mean()))
+
+        for temperatures in profiles:
+            n = len(temperatures)
+            pressures = rng.random(n)
+            mass_fractions = rng.random((n, 3))
+            assert np.array_equal(
+                BaseSimulation._sample_profile(temperatures, pressures, mass_fractions),
+                loop_sample_profile(temperatures, pressures, mass_fractions),
+            )
+
+    def test_batch(self):
+        """Test that a 2-D batch of profiles is sampled like each profile alone."""
+        rng = np.random.default_rng(2)
+        temperatures = np.stack(
+            [profile[:104] for profile in _synthetic_profiles()]
+            + [np.linspace(2300.0, 300.0, 104)]
+        )
+        pressures = rng.random(temperatures.shape)
+        mass_fractions = rng.random(temperatures.shape + (3,))
+
+        data = BaseSimulation._sample_profile(temperatures, pressures, mass_fractions)
+        assert data.shape == (4, BaseSimulation.num_sample_points, 5)
+        for profile in range(4):
+            assert np.array_equal(
+                data[profile],
+                loop_sample_profile(
+                    temperatures[profile], pressures[profile], mass_fractions[profile]
+                ),
+            )
+
+    def test_num_points(self):
+        """Test sampling a number of points other than ``num_sample_points``."""
+        temperatures = np.linspace(300.0, 2300.0, 2001)
+        pressures = np.ones(2001)
+        mass_fractions = np.ones((2001, 2))
+
+        data = BaseSimulation._sample_profile(
+            temperatures, pressures, mass_fractions, num_points=4
+        )
+        assert np.array_equal(data[:, 0], [800.0, 1300.0, 1800.0, 2300.0])
+
+    def test_heat_release_placement(self):
+        """Test that placement by heat release puts the points where it changes."""
+        n = 1001
+        temperatures = np.linspace(1000.0, 2000.0, n)
+        pressures = np.ones(n)
+        mass_fractions = np.arange(n).reshape(-1, 1).astype(float)
+        # heat release rate rises and falls between points 600 and 700 only
+        heat_release_rates = np.zeros(n)
+        heat_release_rates[600:651] = np.linspace(0.0, 1.0, 51)
+        heat_release_rates[650:701] = np.linspace(1.0, 0.0, 51)
+
+        data = BaseSimulation._sample_profile_heat_release(
+            heat_release_rates, temperatures, pressures, mass_fractions, num_points=10
+        )
+        points = data[:, 2].astype(int)
+        assert np.all((points > 600) & (points <= 700))
+        assert np.array_equal(points, np.unique(points))
+
+        # with the variation over fewer points than samples, neighbouring points
+        # are sampled, and never past the end of the profile
+        spike = np.zeros(n)
+        spike[-2] = 1.0
+        tail = BaseSimulation._sample_profile_heat_release(
+            spike, temperatures, pressures, mass_fractions, num_points=10
+        )
+        assert np.array_equal(tail[:, 2], np.arange(n - 10, n))
+
+        # batches of profiles are sampled like each profile alone
+        batch = BaseSimulation._sample_profile_heat_release(
+            np.stack((heat_release_rates, heat_release_rates[::-1])),
+            np.stack((temperatures, temperatures)),
+            np.stack((pressures, pressures)),
+            np.stack((mass_fractions, mass_fractions)),
+            num_points=10,
+        )
+        assert np.array_equal(batch[0], data)
+        assert np.array_equal(
+            batch[1],
+            BaseSimulation._sample_profile_heat_release(
+                heat_release_rates[::-1],
+                temperatures,
+                pressures,
+                mass_fractions,
+                num_points=10,
+            ),
+        )
+
+
+def _synthetic_profiles():
+    """Temperature profiles shaped like ignition: an asymptotic rise, a rise that
+    overshoots its final temperature, and one that jumps over several thresholds
+    in a single step."""
+    time = np.linspace(0.0, 1.0, 400)
+    rise = 1000.0 + 1500.0 / (1.0 + np.exp(-40.0 * (time - 0.5)))
+    overshoot = rise + 30.0 * np.exp(-(((time - 0.7) / 0.05) ** 2))
+    jump = np.concatenate(
+        (np.full(50, 1000.0), [1100.0, 2400.0, 2410.0, 2300.0], np.full(50, 2350.0))
+    )
+    return [rise, overshoot, jump]
+
+
+def _stream(temperatures, mass_fractions, temperature_estimate, ring_size=None):
+    sampler = StreamingSampler(
+        BaseSimulation.num_sample_points,
+        mass_fractions.shape[1],
+        temperature_estimate,
+        ring_size=ring_size,
+    )
+    for temperature, row in zip(temperatures, mass_fractions):
+        sampler.record(temperature, 2.0, row)
+    return sampler.resolve()
+
+
+class TestStreamingSampler:
+    """The streaming sampler either selects exactly the states of
+    ``_sample_profile`` on the whole profile, or reports that it cannot."""
+
+    def test_exact_estimate(self):
+        """Test that an exact final temperature estimate selects the same states."""
+        for temperatures in _synthetic_profiles():
+            n = len(temperatures)
+            pressures = np.full(n, 2.0)
+            mass_fractions = np.tile(np.arange(n).reshape(-1, 1), (1, 2)).astype(float)
+            expected = BaseSimulation._sample_profile(
+                temperatures, pressures, mass_fractions
+            )
+
+            data = _stream(temperatures, mass_fractions, temperatures[-1])
+            assert np.array_equal(data, expected)
+
+    def test_inexact_estimate(self):
+        """Test that close estimates are resolved exactly and far ones are reported."""
+        for temperatures in _synthetic_profiles():
+            n = len(temperatures)
+            pressures = np.full(n, 2.0)
+            mass_fractions = np.tile(np.arange(n).reshape(-1, 1), (1, 2)).astype(float)
+            expected = BaseSimulation._sample_profile(
+                temperatures, pressures, mass_fractions
+            )
+
+            for error in [-1e-3, 1e-3, -1.0, 1.0]:
+                data = _stream(temperatures, mass_fractions, temperatures[-1] + error)
+                if abs(error) < 1.0:
+                    assert data is not None
+                if data is not None:
+                    assert np.array_equal(data, expected)
+
+            # far off, the kept states cannot determine the samples
+            assert (
+                _stream(temperatures, mass_fractions, temperatures[-1] + 300.0) is None
+            )
+            assert _stream(temperatures, mass_fractions, None) is None
+
+    def test_bounded_memory(self):
+        """Test that only ``ring_size`` states are kept for each sample."""
+        temperatures = _synthetic_profiles()[0]
+        n = len(temperatures)
+        mass_fractions = np.tile(np.arange(n).reshape(-1, 1), (1, 2)).astype(float)
+
+        sampler = StreamingSampler(20, 2, temperatures[-1], ring_size=3)
+        for temperature, row in zip(temperatures, mass_fractions):
+            sampler.record(temperature, 2.0, row)
+
+        assert len(sampler._searches) == 20
+        assert all(search.rows.shape == (3, 4) for search in sampler._searches)
+
+    def test_ignition_stream_samples(self):
+        """Test that streaming gives the same samples as keeping the time history."""
+        case = InputIgnition(
+            kind="constant pressure",
+            pressure=1.0,
+            temperature=1000.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+        sim = IgnitionSimulation(0, case, "h2o2.yaml")
+        sim.setup_case()
+        sim.run_case()
+        ignition_delay, sampled_data = sim.process_results()
+
+        sim = IgnitionSimulation(0, case, "h2o2.yaml", stream_samples=True)
+        sim.setup_case()
+        sim.run_case()
+        assert sim.profile is None
+        assert sim.sampler.resolve() is not None
+
+        results = sim.process_results()
+        assert results[0] == ignition_delay
+        assert np.array_equal(results[1], sampled_data)
+
+    def test_ignition_two_pass(self, monkeypatch):
+        """Test that a poor estimate runs the case again, keeping the time history."""
+        case = InputIgnition(
+            kind="constant pressure",
+            pressure=1.0,
+            temperature=1000.0,
+            equivalence_ratio=1.0,
+            fuel={"H2": 1.0},
+            oxidizer={"O2": 1.0, "N2": 3.76},
+        )
+        monkeypatch.setattr(
+            IgnitionSimulation, "_estimate_final_temperature", lambda self: 1500.0
+        )
+        sim = IgnitionSimulation(0, case, "h2o2.yaml", stream_samples=True)
+        sim.setup_case()
+        sim.run_case()
+        ignition_delay, sampled_data = sim.process_results()
+
+        assert sim.sampler is None
+        assert sim.stream_samples
+        expected = BaseSimulation._sample_profile(
+            sim.profile.temperature, sim.profile.pressure, sim.profile.mass_fractions
+        )
+        assert np.array_equal(sampled_data, expected)
+        assert np.allclose(ignition_delay, sim.ignition_delay)
+
 
 class TestPSRRun:
     """Exercises the perfectly stirred reactor (PSR) simulation."""